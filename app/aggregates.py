@@ -0,0 +1,276 @@
+import heapq
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.topk import SpaceSaving
+
+
+def parse_windows(spec: str) -> Dict[str, int]:
+	# "5m,1h,24h" -> {"5m": 300, "1h": 3600, "24h": 86400}
+	units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+	windows: Dict[str, int] = {}
+	for part in spec.split(","):
+		part = part.strip().lower()
+		if not part:
+			continue
+		if part[-1] in units:
+			windows[part] = int(float(part[:-1]) * units[part[-1]])
+		else:
+			windows[part] = int(part)
+	return windows
+
+
+class FlowTotals:
+	__slots__ = ("count", "by_network", "by_token", "gas_total", "gas_count")
+
+	def __init__(self) -> None:
+		self.count = 0
+		self.by_network: Dict[str, float] = {}
+		self.by_token: Dict[str, float] = {}
+		self.gas_total = 0.0
+		self.gas_count = 0
+
+	def add(self, network: Optional[str], token: Optional[str], amount: float, gas: float) -> None:
+		self.count += 1
+		if network:
+			self.by_network[network] = self.by_network.get(network, 0.0) + amount
+		if token:
+			self.by_token[token] = self.by_token.get(token, 0.0) + amount
+		if gas > 0:
+			self.gas_total += gas
+			self.gas_count += 1
+
+	def subtract(self, other: "FlowTotals") -> None:
+		self.count -= other.count
+		for mine, theirs in ((self.by_network, other.by_network), (self.by_token, other.by_token)):
+			for key, value in theirs.items():
+				remaining = mine.get(key, 0.0) - value
+				if remaining <= 1e-9:
+					mine.pop(key, None)
+				else:
+					mine[key] = remaining
+		self.gas_total -= other.gas_total
+		self.gas_count -= other.gas_count
+
+
+# One time bucket: exact totals plus bounded heavy-hitter sketches of its senders and receivers, so a
+# bucket's size doesn't grow with the number of distinct wallets
+class FlowBucket(FlowTotals):
+	__slots__ = ("sent", "recv")
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__()
+		self.sent = SpaceSaving(capacity)
+		self.recv = SpaceSaving(capacity)
+
+
+def _top_n(sketches: Iterable[SpaceSaving], n: int) -> List[Dict[str, Any]]:
+	merged: Dict[str, float] = {}
+	for sketch in sketches:
+		for wallet, total in sketch.counts.items():
+			merged[wallet] = merged.get(wallet, 0.0) + total
+	ranked = heapq.nlargest(n, merged.items(), key=lambda kv: kv[1])
+	return [{"wallet": k, "total": v} for k, v in ranked if v > 1e-9]
+
+
+# Running totals over one sliding window, kept as fixed-width time buckets. A row updates its bucket
+# and the window totals; a bucket that slides out is subtracted from the totals and dropped. Top
+# wallets are ranked from the buckets' sketches, so they are approximate once a bucket sees more than
+# ANALYTICS_BUCKET_TOP_K distinct senders or receivers.
+class SlidingWindow:
+	def __init__(self, name: str, span_sec: int, buckets: int) -> None:
+		self.name = name
+		self.span_sec = span_sec
+		self.bucket_sec = max(1, span_sec // max(1, buckets))
+		self.totals = FlowTotals()
+		self._buckets: Dict[int, FlowBucket] = {}
+		self.dirty = True
+
+	def add(self, ts: float, network: Optional[str], token: Optional[str], src: Optional[str], dst: Optional[str], amount: float, gas: float, now: float) -> None:
+		start = int(ts // self.bucket_sec) * self.bucket_sec
+		# same test as expire(), so remove() finds exactly the rows add() kept
+		if start + self.bucket_sec <= now - self.span_sec:
+			return
+		bucket = self._buckets.get(start)
+		if bucket is None:
+			bucket = self._buckets[start] = FlowBucket(settings.ANALYTICS_BUCKET_TOP_K)
+		bucket.add(network, token, amount, gas)
+		if src:
+			bucket.sent.add(src, amount)
+		if dst:
+			bucket.recv.add(dst, amount)
+		self.totals.add(network, token, amount, gas)
+		self.dirty = True
+
+	def remove(self, ts: float, network: Optional[str], token: Optional[str], src: Optional[str], dst: Optional[str], amount: float, gas: float) -> None:
+		# take back a row added earlier (orphaned by a reorg); a no-op if it already slid out
+		bucket = self._buckets.get(int(ts // self.bucket_sec) * self.bucket_sec)
+		if bucket is None:
+			return
+		row = FlowTotals()
+		row.add(network, token, amount, gas)
+		bucket.subtract(row)
+		if src:
+			bucket.sent.remove(src, amount)
+		if dst:
+			bucket.recv.remove(dst, amount)
+		self.totals.subtract(row)
+		self.dirty = True
+
+	def expire(self, now: float) -> None:
+		cutoff = now - self.span_sec
+		for start in sorted(self._buckets):
+			if start + self.bucket_sec > cutoff:
+				break
+			self.totals.subtract(self._buckets.pop(start))
+			self.dirty = True
+
+	def snapshot(self, now: float, top: int = 10) -> Dict[str, Any]:
+		t = self.totals
+		return {
+			"window": self.name,
+			"window_start": datetime.utcfromtimestamp(now - self.span_sec).isoformat() + "Z",
+			"transfer_count": t.count,
+			"total_volume_by_network": [{"network": k, "volume": v} for k, v in t.by_network.items()],
+			"total_volume_by_token": [{"token": k, "volume": v} for k, v in t.by_token.items()],
+			"top_10_sending_wallets": _top_n((bucket.sent for bucket in self._buckets.values()), top),
+			"top_10_receiving_wallets": _top_n((bucket.recv for bucket in self._buckets.values()), top),
+			"average_gas_fees": (t.gas_total / t.gas_count) if t.gas_count else None,
+		}
+
+
+# Fed by the ETL as rows are decoded and seeded from stablecoin_transfers when it comes on; the API
+# serves the snapshots rebuilt by refresh() once the seed is in. The ETL delivers each network's rows
+# in (block, log_index) order, so one high-water mark per network is enough to drop re-delivered rows;
+# rows arriving while the seed runs are held back and replayed against the marks the seed leaves.
+# Rows of the last ETL_REORG_MAX_DEPTH blocks are kept per network so a reorg can take them back out.
+class FlowAggregator:
+	def __init__(self, windows: Dict[str, int], buckets: int) -> None:
+		self.buckets = buckets
+		self.windows = {name: SlidingWindow(name, span, buckets) for name, span in windows.items()}
+		self.snapshots: Dict[str, Dict[str, Any]] = {}
+		# network -> block -> (ts, network, token, src, dst, amount, gas) per row
+		self.recent: Dict[str, Dict[int, List[Tuple[Any, ...]]]] = {}
+		# network -> highest (block_number, log_index) applied
+		self.applied: Dict[str, Tuple[int, int]] = {}
+		# live rows delivered before the seed is in
+		self.backlog: "deque[Dict[str, Any]]" = deque(maxlen=settings.ANALYTICS_SEED_MAX_ROWS)
+		# bumped by reset(), so a seed that straddled one is dropped
+		self.generation = 0
+		# set while an in-process ETL feeds this aggregator
+		self.active = False
+		# set once the windows hold the stored rows too
+		self.ready = False
+
+	def _clear(self) -> None:
+		self.windows = {name: SlidingWindow(name, window.span_sec, self.buckets) for name, window in self.windows.items()}
+		self.snapshots = {}
+		self.recent = {}
+		self.applied = {}
+
+	def reset(self) -> None:
+		# start over empty, e.g. after a stretch in which this process did not see every network
+		self._clear()
+		self.backlog.clear()
+		self.generation += 1
+		self.ready = False
+
+	def span(self) -> int:
+		return max((window.span_sec for window in self.windows.values()), default=0)
+
+	def ingest(self, rows: Iterable[Dict[str, Any]]) -> None:
+		if not self.ready:
+			self.backlog.extend(rows)
+			return
+		self._apply(rows, ordered=True)
+
+	def begin_seed(self) -> None:
+		# a retried seed starts from empty windows; the held-back live rows are kept
+		self._clear()
+
+	def seed(self, rows: Iterable[Dict[str, Any]]) -> None:
+		# stored rows are unique but arrive newest first, so they only raise the marks
+		self._apply(rows, ordered=False)
+
+	def finish_seed(self) -> None:
+		backlog = list(self.backlog)
+		self.backlog.clear()
+		self._apply(backlog, ordered=True)
+		self.ready = True
+		self.refresh()
+
+	def _apply(self, rows: Iterable[Dict[str, Any]], ordered: bool) -> None:
+		now = time.time()
+		for row in rows:
+			ts_value = row.get("block_timestamp")
+			if not ts_value:
+				continue
+			network = row.get("network")
+			block = row.get("block_number")
+			key = (int(block), int(row.get("log_index") or 0)) if network and block is not None else None
+			if key is not None:
+				mark = self.applied.get(network)
+				if ordered and mark is not None and key <= mark:
+					continue
+				if mark is None or key > mark:
+					self.applied[network] = key
+			at = datetime.fromisoformat(ts_value)
+			# PostgREST returns TIMESTAMP columns without an offset; they hold UTC
+			ts = (at if at.tzinfo else at.replace(tzinfo=timezone.utc)).timestamp()
+			entry = (
+				ts,
+				network,
+				row.get("token"),
+				row.get("from_address"),
+				row.get("to_address"),
+				float(row.get("amount") or 0),
+				float(row.get("gas_fee") or 0),
+			)
+			for window in self.windows.values():
+				window.add(*entry, now)
+			if key is not None:
+				self.recent.setdefault(network, {}).setdefault(key[0], []).append(entry)
+		for blocks in self.recent.values():
+			floor = max(blocks, default=0) - settings.ETL_REORG_MAX_DEPTH
+			for block in [block for block in blocks if block <= floor]:
+				del blocks[block]
+
+	def rollback(self, network: str, from_block: int) -> None:
+		blocks = self.recent.get(network) or {}
+		for block in [block for block in blocks if block >= from_block]:
+			for entry in blocks.pop(block):
+				for window in self.windows.values():
+					window.remove(*entry)
+		# the replacement blocks are new rows, not re-deliveries
+		mark = self.applied.get(network)
+		if mark is not None and mark[0] >= from_block:
+			self.applied[network] = (from_block, -1)
+		if self.backlog:
+			kept = [
+				row for row in self.backlog
+				if row.get("network") != network or row.get("block_number") is None or int(row["block_number"]) < from_block
+			]
+			self.backlog.clear()
+			self.backlog.extend(kept)
+
+	def refresh(self) -> None:
+		now = time.time()
+		snapshots: Dict[str, Dict[str, Any]] = {}
+		for name, window in self.windows.items():
+			window.expire(now)
+			# ranking the bucket sketches is the only non-constant step, so skip it for windows that didn't move
+			if window.dirty or name not in self.snapshots:
+				snapshots[name] = window.snapshot(now)
+				window.dirty = False
+			else:
+				snapshots[name] = {**self.snapshots[name], "window_start": datetime.utcfromtimestamp(now - window.span_sec).isoformat() + "Z"}
+		self.snapshots = snapshots
+
+	def snapshot(self, window: str) -> Optional[Dict[str, Any]]:
+		return self.snapshots.get(window)
+
+
+aggregator = FlowAggregator(parse_windows(settings.ANALYTICS_WINDOWS), settings.ANALYTICS_BUCKETS)
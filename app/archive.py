@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from web3 import Web3
+
+from app import metrics
+from app.config import settings
+from app.enrich import LRUCache
+from app.utils import network_name
+
+try:
+	import pyarrow as pa
+	import pyarrow.compute as pc
+	import pyarrow.dataset as ds
+	import pyarrow.parquet as pq
+	from pyarrow.fs import LocalFileSystem
+except ImportError:  # optional: only needed when ARCHIVE_ENABLED or for offline queries
+	pa = None
+
+def available() -> bool:
+	return pa is not None
+
+
+def _require() -> None:
+	if pa is None:
+		raise RuntimeError("pyarrow is not installed; pip install pyarrow to use the local archive")
+
+
+def file_schema() -> "pa.Schema":
+	# network/token/day come from the hive-style directory names, so they aren't stored in the files
+	return pa.schema([
+		("chain_id", pa.int64()),
+		("token_address", pa.string()),
+		("from_address", pa.string()),
+		("to_address", pa.string()),
+		("amount", pa.float64()),
+		("tx_hash", pa.string()),
+		("log_index", pa.int64()),
+		("block_number", pa.int64()),
+		("block_timestamp", pa.timestamp("us", tz="UTC")),
+		("gas_used", pa.float64()),
+		("gas_price", pa.float64()),
+		("gas_fee", pa.float64()),
+		("status", pa.string()),
+	])
+
+
+def partition_schema() -> "pa.Schema":
+	return pa.schema([("network", pa.string()), ("token", pa.string()), ("day", pa.string())])
+
+
+# Append-only Parquet archive of transfers under <root>/network=X/token=Y/day=YYYY-MM-DD/. Rows are
+# buffered per partition and each flush writes one new file per touched partition.
+class ArchiveWriter:
+	def __init__(self, root: str, max_pending: int) -> None:
+		_require()
+		self.root = root
+		self.max_pending = max(1, max_pending)
+		self._pending: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+		self._count = 0
+		self._seen = LRUCache(settings.ARCHIVE_SEEN_CACHE_SIZE)
+		self._lock = asyncio.Lock()
+		self.files_written = 0
+		self.rows_written = 0
+
+	def append(self, rows: List[Dict[str, Any]]) -> None:
+		for row in rows:
+			key = (row.get("tx_hash"), row.get("log_index"))
+			if key in self._seen:
+				continue
+			self._seen.put(key, True)
+			partition = (row["network"], row["token"], str(row["block_timestamp"])[:10])
+			self._pending.setdefault(partition, []).append(row)
+			self._count += 1
+
+	def rollback(self, network: str, from_block: int) -> None:
+		# only rows not yet written can be dropped; flushed files are immutable
+		for partition, rows in list(self._pending.items()):
+			if partition[0] != network:
+				continue
+			kept = [r for r in rows if int(r.get("block_number") or 0) < from_block]
+			for r in rows:
+				if int(r.get("block_number") or 0) >= from_block:
+					self._seen.discard((r.get("tx_hash"), r.get("log_index")))
+			self._count -= len(rows) - len(kept)
+			if kept:
+				self._pending[partition] = kept
+			else:
+				del self._pending[partition]
+
+	@property
+	def full(self) -> bool:
+		return self._count >= self.max_pending
+
+	def _write_partition(self, partition: Tuple[str, str, str], rows: List[Dict[str, Any]]) -> None:
+		network, token, day = partition
+		schema = file_schema()
+		columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+		for row in sorted(rows, key=lambda r: (r.get("block_number") or 0, r.get("log_index") or 0)):
+			for name in schema.names:
+				value = row.get(name)
+				if name == "block_timestamp" and isinstance(value, str):
+					value = datetime.fromisoformat(value)
+				columns[name].append(value)
+		table = pa.Table.from_pydict(columns, schema=schema)
+		directory = os.path.join(self.root, f"network={network}", f"token={token}", f"day={day}")
+		os.makedirs(directory, exist_ok=True)
+		name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+		# write beside the target and rename, so readers never open a half-written file
+		tmp = os.path.join(directory, "." + name + ".tmp")
+		pq.write_table(table, tmp, compression=settings.ARCHIVE_COMPRESSION)
+		os.replace(tmp, os.path.join(directory, name))
+
+	async def flush(self) -> None:
+		async with self._lock:
+			if not self._pending:
+				return
+			pending, self._pending, self._count = list(self._pending.items()), {}, 0
+			for i, (partition, rows) in enumerate(pending):
+				try:
+					# parquet encoding is CPU/disk bound; keep it off the event loop
+					await asyncio.to_thread(self._write_partition, partition, rows)
+				except Exception:
+					# requeue this and every partition not written yet
+					for requeue, requeue_rows in pending[i:]:
+						self._pending.setdefault(requeue, []).extend(requeue_rows)
+						self._count += len(requeue_rows)
+					raise
+				self.files_written += 1
+				self.rows_written += len(rows)
+
+	async def run(self) -> None:
+		while True:
+			deadline = time.monotonic() + settings.ARCHIVE_FLUSH_SEC
+			while time.monotonic() < deadline and not self.full:
+				await asyncio.sleep(1)
+			try:
+				# shielded: cancelling the loop mid-write must not drop the partitions taken for this flush
+				await asyncio.shield(self.flush())
+			except Exception as exc:
+				metrics.loop_errors.inc(loop="archive", error=type(exc).__name__)
+
+	def stats(self) -> Dict[str, int]:
+		return {"pending_rows": self._count, "files_written": self.files_written, "rows_written": self.rows_written}
+
+
+writer: Optional[ArchiveWriter] = None
+
+
+def init_archive() -> Optional[ArchiveWriter]:
+	global writer
+	if settings.ARCHIVE_ENABLED and writer is None:
+		if not available():
+			print("[archive] ARCHIVE_ENABLED is set but pyarrow is not installed; archive disabled")
+			return None
+		writer = ArchiveWriter(settings.ARCHIVE_DIR, settings.ARCHIVE_FLUSH_ROWS)
+	return writer
+
+
+async def close_archive() -> None:
+	global writer
+	if writer is not None:
+		await writer.flush()
+		writer = None
+
+
+# Query layer. Files are opened memory-mapped; filters on network/token/day prune whole directories
+# before any file is opened, and only the projected columns are decoded.
+def open_dataset(root: Optional[str] = None) -> "ds.Dataset":
+	_require()
+	return ds.dataset(
+		root or settings.ARCHIVE_DIR,
+		format="parquet",
+		partitioning=ds.partitioning(partition_schema(), flavor="hive"),
+		filesystem=LocalFileSystem(use_mmap=True),
+		exclude_invalid_files=True,
+	)
+
+
+def partition_filter(network: Optional[str], token: Optional[str], from_day: Optional[str], to_day: Optional[str]) -> Optional["ds.Expression"]:
+	# partitions are named after the NETWORKS keys ("network=Ethereum"); accept any casing
+	network = network_name(network) if network else None
+	token = token.upper() if token else None
+	expr = None
+	for clause in (
+		(ds.field("network") == network) if network else None,
+		(ds.field("token") == token) if token else None,
+		(ds.field("day") >= from_day) if from_day else None,
+		(ds.field("day") <= to_day) if to_day else None,
+	):
+		if clause is not None:
+			expr = clause if expr is None else expr & clause
+	return expr
+
+
+def load(columns: List[str], filter: Optional["ds.Expression"], root: Optional[str] = None) -> "pa.Table":
+	# Files are append-only, so a transfer can be archived more than once: replays after a restart,
+	# a backfill overlapping the live ETL, a reorged transaction re-mined in another block. Keep one
+	# copy per (tx_hash, log_index), the one from the newest file (names start with the write time).
+	dataset = open_dataset(root)
+	keep = list(dict.fromkeys(columns + ["tx_hash", "log_index"]))
+	fragments = sorted(dataset.get_fragments(filter=filter), key=lambda fragment: os.path.basename(fragment.path))
+	tables = [fragment.to_table(schema=dataset.schema, columns=keep, filter=filter) for fragment in fragments]
+	if not tables:
+		return dataset.schema.empty_table().select(columns)
+	table = pa.concat_tables(tables)
+	table = table.append_column("_order", pa.array(range(len(table)), type=pa.int64()))
+	newest = table.group_by(["tx_hash", "log_index"]).aggregate([("_order", "max")])["_order_max"]
+	return table.take(newest.take(pc.sort_indices(newest))).select(columns)
+
+
+def volume_by_day(
+	network: Optional[str] = None,
+	token: Optional[str] = None,
+	from_day: Optional[str] = None,
+	to_day: Optional[str] = None,
+	root: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+	table = load(["network", "token", "day", "amount"], partition_filter(network, token, from_day, to_day), root)
+	result = table.group_by(["network", "token", "day"]).aggregate([("amount", "sum"), ("amount", "count")])
+	result = result.sort_by([("day", "ascending"), ("network", "ascending"), ("token", "ascending")])
+	return [
+		{"day": r["day"], "network": r["network"], "token": r["token"], "volume": r["amount_sum"], "transfer_count": r["amount_count"]}
+		for r in result.to_pylist()
+	]
+
+
+def _wallet_filter(address: str, network: Optional[str], token: Optional[str], from_day: Optional[str], to_day: Optional[str]) -> "ds.Expression":
+	# rows carry checksummed addresses
+	address = Web3.to_checksum_address(address)
+	expr = (ds.field("from_address") == address) | (ds.field("to_address") == address)
+	partitions = partition_filter(network, token, from_day, to_day)
+	return expr if partitions is None else partitions & expr
+
+
+def wallet_flows(
+	address: str,
+	network: Optional[str] = None,
+	token: Optional[str] = None,
+	from_day: Optional[str] = None,
+	to_day: Optional[str] = None,
+	root: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+	# per-day sent/received totals for one wallet
+	table = load(["network", "token", "day", "from_address", "amount"], _wallet_filter(address, network, token, from_day, to_day), root)
+	address = Web3.to_checksum_address(address)
+	sent_mask = pc.equal(table["from_address"], address)
+	table = table.append_column("sent", pc.if_else(sent_mask, table["amount"], 0.0))
+	table = table.append_column("received", pc.if_else(sent_mask, 0.0, table["amount"]))
+	result = table.group_by(["network", "token", "day"]).aggregate([("sent", "sum"), ("received", "sum"), ("amount", "count")])
+	result = result.sort_by([("day", "ascending"), ("network", "ascending"), ("token", "ascending")])
+	return [
+		{
+			"day": r["day"],
+			"network": r["network"],
+			"token": r["token"],
+			"sent": r["sent_sum"],
+			"received": r["received_sum"],
+			"transfer_count": r["amount_count"],
+		}
+		for r in result.to_pylist()
+	]
+
+
+def wallet_transfers(
+	address: str,
+	network: Optional[str] = None,
+	token: Optional[str] = None,
+	from_day: Optional[str] = None,
+	to_day: Optional[str] = None,
+	limit: int = 1000,
+	root: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+	table = load(
+		["network", "token", "from_address", "to_address", "amount", "tx_hash", "log_index", "block_number", "block_timestamp"],
+		_wallet_filter(address, network, token, from_day, to_day),
+		root,
+	)
+	table = table.sort_by([("block_timestamp", "descending"), ("log_index", "descending")]).slice(0, limit)
+	rows = table.to_pylist()
+	for r in rows:
+		r["block_timestamp"] = r["block_timestamp"].isoformat()
+	return rows
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Query the local Parquet transfer archive")
+	parser.add_argument("query", choices=("volume", "wallet-flows", "wallet-transfers"))
+	parser.add_argument("--address", default=None)
+	parser.add_argument("--network", default=None)
+	parser.add_argument("--token", default=None)
+	parser.add_argument("--from-day", default=None, help="YYYY-MM-DD, inclusive")
+	parser.add_argument("--to-day", default=None, help="YYYY-MM-DD, inclusive")
+	parser.add_argument("--limit", type=int, default=1000)
+	parser.add_argument("--root", default=None, help=f"archive directory (default: ARCHIVE_DIR={settings.ARCHIVE_DIR})")
+	args = parser.parse_args()
+
+	if args.query != "volume" and not args.address:
+		parser.error("--address is required for wallet queries")
+	if args.query == "volume":
+		rows = volume_by_day(args.network, args.token, args.from_day, args.to_day, args.root)
+	elif args.query == "wallet-flows":
+		rows = wallet_flows(args.address, args.network, args.token, args.from_day, args.to_day, args.root)
+	else:
+		rows = wallet_transfers(args.address, args.network, args.token, args.from_day, args.to_day, args.limit, args.root)
+	for row in rows:
+		print(orjson.dumps(row).decode())
+
+
+if __name__ == "__main__":
+	main()
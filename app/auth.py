@@ -1,21 +1,114 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app import supabase_client
+from app import metrics, supabase_client
+from app.config import settings
 
 security = HTTPBearer(auto_error=True)
 
 
-def require_api_key(creds: HTTPAuthorizationCredentials = Depends(security)) -> str:
-	if creds is None or not creds.scheme.lower() == "bearer":
-		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid auth header")
-	api_key = creds.credentials.strip()
-	if not supabase_client.client:
-		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Auth not initialized")
-	rows = supabase_client.client.select("api_keys", {"api_key": f"eq.{api_key}", "limit": 1})
-	if not rows:
-		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+# Validated keys and misses with a TTL, each in its own LRU so a spray of unknown keys can only evict
+# other unknown keys, never the valid ones.
+class KeyCache:
+	def __init__(self, max_keys: int, ttl_sec: float, negative_ttl_sec: float, negative_max_keys: int) -> None:
+		self.max_keys = max(1, max_keys)
+		self.negative_max_keys = max(1, negative_max_keys)
+		self.ttl_sec = ttl_sec
+		self.negative_ttl_sec = negative_ttl_sec
+		self._valid: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+		self._unknown: "OrderedDict[str, float]" = OrderedDict()
+
+	def get(self, api_key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+		# (hit, row); row is None for a cached miss
+		now = time.monotonic()
+		entry = self._valid.get(api_key)
+		if entry is not None:
+			expires_at, row = entry
+			if expires_at < now:
+				del self._valid[api_key]
+				return False, None
+			self._valid.move_to_end(api_key)
+			return True, row
+		expires_at = self._unknown.get(api_key)
+		if expires_at is None:
+			return False, None
+		if expires_at < now:
+			del self._unknown[api_key]
+			return False, None
+		self._unknown.move_to_end(api_key)
+		return True, None
+
+	def put(self, api_key: str, row: Optional[Dict[str, Any]]) -> None:
+		now = time.monotonic()
+		if row is None:
+			self._valid.pop(api_key, None)
+			self._unknown[api_key] = now + self.negative_ttl_sec
+			self._unknown.move_to_end(api_key)
+			while len(self._unknown) > self.negative_max_keys:
+				self._unknown.popitem(last=False)
+			return
+		self._unknown.pop(api_key, None)
+		self._valid[api_key] = (now + self.ttl_sec, row)
+		self._valid.move_to_end(api_key)
+		while len(self._valid) > self.max_keys:
+			self._valid.popitem(last=False)
+
+
+key_cache = KeyCache(
+	settings.AUTH_CACHE_MAX_KEYS,
+	settings.AUTH_CACHE_TTL_SEC,
+	settings.AUTH_NEGATIVE_TTL_SEC,
+	settings.AUTH_NEGATIVE_MAX_KEYS,
+)
+# api_keys.id -> requests not yet written to usage_count
+_usage: Dict[Any, int] = {}
+
+
+async def flush_usage() -> None:
+	global _usage
+	if not _usage or not supabase_client.client:
+		return
+	pending, _usage = _usage, {}
 	try:
-		supabase_client.client.upsert("api_keys", [{"id": rows[0].get("id"), "usage_count": (rows[0].get("usage_count") or 0) + 1}], on_conflict="id")
-	except Exception:
-		pass
+		# incremented in the database: a read-then-write would lose other processes' requests
+		await supabase_client.client.rpc(
+			"increment_api_key_usage",
+			{"p_counts": {str(key_id): count for key_id, count in pending.items()}},
+			idempotent=False,
+		)
+	except Exception as exc:
+		metrics.loop_errors.inc(loop="usage_flush", error=type(exc).__name__)
+		# keep the counts for the next flush
+		for key_id, count in pending.items():
+			_usage[key_id] = _usage.get(key_id, 0) + count
+
+
+async def run_usage_flusher() -> None:
+	while True:
+		await asyncio.sleep(settings.AUTH_USAGE_FLUSH_SEC)
+		await flush_usage()
+
+
+async def check_api_key(api_key: str) -> str:
+	hit, row = key_cache.get(api_key)
+	if not hit:
+		if not supabase_client.client:
+			raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Auth not initialized")
+		rows = await supabase_client.client.select("api_keys", {"select": "id", "api_key": f"eq.{api_key}", "limit": 1})
+		row = rows[0] if rows else None
+		key_cache.put(api_key, row)
+	if row is None:
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+	key_id = row.get("id")
+	_usage[key_id] = _usage.get(key_id, 0) + 1
 	return api_key
+
+
+async def require_api_key(creds: HTTPAuthorizationCredentials = Depends(security)) -> str:
+	if creds is None or not creds.scheme.lower() == "bearer":
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid auth header")
+	return await check_api_key(creds.credentials.strip())
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import archive, rollups, sinks, supabase_client
+from app.config import settings
+from app.db import close_db_pool
+from app.enrich import Enricher
+from app.etl import build_rpc_clients, ingest_range
+from app.models import STABLECOINS
+from app.rpc import RpcClient, is_range_error
+from app.supabase_client import close_supabase_client, init_supabase_client
+
+def job_id(network: str, tokens: Set[str], from_block: int, to_block: int) -> str:
+	# deterministic so re-running the same command resumes the same job
+	return f"{network}:{','.join(sorted(tokens))}:{from_block}-{to_block}"
+
+
+def split_shards(from_block: int, to_block: int, shard_blocks: int) -> List[Tuple[int, int]]:
+	shard_blocks = max(1, shard_blocks)
+	return [(start, min(to_block, start + shard_blocks - 1)) for start in range(from_block, to_block + 1, shard_blocks)]
+
+
+class Progress:
+	def __init__(self, total_blocks: int) -> None:
+		self.total_blocks = total_blocks
+		self.blocks = 0
+		self.rows = 0
+		self.splits = 0
+		self.started = time.monotonic()
+
+	def add(self, blocks: int, rows: int) -> None:
+		self.blocks += blocks
+		self.rows += rows
+
+	@property
+	def blocks_per_sec(self) -> float:
+		elapsed = time.monotonic() - self.started
+		return self.blocks / elapsed if elapsed > 0 else 0.0
+
+	def report(self) -> str:
+		pct = 100.0 * self.blocks / self.total_blocks if self.total_blocks else 100.0
+		return (
+			f"{self.blocks}/{self.total_blocks} blocks ({pct:.1f}%), {self.rows} transfers, "
+			f"{self.blocks_per_sec:.1f} blocks/sec, {self.splits} range splits"
+		)
+
+
+class Backfill:
+	def __init__(
+		self,
+		network: str,
+		rpc: RpcClient,
+		tokens: Set[str],
+		from_block: int,
+		to_block: int,
+		shard_blocks: Optional[int] = None,
+		step_blocks: Optional[int] = None,
+		concurrency: Optional[int] = None,
+	) -> None:
+		self.network = network
+		self.rpc = rpc
+		self.tokens = tokens
+		self.from_block = from_block
+		self.to_block = to_block
+		self.shard_blocks = shard_blocks or settings.BACKFILL_SHARD_BLOCKS
+		self.step_blocks = max(1, step_blocks or settings.BACKFILL_STEP_BLOCKS)
+		self.concurrency = max(1, concurrency or settings.BACKFILL_CONCURRENCY)
+		self.job_id = job_id(network, tokens, from_block, to_block)
+		self.enricher = Enricher({network: rpc})
+		self.progress = Progress(to_block - from_block + 1)
+
+	async def load_progress(self) -> Dict[int, int]:
+		rows = await supabase_client.client.select("etl_backfill_shards", {"job_id": f"eq.{self.job_id}", "limit": 100_000})
+		return {int(r["shard_start"]): int(r["next_block"]) for r in rows}
+
+	async def save_progress(self, shard_start: int, shard_end: int, next_block: int) -> None:
+		await supabase_client.client.upsert("etl_backfill_shards", [{
+			"job_id": self.job_id,
+			"shard_start": shard_start,
+			"shard_end": shard_end,
+			"next_block": next_block,
+		}], on_conflict="job_id,shard_start")
+
+	async def ingest_adaptive(self, start: int, end: int) -> int:
+		try:
+			return await ingest_range(self.network, self.rpc, self.enricher, start, end, self.tokens)
+		except Exception as exc:
+			if start >= end or not is_range_error(exc):
+				raise
+		# range too wide for the provider: halve it and retry both sides
+		self.progress.splits += 1
+		mid = (start + end) // 2
+		return await self.ingest_adaptive(start, mid) + await self.ingest_adaptive(mid + 1, end)
+
+	async def run_shard(self, shard_start: int, shard_end: int, next_block: int, limit: asyncio.Semaphore) -> None:
+		async with limit:
+			step = self.step_blocks
+			while next_block <= shard_end:
+				end = min(shard_end, next_block + step - 1)
+				splits = self.progress.splits
+				rows = await self.ingest_adaptive(next_block, end)
+				# shrink the step after a split and grow it back while the provider keeps up
+				step = max(1, step // 2) if self.progress.splits > splits else min(self.step_blocks, step * 2)
+				self.progress.add(end - next_block + 1, rows)
+				next_block = end + 1
+				await sinks.buffer.barrier()
+				await self.save_progress(shard_start, shard_end, next_block)
+
+	async def run(self, report_every: float = 10.0) -> Progress:
+		done = await self.load_progress()
+		limit = asyncio.Semaphore(self.concurrency)
+		tasks = []
+		for shard_start, shard_end in split_shards(self.from_block, self.to_block, self.shard_blocks):
+			next_block = done.get(shard_start, shard_start)
+			self.progress.total_blocks -= next_block - shard_start
+			tasks.append(asyncio.create_task(self.run_shard(shard_start, shard_end, next_block, limit)))
+		reporter = asyncio.create_task(self._report(report_every))
+		try:
+			await asyncio.gather(*tasks)
+		finally:
+			reporter.cancel()
+		await rollups.flush()
+		print(f"[backfill {self.job_id}] done: {self.progress.report()}")
+		return self.progress
+
+	async def _report(self, every: float) -> None:
+		while True:
+			await asyncio.sleep(every)
+			print(f"[backfill {self.job_id}] {self.progress.report()}")
+			try:
+				await rollups.flush()
+			except Exception as exc:
+				print(f"[backfill {self.job_id}] rollup refresh failed, retrying: {exc!r}")
+
+
+async def run_backfill(
+	network: str,
+	tokens: Optional[Set[str]],
+	from_block: int,
+	to_block: int,
+	shard_blocks: Optional[int] = None,
+	concurrency: Optional[int] = None,
+) -> Progress:
+	await sinks.init_sink()
+	archive.init_archive()
+	clients = build_rpc_clients()
+	if network not in clients:
+		raise RuntimeError(f"No RPC endpoint configured for {network}")
+	available = {token for token, per_network in STABLECOINS.items() if network in per_network}
+	tokens = available if not tokens else tokens & available
+	if not tokens:
+		raise RuntimeError(f"No configured stablecoins on {network}")
+	job = Backfill(network, clients[network], tokens, from_block, to_block, shard_blocks=shard_blocks, concurrency=concurrency)
+	# the archive flushes on its own limits here too, instead of holding the whole backfill in memory
+	flusher = asyncio.create_task(archive.writer.run()) if archive.writer else None
+	try:
+		return await job.run()
+	finally:
+		if flusher is not None:
+			flusher.cancel()
+		for rpc in clients.values():
+			await rpc.aclose()
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Backfill stablecoin_transfers for a historical block range")
+	parser.add_argument("--network", required=True)
+	parser.add_argument("--tokens", default="", help="comma-separated token symbols (default: all on the network)")
+	parser.add_argument("--from-block", type=int, required=True)
+	parser.add_argument("--to-block", type=int, required=True)
+	parser.add_argument("--shard-blocks", type=int, default=None)
+	parser.add_argument("--concurrency", type=int, default=None)
+	args = parser.parse_args()
+
+	tokens = {t.strip().upper() for t in args.tokens.split(",") if t.strip()} or None
+
+	async def run() -> None:
+		init_supabase_client()
+		try:
+			await run_backfill(args.network, tokens, args.from_block, args.to_block, args.shard_blocks, args.concurrency)
+		finally:
+			await sinks.close_sink()
+			await archive.close_archive()
+			await close_supabase_client()
+			await close_db_pool()
+
+	asyncio.run(run())
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app import metrics, supabase_client
+from app.config import settings
+
+# wallet_balances holds one point per balance change; wallet_balances_latest holds exactly one row per
+# (wallet, network, token) for current lookups; wallet_balance_history holds hourly and daily points
+# compacted from old change points (close = last value in the bucket, plus min and max).
+HISTORY_COLUMNS = ("wallet_address", "network", "token", "token_address", "balance")
+LATEST_CONFLICT = "wallet_address,network,token"
+COMPACTED_CONFLICT = "wallet_address,network,token,resolution,bucket"
+PAGE_SIZE = 1000
+
+
+def _utc(value: Any) -> datetime:
+	# PostgREST returns TIMESTAMP columns without an offset; they hold UTC
+	ts = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+	if ts.tzinfo is not None:
+		ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+	return ts
+
+
+def truncate(ts: datetime, resolution: str) -> datetime:
+	if resolution == "day":
+		return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+	return ts.replace(minute=0, second=0, microsecond=0)
+
+
+async def write_balances(rows: List[Dict[str, Any]]) -> None:
+	# rows carry balance_raw (integer units) next to the scaled balance; only the latest table keeps it,
+	# as text, so change detection after a restart is exact
+	if not rows:
+		return
+	now = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+	# latest first: it is idempotent, so a failed history insert can simply be retried with it
+	await supabase_client.client.upsert("wallet_balances_latest", [
+		{**{column: row[column] for column in HISTORY_COLUMNS}, "balance_raw": str(row["balance_raw"]), "fetched_at": now}
+		for row in rows
+	], on_conflict=LATEST_CONFLICT)
+	await supabase_client.client.insert("wallet_balances", [{column: row[column] for column in HISTORY_COLUMNS} for row in rows])
+
+
+async def load_latest(network: str) -> Dict[Tuple[str, str], int]:
+	# last written raw balance per (token, lowercased 40-hex wallet), to resume change-only writes
+	out: Dict[Tuple[str, str], int] = {}
+	offset = 0
+	while True:
+		rows = await supabase_client.client.select("wallet_balances_latest", {
+			"select": "wallet_address,token,balance_raw",
+			"network": f"eq.{network}",
+			"order": "wallet_address.asc,token.asc",
+			"limit": PAGE_SIZE,
+			"offset": offset,
+		})
+		for row in rows:
+			if row.get("balance_raw") is not None:
+				out[(row["token"], row["wallet_address"].lower()[-40:])] = int(row["balance_raw"])
+		if len(rows) < PAGE_SIZE:
+			return out
+		offset += PAGE_SIZE
+
+
+def _fold(points: Dict[Tuple[str, str, str, str], Dict[str, Any]], key: Tuple[str, str, str, str], row: Dict[str, Any], resolution: str) -> None:
+	# min/max/last-by-time merges are idempotent, so folding the same source row twice is harmless
+	low = float(row.get("balance_min", row["balance"]))
+	high = float(row.get("balance_max", row["balance"]))
+	at = _utc(row.get("last_at") or row["fetched_at"])
+	point = points.get(key)
+	if point is None:
+		points[key] = {
+			"wallet_address": key[0],
+			"network": key[1],
+			"token": key[2],
+			"token_address": row["token_address"],
+			"resolution": resolution,
+			"bucket": key[3],
+			"balance": float(row["balance"]),
+			"balance_min": low,
+			"balance_max": high,
+			"last_at": at,
+		}
+		return
+	point["balance_min"] = min(point["balance_min"], low)
+	point["balance_max"] = max(point["balance_max"], high)
+	if at >= point["last_at"]:
+		point["balance"] = float(row["balance"])
+		point["last_at"] = at
+
+
+async def load_compacted(resolution: str, keys: Set[Tuple[str, str, str, str]]) -> List[Dict[str, Any]]:
+	# stored buckets for (wallet, network, token, bucket) keys, one paged query per network and token;
+	# timestamps contain reserved characters, so in.() values are quoted
+	groups: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+	for wallet, network, token, bucket in keys:
+		groups.setdefault((network, token), set()).add((wallet, bucket))
+	out: List[Dict[str, Any]] = []
+	for (network, token), pairs in groups.items():
+		wallets = ",".join(sorted({wallet for wallet, _ in pairs}))
+		buckets = ",".join(sorted({'"%s"' % bucket for _, bucket in pairs}))
+		offset = 0
+		while True:
+			rows = await supabase_client.client.select("wallet_balance_history", {
+				"resolution": f"eq.{resolution}",
+				"network": f"eq.{network}",
+				"token": f"eq.{token}",
+				"wallet_address": f"in.({wallets})",
+				"bucket": f"in.({buckets})",
+				"order": "id.asc",
+				"limit": PAGE_SIZE,
+				"offset": offset,
+			})
+			out.extend(rows)
+			if len(rows) < PAGE_SIZE:
+				break
+			offset += PAGE_SIZE
+	return out
+
+
+async def compact(source: str, source_filter: Dict[str, str], time_column: str, resolution: str, cutoff: datetime) -> int:
+	# folds source rows older than cutoff into resolution buckets of wallet_balance_history, then deletes
+	# them by id. If the delete fails, the same rows are folded again on the next run to the same result.
+	client = supabase_client.client
+	compacted = 0
+	while True:
+		rows = await client.select(source, {
+			**source_filter,
+			time_column: f"lt.{cutoff.isoformat()}",
+			"order": f"{time_column}.asc",
+			"limit": settings.BALANCE_COMPACT_BATCH,
+		})
+		if not rows:
+			return compacted
+		keyed = [
+			((row["wallet_address"], row["network"], row["token"], truncate(_utc(row[time_column]), resolution).isoformat()), row)
+			for row in rows
+		]
+		wanted = {key for key, _ in keyed}
+		points: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+		# merge into points already compacted for these buckets by an earlier batch or run, or the upsert
+		# would overwrite their balance/min/max with this batch's partial fold
+		for row in await load_compacted(resolution, wanted):
+			key = (row["wallet_address"], row["network"], row["token"], _utc(row["bucket"]).isoformat())
+			if key in wanted:
+				_fold(points, key, row, resolution)
+		for key, row in keyed:
+			_fold(points, key, row, resolution)
+		await client.upsert(
+			"wallet_balance_history",
+			[{**point, "last_at": point["last_at"].isoformat()} for point in points.values()],
+			on_conflict=COMPACTED_CONFLICT,
+		)
+		await client.delete(source, {"id": f"in.({','.join(str(row['id']) for row in rows)})"})
+		compacted += len(rows)
+		metrics.balance_points_compacted.inc(len(rows), resolution=resolution)
+		if len(rows) < settings.BALANCE_COMPACT_BATCH:
+			return compacted
+
+
+async def compact_history(now: Optional[datetime] = None) -> Tuple[int, int]:
+	# change points -> hourly after BALANCE_RAW_RETENTION_HOURS, hourly -> daily after
+	# BALANCE_HOURLY_RETENTION_DAYS; cutoffs sit on bucket boundaries so each run closes whole buckets
+	now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+	hourly = await compact(
+		"wallet_balances", {}, "fetched_at", "hour",
+		truncate(now - timedelta(hours=settings.BALANCE_RAW_RETENTION_HOURS), "hour"),
+	)
+	daily = await compact(
+		"wallet_balance_history", {"resolution": "eq.hour"}, "bucket", "day",
+		truncate(now - timedelta(days=settings.BALANCE_HOURLY_RETENTION_DAYS), "day"),
+	)
+	return hourly, daily
+
+
+async def history(wallet_address: str, since: datetime, network: Optional[str], token: Optional[str], limit: int) -> List[Dict[str, Any]]:
+	# one series across all three tiers (daily, hourly, raw change points): the newest `limit` points,
+	# returned oldest first
+	filters: Dict[str, Any] = {"wallet_address": f"eq.{wallet_address}"}
+	if network:
+		filters["network"] = f"eq.{network}"
+	if token:
+		filters["token"] = f"eq.{token}"
+	client = supabase_client.client
+	points: List[Dict[str, Any]] = []
+	for resolution in ("day", "hour"):
+		rows = await client.select("wallet_balance_history", {
+			**filters,
+			"select": "network,token,token_address,balance,balance_min,balance_max,bucket",
+			"resolution": f"eq.{resolution}",
+			"bucket": f"gte.{truncate(since, resolution).isoformat()}",
+			"order": "bucket.desc",
+			"limit": limit,
+		})
+		for row in rows:
+			row["at"] = row.pop("bucket")
+			row["resolution"] = resolution
+		points.extend(rows)
+	rows = await client.select("wallet_balances", {
+		**filters,
+		"select": "network,token,token_address,balance,fetched_at",
+		"fetched_at": f"gte.{since.isoformat()}",
+		"order": "fetched_at.desc",
+		"limit": limit,
+	})
+	for row in rows:
+		row["at"] = row.pop("fetched_at")
+		row["resolution"] = "raw"
+	points.extend(rows)
+	points.sort(key=lambda point: _utc(point["at"]))
+	return points[-limit:]
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Sequence, Tuple
+
+from app.config import settings
+
+
+# set on an in-flight future when its leader is cancelled, so the followers fetch for themselves
+# instead of inheriting a cancellation nobody asked them for
+class _LeaderCancelled(Exception):
+	pass
+
+
+# Short-TTL response cache with single-flight: concurrent misses for the same key share one backend
+# fetch. Entries remember the write generation of the tables they read, so an ETL flush into one of
+# those tables invalidates them before the TTL runs out.
+class ResponseCache:
+	def __init__(self, ttl_sec: float, max_entries: int) -> None:
+		self.ttl_sec = ttl_sec
+		self.max_entries = max(1, max_entries)
+		self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], Any]]" = OrderedDict()
+		self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+		self._generations: Dict[str, int] = {}
+		self.hits = 0
+		self.misses = 0
+		self.coalesced = 0
+
+	def _generation(self, tables: Sequence[str]) -> Tuple[int, ...]:
+		return tuple(self._generations.get(t, 0) for t in tables)
+
+	def invalidate(self, table: str) -> None:
+		self._generations[table] = self._generations.get(table, 0) + 1
+
+	async def get_or_fetch(self, key: Hashable, tables: Sequence[str], fetch: Callable[[], Awaitable[Any]]) -> Any:
+		entry = self._entries.get(key)
+		if entry is not None:
+			expires_at, generation, value = entry
+			if expires_at > time.monotonic() and generation == self._generation(tables):
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return value
+			del self._entries[key]
+
+		pending = self._inflight.get(key)
+		while pending is not None:
+			self.coalesced += 1
+			try:
+				return await asyncio.shield(pending)
+			except _LeaderCancelled:
+				# the leader's entry is gone; the first follower back becomes the new leader
+				pending = self._inflight.get(key)
+
+		self.misses += 1
+		future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+		self._inflight[key] = future
+		generation = self._generation(tables)
+		try:
+			value = await fetch()
+		except asyncio.CancelledError:
+			self._inflight.pop(key, None)
+			future.set_exception(_LeaderCancelled())
+			future.exception()
+			raise
+		except Exception as exc:
+			future.set_exception(exc)
+			# mark retrieved so an error nobody else awaited isn't logged as unhandled
+			future.exception()
+			raise
+		finally:
+			self._inflight.pop(key, None)
+		future.set_result(value)
+		self._entries[key] = (time.monotonic() + self.ttl_sec, generation, value)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+		return value
+
+
+response_cache = ResponseCache(settings.LIVE_CACHE_TTL_SEC, settings.LIVE_CACHE_MAX_ENTRIES)
@@ -7,11 +7,19 @@ class Settings(BaseSettings):
 	# Database
 	SUPABASE_DB_URL: Optional[str] = Field(default=None, description="Postgres connection URL (Supabase)")
 	DATABASE_URL: Optional[str] = Field(default=None, description="Generic Postgres connection URL")
+	DB_POOL_SIZE: int = 10
 	SUPABASE_URL: Optional[str] = None
 	SUPABASE_ANON_KEY: Optional[str] = None
 	SUPABASE_SERVICE_ROLE_KEY: Optional[str] = None
+	SUPABASE_POOL_SIZE: int = 20
+	SUPABASE_HTTP2: bool = True
+	SUPABASE_TIMEOUT_SEC: float = 30
+	SUPABASE_MAX_RETRIES: int = 3
+	SUPABASE_RETRY_BACKOFF_SEC: float = 0.2
+	# PostgREST's db-max-rows: a select never returns more rows than this, whatever its limit
+	SUPABASE_MAX_ROWS: int = 1000
 
-	# RPC endpoints
+	# RPC endpoints; each accepts a comma-separated list of providers
 	RPC_ETHEREUM: Optional[str] = None
 	RPC_POLYGON: Optional[str] = None
 	RPC_BSC: Optional[str] = None
@@ -23,6 +31,114 @@ class Settings(BaseSettings):
 	BALANCE_POLL_SEC: int = 120
 	TOP_WALLETS_REFRESH_SEC: int = 1
 
+	# Tracked-wallet balances: "ledger" seeds once from balanceOf and applies the ingested Transfer deltas,
+	# re-checking over RPC every BALANCE_RECONCILE_SEC; "poll" re-reads every balance every BALANCE_POLL_SEC
+	BALANCE_MODE: str = "ledger"
+	BALANCE_RECONCILE_SEC: float = 900
+	BALANCE_FLUSH_SEC: float = 1
+
+	# wallet_balances keeps change points only; older points are compacted into wallet_balance_history
+	# (hourly after BALANCE_RAW_RETENTION_HOURS, daily after BALANCE_HOURLY_RETENTION_DAYS)
+	BALANCE_COMPACT_SEC: float = 3600
+	BALANCE_COMPACT_BATCH: int = 1000
+	BALANCE_RAW_RETENTION_HOURS: int = 48
+	BALANCE_HOURLY_RETENTION_DAYS: int = 30
+
+	# Streaming top-K wallets per (network, token) behind whale_top_wallets
+	TOP_WALLETS_K: int = 50
+	TOP_WALLETS_CAPACITY: int = 1000
+	TOP_WALLETS_SEEN_CACHE_SIZE: int = 200_000
+	TOP_WALLETS_WHALES_ONLY: bool = False
+
+	# ETL concurrency / RPC transport
+	ETL_MAX_CONCURRENCY: int = 3
+	ETL_RPC_MAX_CONNECTIONS: int = 10
+	ETL_RPC_TIMEOUT_SEC: float = 30
+	ETL_RPC_KEEPALIVE_SEC: float = 30
+
+	# RPC provider pool: calls go to the fastest healthy endpoint (EWMA latency and error rate);
+	# slow reads are hedged to a second endpoint and a 429 halves that endpoint's concurrency
+	ETL_RPC_EWMA_ALPHA: float = 0.2
+	ETL_RPC_COOLDOWN_SEC: float = 5
+	ETL_RPC_HEDGE_ENABLED: bool = True
+	ETL_RPC_HEDGE_FACTOR: float = 3.0
+	ETL_RPC_HEDGE_MIN_SEC: float = 0.25
+
+	# ETL write backend: "rest" (PostgREST upserts) or "copy" (binary COPY over the asyncpg pool)
+	ETL_WRITE_BACKEND: str = "rest"
+
+	# Write-behind buffer in front of the write backend
+	ETL_FLUSH_MAX_ROWS: int = 1000
+	ETL_FLUSH_MAX_AGE_SEC: float = 0.5
+	ETL_BUFFER_MAX_PENDING: int = 20_000
+
+	# ETL block cursor (checkpointed ingestion); disable to re-scan a fixed window every tick
+	ETL_CURSOR_ENABLED: bool = True
+	ETL_MAX_BLOCKS_PER_TICK: int = 2000
+	ETL_REORG_MAX_DEPTH: int = 64
+
+	# ETL placement: the API runs the ETL in-process unless ETL_RUN_IN_API=false, in which case run
+	# `python -m app.worker`. NETWORKS are split round-robin into ETL_WORKER_SHARDS shards; each process
+	# only ingests a network while it holds that network's lease in etl_leases
+	ETL_RUN_IN_API: bool = True
+	ETL_WORKER_SHARD: int = 0
+	ETL_WORKER_SHARDS: int = 1
+	ETL_WORKER_PROCESSES: int = 1
+	ETL_WORKER_METRICS_PORT: Optional[int] = None
+	ETL_LEASE_TTL_SEC: float = 30
+	ETL_LEASE_RENEW_SEC: float = 10
+
+	# Balance polling via Multicall3 (same deployment address on every supported chain)
+	MULTICALL3_ADDRESS: str = "0xcA11bde05977b3631167028862bE2a173976CA11"
+	MULTICALL_CHUNK_SIZE: int = 500
+
+	# Historical backfill
+	BACKFILL_SHARD_BLOCKS: int = 50_000
+	BACKFILL_STEP_BLOCKS: int = 2_000
+	BACKFILL_CONCURRENCY: int = 4
+
+	# ETL enrichment (receipts / block headers)
+	ETL_RPC_BATCH_SIZE: int = 100
+	ETL_USE_BLOCK_RECEIPTS: bool = True
+	ETL_BLOCK_CACHE_SIZE: int = 10_000
+	# checksummed wallet addresses kept by the Transfer decoder
+	ETL_ADDRESS_CACHE_SIZE: int = 100_000
+	ETL_RECEIPT_CACHE_SIZE: int = 50_000
+
+	# In-process flow aggregates behind /v1/analytics/global-flows
+	ANALYTICS_WINDOWS: str = "5m,1h,24h"
+	ANALYTICS_BUCKETS: int = 60
+	ANALYTICS_REFRESH_SEC: float = 1
+	# senders and receivers kept per bucket (Space-Saving); the window's top 10 are ranked from these
+	ANALYTICS_BUCKET_TOP_K: int = 100
+	# rows read from stablecoin_transfers to fill the windows when the in-process views come on
+	ANALYTICS_SEED_MAX_ROWS: int = 500000
+
+	# Minute/hour/day rollups in transfer_rollups behind /v1/analytics/timeseries; dirty time ranges are
+	# recomputed every ROLLUP_REFRESH_SEC and minute buckets are dropped after ROLLUP_MINUTE_RETENTION_DAYS
+	ROLLUP_REFRESH_SEC: float = 5
+	ROLLUP_MINUTE_RETENTION_DAYS: int = 14
+
+	# Micro-cache for the live endpoints (/v1/transfers?live=true, /v1/whales/live)
+	LIVE_CACHE_TTL_SEC: float = 1.0
+	LIVE_CACHE_MAX_ENTRIES: int = 1024
+
+	# In-memory ring of the newest transfers; serves recent-window and per-wallet reads
+	HOTSTORE_CAPACITY: int = 100000
+
+	# Local Parquet archive (network=/token=/day= partitions); needs the optional pyarrow package
+	ARCHIVE_ENABLED: bool = False
+	ARCHIVE_DIR: str = "data/archive"
+	ARCHIVE_FLUSH_SEC: float = 300
+	ARCHIVE_FLUSH_ROWS: int = 100000
+	ARCHIVE_COMPRESSION: str = "zstd"
+	ARCHIVE_SEEN_CACHE_SIZE: int = 200000
+
+	# Server-push feed (/v1/stream/*); a subscriber whose queue fills up is disconnected
+	STREAM_QUEUE_SIZE: int = 1000
+	STREAM_HEARTBEAT_SEC: float = 15
+	STREAM_SEEN_CACHE_SIZE: int = 50000
+
 	# Whale thresholds (USD)
 	WHALE_THRESHOLD_USDC: float = 1_000_000
 	WHALE_THRESHOLD_USDT: float = 1_000_000
@@ -30,6 +146,19 @@ class Settings(BaseSettings):
 	WHALE_THRESHOLD_BUSD: float = 1_000_000
 	WHALE_THRESHOLD_USTC: float = 250_000
 
+	# API key auth cache; usage counts are accumulated in memory and flushed on a timer
+	AUTH_CACHE_TTL_SEC: float = 60
+	AUTH_NEGATIVE_TTL_SEC: float = 10
+	AUTH_CACHE_MAX_KEYS: int = 10_000
+	# unknown keys are cached apart from valid ones, so guessing can't evict real keys
+	AUTH_NEGATIVE_MAX_KEYS: int = 1_000
+	AUTH_USAGE_FLUSH_SEC: float = 10
+
+	# Sampling profiler at GET /debug/profile (API key required); off unless enabled
+	PROFILER_ENABLED: bool = False
+	PROFILER_INTERVAL_SEC: float = 0.005
+	PROFILER_MAX_SEC: float = 60
+
 	# Operational
 	TRACKED_WALLETS: List[str] = Field(default_factory=list)
 	ENV: str = "development"
@@ -0,0 +1,74 @@
+from typing import Any, Dict, Optional, Tuple
+
+from app import supabase_client
+from app.config import settings
+from app.rpc import RpcClient, RpcError
+
+
+# Last ingested block per network plus the hashes of the most recent ones, so a reorg can be
+# traced back to the fork point without re-reading the whole window.
+class BlockCursor:
+	def __init__(self, network: str, block_number: int, block_hash: Optional[str]) -> None:
+		self.network = network
+		self.block_number = block_number
+		self.block_hash = block_hash
+		self.recent: Dict[int, str] = {}
+		if block_hash:
+			self.remember(block_number, block_hash)
+
+	def remember(self, block_number: int, block_hash: str) -> None:
+		self.recent[block_number] = block_hash
+		overflow = len(self.recent) - max(1, settings.ETL_REORG_MAX_DEPTH)
+		if overflow > 0:
+			for number in sorted(self.recent)[:overflow]:
+				del self.recent[number]
+
+	def advance(self, block_number: int, block_hash: Optional[str]) -> None:
+		self.block_number = block_number
+		self.block_hash = block_hash
+		if block_hash:
+			self.remember(block_number, block_hash)
+
+	def rewind(self, block_number: int, block_hash: Optional[str]) -> None:
+		for number in [n for n in self.recent if n > block_number]:
+			del self.recent[number]
+		self.advance(block_number, block_hash)
+
+
+async def load_cursor(network: str) -> Optional[BlockCursor]:
+	rows = await supabase_client.client.select("etl_cursors", {"network": f"eq.{network}", "limit": 1})
+	if not rows:
+		return None
+	return BlockCursor(network, int(rows[0]["block_number"]), rows[0].get("block_hash"))
+
+
+async def save_cursor(cursor: BlockCursor) -> None:
+	await supabase_client.client.upsert("etl_cursors", [{
+		"network": cursor.network,
+		"block_number": cursor.block_number,
+		"block_hash": cursor.block_hash,
+	}], on_conflict="network")
+
+
+async def get_header(rpc: RpcClient, block_number: int) -> Optional[Dict[str, Any]]:
+	return await rpc.call("eth_getBlockByNumber", [hex(block_number), False])
+
+
+async def find_fork_point(rpc: RpcClient, cursor: BlockCursor) -> Tuple[int, Optional[str]]:
+	# newest remembered block whose hash is still canonical
+	numbers = sorted(cursor.recent, reverse=True)
+	headers = await rpc.batch([("eth_getBlockByNumber", [hex(n), False]) for n in numbers])
+	for number, header in zip(numbers, headers):
+		if isinstance(header, RpcError) or not header:
+			continue
+		if header.get("hash") == cursor.recent[number]:
+			return number, header["hash"]
+	# no common ancestor in memory: fall back to the max reorg depth
+	number = max(0, cursor.block_number - settings.ETL_REORG_MAX_DEPTH)
+	header = await get_header(rpc, number)
+	return number, (header or {}).get("hash")
+
+
+async def rollback_rows(network: str, after_block: int) -> None:
+	for table in ("stablecoin_transfers", "whale_transfers"):
+		await supabase_client.client.delete(table, {"network": f"eq.{network}", "block_number": f"gt.{after_block}"})
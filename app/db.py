@@ -11,11 +11,11 @@ async def init_db_pool() -> None:
 		dsn = settings.SUPABASE_DB_URL or settings.DATABASE_URL
 		if not dsn:
 			raise RuntimeError("No database URL configured. Set SUPABASE_DB_URL or DATABASE_URL.")
-		_pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=10)
+		_pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=settings.DB_POOL_SIZE)
 
 
 async def close_db_pool() -> None:
-	global _poola
+	global _pool
 	if _pool is not None:
 		await _pool.close()
 		_pool = None
@@ -0,0 +1,133 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from web3 import Web3
+
+from app.config import settings
+from app.enrich import LRUCache, Receipt
+from app.models import NETWORKS, TOKENS_BY_ADDRESS
+from app.sinks import SINK_TABLES
+
+# (token, token_address, from_address, to_address, amount, tx_hash, log_index, block_number)
+Decoded = Tuple[str, str, str, str, float, str, Optional[int], int]
+
+# whale rows are projected from the transfer row instead of being built field by field
+WHALE_COLUMNS = SINK_TABLES["whale_transfers"]
+
+
+def get_whale_threshold_usd(token: str) -> float:
+	return {
+		"USDC": settings.WHALE_THRESHOLD_USDC,
+		"USDT": settings.WHALE_THRESHOLD_USDT,
+		"DAI": settings.WHALE_THRESHOLD_DAI,
+		"BUSD": settings.WHALE_THRESHOLD_BUSD,
+		"USTC": settings.WHALE_THRESHOLD_USTC,
+	}.get(token, 1_000_000.0)
+
+
+# Turns raw eth_getLogs Transfer entries into table rows. Everything that depends only on the token
+# list is computed once here; checksummed wallet addresses (a keccak each) go through a bounded LRU,
+# since the same exchange and bridge wallets show up in most blocks.
+class TransferDecoder:
+	def __init__(self, cache_size: Optional[int] = None) -> None:
+		self._checksums = LRUCache(cache_size or settings.ETL_ADDRESS_CACHE_SIZE)
+		# network -> lowercased emitter -> (token, token address as configured, 10 ** decimals)
+		self.tokens: Dict[str, Dict[str, Tuple[str, str, int]]] = {
+			network: {lower: (token, address, 10 ** decimals) for lower, (token, address, decimals) in index.items()}
+			for network, index in TOKENS_BY_ADDRESS.items()
+		}
+		# network -> [(token, checksummed emitter)] for the single multi-address eth_getLogs
+		self.emitters: Dict[str, List[Tuple[str, str]]] = {
+			network: [(token, Web3.to_checksum_address(address)) for token, address, _ in index.values()]
+			for network, index in TOKENS_BY_ADDRESS.items()
+		}
+		self.thresholds: Dict[str, float] = {
+			token: get_whale_threshold_usd(token)
+			for index in self.tokens.values()
+			for token, _, _ in index.values()
+		}
+
+	def log_addresses(self, network: str, tokens: Optional[Set[str]] = None) -> List[str]:
+		return [address for token, address in self.emitters.get(network, []) if tokens is None or token in tokens]
+
+	def checksum(self, topic: str) -> str:
+		raw = topic[-40:].lower()
+		address = self._checksums.get(raw)
+		if address is None:
+			address = Web3.to_checksum_address("0x" + raw)
+			self._checksums.put(raw, address)
+		return address
+
+	def decode(self, network: str, logs: Iterable[Dict[str, Any]], tokens: Optional[Set[str]] = None) -> List[Decoded]:
+		index = self.tokens.get(network)
+		if not index:
+			return []
+		decoded: List[Decoded] = []
+		for log in logs:
+			token_info = index.get(log["address"].lower())
+			topics = log["topics"]
+			# non-standard emitters index fewer topics; skip rather than mis-decode
+			if token_info is None or len(topics) < 3 or log.get("removed"):
+				continue
+			token, address, scale = token_info
+			if tokens is not None and token not in tokens:
+				continue
+			data = log.get("data") or "0x"
+			log_index = log.get("logIndex")
+			decoded.append((
+				token,
+				address,
+				self.checksum(topics[1]),
+				self.checksum(topics[2]),
+				(int(data, 16) if len(data) > 2 else 0) / scale,
+				log["transactionHash"],
+				int(log_index, 16) if log_index is not None else None,
+				int(log["blockNumber"], 16),
+			))
+		return decoded
+
+	def build_rows(
+		self,
+		network: str,
+		decoded: List[Decoded],
+		timestamps: Dict[int, int],
+		receipts: Dict[str, Receipt],
+	) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		chain_id = NETWORKS.get(network)
+		block_iso: Dict[int, str] = {}
+		rows_transfers: List[Dict[str, Any]] = []
+		rows_whales: List[Dict[str, Any]] = []
+		for token, address, from_address, to_address, amount, tx_hash, log_index, block_number in decoded:
+			receipt = receipts.get(tx_hash)
+			block_time = timestamps.get(block_number)
+			if receipt is None or block_time is None:
+				raise RuntimeError(f"{network}: enrichment incomplete for {tx_hash}")
+			# many logs share a block; format its timestamp once
+			ts = block_iso.get(block_number)
+			if ts is None:
+				ts = block_iso[block_number] = datetime.fromtimestamp(block_time, tz=timezone.utc).isoformat()
+			gas_used, gas_price, status = receipt
+			row = {
+				"network": network,
+				"chain_id": chain_id,
+				"token": token,
+				"token_address": address,
+				"from_address": from_address,
+				"to_address": to_address,
+				"amount": amount,
+				"tx_hash": tx_hash,
+				"log_index": log_index,
+				"block_number": block_number,
+				"block_timestamp": ts,
+				"gas_used": float(gas_used),
+				"gas_price": float(gas_price),
+				"gas_fee": float(gas_used * gas_price),
+				"status": status,
+			}
+			rows_transfers.append(row)
+			if amount >= self.thresholds.get(token, 1_000_000.0):
+				rows_whales.append({column: row[column] for column in WHALE_COLUMNS})
+		return rows_transfers, rows_whales
+
+
+decoder = TransferDecoder()
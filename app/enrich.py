@@ -0,0 +1,182 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app import metrics
+from app.config import settings
+from app.rpc import RpcClient, RpcError
+
+# (gas_used, gas_price, status)
+Receipt = Tuple[int, int, str]
+
+
+class LRUCache:
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = max(1, maxsize)
+		self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+	def get(self, key: Hashable, default: Any = None) -> Any:
+		try:
+			value = self._data[key]
+		except KeyError:
+			return default
+		self._data.move_to_end(key)
+		return value
+
+	def put(self, key: Hashable, value: Any) -> None:
+		self._data[key] = value
+		self._data.move_to_end(key)
+		while len(self._data) > self.maxsize:
+			self._data.popitem(last=False)
+
+	def discard(self, key: Hashable) -> None:
+		self._data.pop(key, None)
+
+	def keys(self) -> List[Hashable]:
+		return list(self._data)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self._data
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+
+def _to_int(value: Any) -> int:
+	if value is None:
+		return 0
+	if isinstance(value, int):
+		return value
+	return int(value, 16)
+
+
+def receipt_summary(receipt: Dict[str, Any]) -> Receipt:
+	gas_used = _to_int(receipt.get("gasUsed"))
+	gas_price = _to_int(receipt.get("effectiveGasPrice") or receipt.get("gasPrice"))
+	status = "success" if _to_int(receipt.get("status")) == 1 else "failed"
+	return gas_used, gas_price, status
+
+
+# Block timestamps and receipts for a window of logs: unique blocks/txs are collected, cache hits are
+# served from bounded LRUs keyed by (network, block) / (network, tx), and only misses go out as
+# JSON-RPC batches (eth_getBlockReceipts where supported, eth_getTransactionReceipt otherwise).
+class Enricher:
+	def __init__(
+		self,
+		rpcs: Dict[str, RpcClient],
+		batch_size: Optional[int] = None,
+		use_block_receipts: Optional[bool] = None,
+		block_cache_size: Optional[int] = None,
+		receipt_cache_size: Optional[int] = None,
+	) -> None:
+		self.rpcs = rpcs
+		self.batch_size = max(1, batch_size or settings.ETL_RPC_BATCH_SIZE)
+		self.use_block_receipts = settings.ETL_USE_BLOCK_RECEIPTS if use_block_receipts is None else use_block_receipts
+		self.blocks = LRUCache(block_cache_size or settings.ETL_BLOCK_CACHE_SIZE)
+		self.receipts = LRUCache(receipt_cache_size or settings.ETL_RECEIPT_CACHE_SIZE)
+		# networks whose node rejected eth_getBlockReceipts
+		self._no_block_receipts: Set[str] = set()
+
+	async def enrich(self, network: str, refs: Iterable[Tuple[int, str]]) -> Tuple[Dict[int, int], Dict[str, Receipt]]:
+		# refs are (block_number, tx_hash) pairs, one per log; duplicates are expected
+		rpc = self.rpcs[network]
+		txs_by_block: Dict[int, Set[str]] = {}
+		for block_number, tx_hash in refs:
+			txs_by_block.setdefault(block_number, set()).add(tx_hash)
+
+		timestamps: Dict[int, int] = {}
+		missing_blocks: List[int] = []
+		for block_number in sorted(txs_by_block):
+			ts = self.blocks.get((network, block_number))
+			if ts is None:
+				missing_blocks.append(block_number)
+			else:
+				timestamps[block_number] = ts
+
+		receipts: Dict[str, Receipt] = {}
+		missing_txs: Dict[int, List[str]] = {}
+		for block_number, tx_hashes in txs_by_block.items():
+			for tx_hash in tx_hashes:
+				# cached as (block_number, receipt) so a tx re-mined in another block is a miss
+				cached = self.receipts.get((network, tx_hash))
+				if cached is None or cached[0] != block_number:
+					missing_txs.setdefault(block_number, []).append(tx_hash)
+				else:
+					receipts[tx_hash] = cached[1]
+
+		await asyncio.gather(
+			self._fetch_blocks(network, rpc, missing_blocks, timestamps),
+			self._fetch_receipts(network, rpc, missing_txs, receipts),
+		)
+		return timestamps, receipts
+
+	def invalidate(self, network: str, from_block: int) -> None:
+		# drop everything cached for blocks at or above from_block (reorged away)
+		for key in self.blocks.keys():
+			if key[0] == network and key[1] >= from_block:
+				self.blocks.discard(key)
+		for key in self.receipts.keys():
+			cached = self.receipts.get(key)
+			if key[0] == network and cached is not None and cached[0] >= from_block:
+				self.receipts.discard(key)
+
+	async def _batched(self, rpc: RpcClient, calls: List[Tuple[str, List[Any]]]) -> List[Any]:
+		# chunks go out concurrently; the client's connection limit bounds how many are in flight
+		chunks = list(_chunks(calls, self.batch_size))
+		results = await asyncio.gather(*(rpc.batch(chunk) for chunk in chunks))
+		return [item for chunk in results for item in chunk]
+
+	async def _fetch_blocks(self, network: str, rpc: RpcClient, block_numbers: List[int], out: Dict[int, int]) -> None:
+		if not block_numbers:
+			return
+		with metrics.stage_seconds.time(network=network, stage="blocks"):
+			results = await self._batched(rpc, [("eth_getBlockByNumber", [hex(b), False]) for b in block_numbers])
+		for block_number, block in zip(block_numbers, results):
+			if isinstance(block, RpcError) or not block:
+				continue
+			ts = _to_int(block.get("timestamp"))
+			self.blocks.put((network, block_number), ts)
+			out[block_number] = ts
+
+	async def _fetch_receipts(self, network: str, rpc: RpcClient, missing: Dict[int, List[str]], out: Dict[str, Receipt]) -> None:
+		if not missing:
+			return
+		with metrics.stage_seconds.time(network=network, stage="receipts"):
+			await self._fetch_receipts_batched(network, rpc, missing, out)
+
+	async def _fetch_receipts_batched(self, network: str, rpc: RpcClient, missing: Dict[int, List[str]], out: Dict[str, Receipt]) -> None:
+		leftover: List[Tuple[int, str]] = []
+		if self.use_block_receipts and network not in self._no_block_receipts:
+			block_numbers = sorted(missing)
+			results = await self._batched(rpc, [("eth_getBlockReceipts", [hex(b)]) for b in block_numbers])
+			for block_number, block_receipts in zip(block_numbers, results):
+				wanted = missing[block_number]
+				if isinstance(block_receipts, RpcError) or block_receipts is None:
+					if isinstance(block_receipts, RpcError) and block_receipts.code == -32601:
+						self._no_block_receipts.add(network)
+					leftover.extend((block_number, tx) for tx in wanted)
+					continue
+				wanted_set = set(wanted)
+				for receipt in block_receipts:
+					tx_hash = receipt.get("transactionHash")
+					if tx_hash in wanted_set:
+						summary = receipt_summary(receipt)
+						self.receipts.put((network, tx_hash), (block_number, summary))
+						out[tx_hash] = summary
+				leftover.extend((block_number, tx) for tx in wanted if tx not in out)
+		else:
+			for block_number, tx_hashes in missing.items():
+				leftover.extend((block_number, tx) for tx in tx_hashes)
+
+		results = await self._batched(rpc, [("eth_getTransactionReceipt", [tx_hash]) for _, tx_hash in leftover])
+		for (block_number, tx_hash), receipt in zip(leftover, results):
+			if isinstance(receipt, RpcError) or not receipt:
+				continue
+			summary = receipt_summary(receipt)
+			self.receipts.put((network, tx_hash), (block_number, summary))
+			out[tx_hash] = summary
@@ -1,18 +1,22 @@
 import asyncio
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
-
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Collection, Dict, List, Optional, Set, Tuple
 
+from app import aggregates, archive, balances, cache, hotstore, metrics, pubsub, rollups, sinks, supabase_client, topk
 from app.config import settings
-from app.models import NETWORKS, STABLECOINS
-from app.utils import ERC20_ABI, TRANSFER_TOPIC
-from app.supabase_client import client
+from app.cursor import BlockCursor, find_fork_point, load_cursor, rollback_rows, save_cursor
+from app.decoder import decoder
+from app.enrich import Enricher
+from app.leases import MAINTENANCE, leases
+from app.ledger import ledger
+from app.models import STABLECOINS
+from app.multicall import aggregate3
+from app.rpc import RpcClient, RpcError, is_range_error
+from app.utils import KEYSET_ORDER_DESC, TRANSFER_TOPIC, balance_of_calldata, keyset_after
 
 
-def build_web3_clients() -> Dict[str, Web3]:
-	clients: Dict[str, Web3] = {}
+def build_rpc_clients(networks: Optional[Collection[str]] = None) -> Dict[str, RpcClient]:
+	clients: Dict[str, RpcClient] = {}
 	mapping = {
 		"Ethereum": settings.RPC_ETHEREUM,
 		"Polygon": settings.RPC_POLYGON,
@@ -21,11 +25,9 @@ def build_web3_clients() -> Dict[str, Web3]:
 		"Avalanche": settings.RPC_AVALANCHE,
 	}
 	for network, rpc in mapping.items():
-		if not rpc:
+		if not rpc or (networks is not None and network not in networks):
 			continue
-		w3 = Web3(Web3.HTTPProvider(rpc, request_kwargs={"timeout": 30}))
-		w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-		clients[network] = w3
+		clients[network] = RpcClient(rpc, network=network)
 	return clients
 
 
@@ -34,140 +36,435 @@ async def ensure_schema() -> None:
 	return None
 
 
-def get_whale_threshold_usd(token: str) -> float:
-	return {
-		"USDC": settings.WHALE_THRESHOLD_USDC,
-		"USDT": settings.WHALE_THRESHOLD_USDT,
-		"DAI": settings.WHALE_THRESHOLD_DAI,
-		"BUSD": settings.WHALE_THRESHOLD_BUSD,
-		"USTC": settings.WHALE_THRESHOLD_USTC,
-	}.get(token, 1_000_000.0)
+async def ingest_range(
+	network: str,
+	rpc: RpcClient,
+	enricher: Enricher,
+	from_block: int,
+	to_block: int,
+	tokens: Optional[Set[str]] = None,
+) -> int:
+	addresses = decoder.log_addresses(network, tokens)
+	if not addresses:
+		return 0
+	with metrics.stage_seconds.time(network=network, stage="get_logs"):
+		logs = await rpc.call("eth_getLogs", [{
+			"fromBlock": hex(from_block),
+			"toBlock": hex(to_block),
+			"address": addresses,
+			"topics": [TRANSFER_TOPIC],
+		}])
+	if tokens is None:
+		# raw logs, so tracked balances move by exact integer amounts
+		ledger.apply(network, logs or [], to_block)
+	with metrics.stage_seconds.time(network=network, stage="decode"):
+		decoded = decoder.decode(network, logs or [], tokens)
+	if not decoded:
+		return 0
+
+	# one batched enrichment pass for every log in the range
+	timestamps, receipts = await enricher.enrich(network, ((d[7], d[5]) for d in decoded))
+	with metrics.stage_seconds.time(network=network, stage="build_rows"):
+		rows_transfers, rows_whales = decoder.build_rows(network, decoded, timestamps, receipts)
+	for table, rows in (("stablecoin_transfers", rows_transfers), ("whale_transfers", rows_whales)):
+		per_token: Dict[str, int] = {}
+		for row in rows:
+			per_token[row["token"]] = per_token.get(row["token"], 0) + 1
+		for token, count in per_token.items():
+			metrics.rows_ingested.inc(count, network=network, token=token, table=table)
+
+	# views the API reads in-process; a standalone worker leaves them off
+	if aggregates.aggregator.active:
+		aggregates.aggregator.ingest(rows_transfers)
+	if hotstore.store.active:
+		hotstore.store.ingest(rows_transfers)
+	if archive.writer:
+		archive.writer.append(rows_transfers)
+	topk.tracker.ingest(rows_whales if settings.TOP_WALLETS_WHALES_ONLY else rows_transfers)
+	pubsub.broker.publish("transfer", rows_transfers)
+	pubsub.broker.publish("whale", rows_whales)
+
+	# hand off to the shared write-behind buffer; it batches across networks before hitting the sink
+	if rows_transfers:
+		await sinks.buffer.put("stablecoin_transfers", rows_transfers)
+	if rows_whales:
+		await sinks.buffer.put("whale_transfers", rows_whales)
+	# after the put, so a barrier taken by the rollup refresh covers these rows
+	rollups.tracker.touch(network, rows_transfers)
+	return len(rows_transfers)
+
+
+# blocks per tick per network, halved after the provider rejects a range and grown back while it keeps up
+tick_blocks: Dict[str, int] = {}
+
 
+async def ingest_adaptive(network: str, rpc: RpcClient, enricher: Enricher, start: int, end: int) -> int:
+	# ingest_range, halving a range the provider rejects as too wide; returns how many splits it took
+	try:
+		await ingest_range(network, rpc, enricher, start, end)
+		return 0
+	except Exception as exc:
+		if start >= end or not is_range_error(exc):
+			raise
+	metrics.range_splits.inc(network=network)
+	mid = (start + end) // 2
+	return 1 + await ingest_adaptive(network, rpc, enricher, start, mid) + await ingest_adaptive(network, rpc, enricher, mid + 1, end)
 
-async def poll_transfers(clients: Dict[str, Web3]) -> None:
-	# for live polling, keep a small overlap window
+
+async def advance_cursor(network: str, rpc: RpcClient, enricher: Enricher, cursor: BlockCursor) -> None:
+	latest = await rpc.block_number()
+	metrics.head_lag.set(max(0, latest - cursor.block_number), network=network)
+	if cursor.block_number >= latest:
+		return
+	step = tick_blocks.get(network, settings.ETL_MAX_BLOCKS_PER_TICK)
+	from_block = cursor.block_number + 1
+	to_block = min(latest, cursor.block_number + step)
+	first, last = await rpc.batch([
+		("eth_getBlockByNumber", [hex(from_block), False]),
+		("eth_getBlockByNumber", [hex(to_block), False]),
+	])
+	if isinstance(first, RpcError) or isinstance(last, RpcError) or not first or not last:
+		return
+	if cursor.block_hash and first.get("parentHash") != cursor.block_hash:
+		# reorg: rewind to the fork point, drop the orphaned rows and re-ingest from there next tick
+		fork_block, fork_hash = await find_fork_point(rpc, cursor)
+		await rollback_rows(network, fork_block)
+		enricher.invalidate(network, fork_block + 1)
+		hotstore.store.rollback(network, fork_block + 1)
+		aggregates.aggregator.rollback(network, fork_block + 1)
+		ledger.rollback(network, fork_block + 1)
+		topk.tracker.rollback(network, fork_block + 1)
+		rollups.tracker.rollback(network, fork_block + 1)
+		if archive.writer:
+			archive.writer.rollback(network, fork_block + 1)
+		cursor.rewind(fork_block, fork_hash)
+		await save_cursor(cursor)
+		return
+	splits = await ingest_adaptive(network, rpc, enricher, from_block, to_block)
+	tick_blocks[network] = max(1, step // 2) if splits else min(settings.ETL_MAX_BLOCKS_PER_TICK, step * 2)
+	# only move the cursor once the rows behind it are durable
+	await sinks.buffer.barrier()
+	if first.get("hash"):
+		cursor.remember(from_block, first["hash"])
+	cursor.advance(to_block, last.get("hash"))
+	await save_cursor(cursor)
+	metrics.head_lag.set(latest - to_block, network=network)
+
+
+async def poll_network_transfers(network: str, rpc: RpcClient, enricher: Enricher, limit: asyncio.Semaphore) -> None:
+	# window mode only: re-scan a small overlap window every tick
 	WINDOW = 200
+	cursor: Optional[BlockCursor] = None
 	while True:
-		for network, w3 in clients.items():
-			try:
-				latest = w3.eth.block_number
-				from_block = max(0, latest - WINDOW)
-				for token, per_network in STABLECOINS.items():
-					if network not in per_network:
-						continue
-					address, decimals = per_network[network]
-					logs = w3.eth.get_logs({
-						"fromBlock": from_block,
-						"toBlock": latest,
-						"address": Web3.to_checksum_address(address),
-						"topics": [TRANSFER_TOPIC],
-					})
-					rows_transfers: List[Dict[str, object]] = []
-					rows_whales: List[Dict[str, object]] = []
-					for log in logs:
-						tx_hash = log["transactionHash"].hex()
-						block_number = log["blockNumber"]
-						log_index = log.get("logIndex")
-						from_address = Web3.to_checksum_address("0x" + log["topics"][1].hex()[-40:])
-						to_address = Web3.to_checksum_address("0x" + log["topics"][2].hex()[-40:])
-						value = int(log["data"], 16)
-						amount = value / (10 ** decimals)
-
-						receipt = w3.eth.get_transaction_receipt(tx_hash)
-						gas_used = receipt["gasUsed"]
-						gas_price = receipt.get("effectiveGasPrice") or receipt.get("gasPrice") or 0
-						gas_fee = (gas_used or 0) * (gas_price or 0)
-						status = "success" if receipt.get("status") == 1 else "failed"
-						block = w3.eth.get_block(block_number)
-						block_ts = datetime.fromtimestamp(block["timestamp"], tz=timezone.utc)
-
-						row = {
-							"network": network,
-							"chain_id": NETWORKS.get(network),
-							"token": token,
-							"token_address": address,
-							"from_address": from_address,
-							"to_address": to_address,
-							"amount": amount,
-							"tx_hash": tx_hash,
-							"log_index": int(log_index) if log_index is not None else None,
-							"block_number": block_number,
-							"block_timestamp": block_ts.isoformat(),
-							"gas_used": float(gas_used or 0),
-							"gas_price": float(gas_price or 0),
-							"gas_fee": float(gas_fee or 0),
-							"status": status,
-						}
-						rows_transfers.append(row)
-
-						if amount >= get_whale_threshold_usd(token):
-							rows_whales.append({
-								"network": network,
-								"token": token,
-								"token_address": address,
-								"from_address": from_address,
-								"to_address": to_address,
-								"amount": amount,
-								"tx_hash": tx_hash,
-								"log_index": int(log_index) if log_index is not None else None,
-								"block_number": block_number,
-								"block_timestamp": block_ts.isoformat(),
-								"gas_used": float(gas_used or 0),
-								"gas_price": float(gas_price or 0),
-								"gas_fee": float(gas_fee or 0),
-								"status": status,
-							})
-
-					# bulk upsert to Supabase
-					if rows_transfers:
-						client.upsert("stablecoin_transfers", rows_transfers, on_conflict="tx_hash,log_index")
-					if rows_whales:
-						client.upsert("whale_transfers", rows_whales, on_conflict="tx_hash,log_index")
-			except Exception:
-				pass
+		try:
+			async with limit:
+				if not settings.ETL_CURSOR_ENABLED:
+					latest = await rpc.block_number()
+					await ingest_range(network, rpc, enricher, max(0, latest - WINDOW), latest)
+					metrics.head_lag.set(0, network=network)
+				else:
+					if cursor is None:
+						cursor = await load_cursor(network)
+						if cursor is None:
+							# first run on this network: start from the same window the live poller used
+							cursor = BlockCursor(network, max(0, await rpc.block_number() - WINDOW), None)
+					await advance_cursor(network, rpc, enricher, cursor)
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="transfers", network=network, error=type(exc).__name__)
 		await asyncio.sleep(settings.ETL_POLL_SEC)
 
 
-async def poll_balances(clients: Dict[str, Web3]) -> None:
-	wallets = [w.strip() for w in settings.TRACKED_WALLETS if w]
+async def poll_transfers(clients: Dict[str, RpcClient], limit: asyncio.Semaphore) -> None:
+	# one loop per network so a slow chain only delays itself
+	enricher = Enricher(clients)
+	await asyncio.gather(*(
+		poll_network_transfers(network, rpc, enricher, limit) for network, rpc in clients.items()
+	))
+
+
+async def poll_network_balances(network: str, rpc: RpcClient, wallets: List[str], limit: asyncio.Semaphore) -> None:
+	targets: List[Tuple[str, str, int, str]] = [
+		(token, per_network[network][0], per_network[network][1], wallet)
+		for token, per_network in STABLECOINS.items()
+		if network in per_network
+		for wallet in wallets
+	]
+	# last written raw balance per (token, wallet); only changes are written, across restarts too
+	last_known: Optional[Dict[Tuple[str, str], int]] = None
 	while True:
-		for network, w3 in clients.items():
-			for token, per_network in STABLECOINS.items():
-				if network not in per_network:
+		try:
+			if last_known is None:
+				latest = await balances.load_latest(network)
+				last_known = {
+					(token, wallet): latest[(token, wallet.lower()[-40:])]
+					for token, _, _, wallet in targets
+					if (token, wallet.lower()[-40:]) in latest
+				}
+			async with limit:
+				results = await aggregate3(rpc, [(address, balance_of_calldata(wallet)) for _, address, _, wallet in targets])
+			rows: List[Dict[str, object]] = []
+			changed: Dict[Tuple[str, str], int] = {}
+			for (token, address, decimals, wallet), data in zip(targets, results):
+				if data is None or len(data) < 32:
+					continue
+				bal = int.from_bytes(data[:32], "big")
+				if last_known.get((token, wallet)) == bal:
 					continue
-				address, decimals = per_network[network]
-				contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=ERC20_ABI)
-				for wallet in wallets:
-					try:
-						bal = contract.functions.balanceOf(Web3.to_checksum_address(wallet)).call()
-						balance = bal / (10 ** decimals)
-						client.insert("wallet_balances", [{
-							"wallet_address": wallet,
-							"network": network,
-							"token": token,
-							"token_address": address,
-							"balance": balance,
-						}])
-					except Exception:
-						pass
+				changed[(token, wallet)] = bal
+				rows.append({
+					"wallet_address": wallet,
+					"network": network,
+					"token": token,
+					"token_address": address,
+					"balance": bal / (10 ** decimals),
+					"balance_raw": bal,
+				})
+			if rows:
+				await balances.write_balances(rows)
+				last_known.update(changed)
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="balances", network=network, error=type(exc).__name__)
 		await asyncio.sleep(settings.BALANCE_POLL_SEC)
 
 
+async def maintain_network_ledger(network: str, rpc: RpcClient, limit: asyncio.Semaphore) -> None:
+	# balances follow the transfer stream; RPC is only used to seed and to reconcile
+	while True:
+		try:
+			if network not in ledger.written:
+				ledger.written[network] = await balances.load_latest(network)
+			if network not in ledger.seeded:
+				async with limit:
+					await ledger.seed(network, rpc)
+			elif ledger.reconcile_due(network):
+				async with limit:
+					await ledger.reconcile(network, rpc)
+			rows, keys = ledger.take_changes(network)
+			if rows:
+				try:
+					await balances.write_balances(rows)
+				except Exception:
+					ledger.restore(network, keys)
+					raise
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="balance_ledger", network=network, error=type(exc).__name__)
+		await asyncio.sleep(settings.BALANCE_FLUSH_SEC)
+
+
+async def run_network(network: str, rpc: RpcClient, enricher: Enricher, limit: asyncio.Semaphore) -> None:
+	# everything ingested per network: the transfer cursor and the tracked-wallet balances
+	loops = [poll_network_transfers(network, rpc, enricher, limit)]
+	if settings.BALANCE_MODE == "ledger":
+		if ledger.wallets:
+			loops.append(maintain_network_ledger(network, rpc, limit))
+	else:
+		wallets = [w.strip() for w in settings.TRACKED_WALLETS if w]
+		loops.append(poll_network_balances(network, rpc, wallets, limit))
+	await asyncio.gather(*loops)
+
+
+async def supervise_network(
+	network: str,
+	rpc: RpcClient,
+	enricher: Enricher,
+	limit: asyncio.Semaphore,
+	on_acquired: Callable[[str], None],
+	on_released: Callable[[str], None],
+) -> None:
+	# runs the network only while this process holds its lease; a standby keeps retrying and takes
+	# over once the holder stops renewing
+	task: Optional[asyncio.Task] = None
+	first = True
+	try:
+		while True:
+			try:
+				await leases.acquire(network)
+			except Exception as exc:
+				# keep the local claim until it runs out; the next renewal may still get through
+				metrics.loop_errors.inc(loop="lease", network=network, error=type(exc).__name__)
+			held = leases.holds(network)
+			if held and task is None:
+				on_acquired(network)
+				task = asyncio.create_task(run_network(network, rpc, enricher, limit))
+			elif not held and (task is not None or first):
+				if task is not None:
+					task.cancel()
+					task = None
+				on_released(network)
+			first = False
+			# never sleep past the local claim, so a holder cut off from the database stops in time
+			await asyncio.sleep(min(settings.ETL_LEASE_RENEW_SEC, leases.remaining(network)) if held else settings.ETL_LEASE_RENEW_SEC)
+	finally:
+		if task is not None:
+			task.cancel()
+
+
+async def hold_maintenance_lease() -> None:
+	# the process holding it runs the global housekeeping below; the others stand by
+	while True:
+		try:
+			await leases.acquire(MAINTENANCE)
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="lease", error=type(exc).__name__)
+		await asyncio.sleep(settings.ETL_LEASE_RENEW_SEC)
+
+
+async def compact_balance_history() -> None:
+	while True:
+		if not leases.holds(MAINTENANCE):
+			await asyncio.sleep(settings.ETL_LEASE_RENEW_SEC)
+			continue
+		try:
+			await balances.compact_history()
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="balance_compaction", error=type(exc).__name__)
+		await asyncio.sleep(settings.BALANCE_COMPACT_SEC)
+
+
+async def refresh_rollups() -> None:
+	pruned_at = 0.0
+	while True:
+		try:
+			await rollups.flush()
+			now = asyncio.get_running_loop().time()
+			if now - pruned_at >= 3600 and leases.holds(MAINTENANCE):
+				await rollups.prune()
+				pruned_at = now
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="rollups", error=type(exc).__name__)
+		await asyncio.sleep(settings.ROLLUP_REFRESH_SEC)
+
+
+async def seed_flow_aggregates() -> None:
+	# fill the windows with the stored transfers of the longest window, newest first; rows the live
+	# ETL delivers meanwhile are held back and replayed once the seed is in, minus those it read
+	aggregator = aggregates.aggregator
+	generation = aggregator.generation
+	aggregator.begin_seed()
+	since = datetime.now(timezone.utc) - timedelta(seconds=aggregator.span())
+	params: Dict[str, Any] = {
+		"select": "network,token,from_address,to_address,amount,gas_fee,tx_hash,log_index,block_number,block_timestamp",
+		"block_timestamp": f"gte.{since.isoformat()}",
+		"order": KEYSET_ORDER_DESC,
+		"limit": settings.SUPABASE_MAX_ROWS,
+	}
+	seeded = 0
+	while seeded < settings.ANALYTICS_SEED_MAX_ROWS:
+		rows = await supabase_client.client.select("stablecoin_transfers", params)
+		if aggregator.generation != generation or not aggregator.active:
+			return
+		aggregator.seed(rows)
+		seeded += len(rows)
+		if len(rows) < settings.SUPABASE_MAX_ROWS:
+			break
+		last = rows[-1]
+		params["or"] = keyset_after(last["block_timestamp"], last["tx_hash"], last["log_index"], desc=True)
+	aggregator.finish_seed()
+
+
+async def refresh_flow_aggregates() -> None:
+	while True:
+		try:
+			if aggregates.aggregator.active and not aggregates.aggregator.ready:
+				await seed_flow_aggregates()
+			aggregates.aggregator.refresh()
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="flow_aggregates", error=type(exc).__name__)
+		await asyncio.sleep(settings.ANALYTICS_REFRESH_SEC)
+
+
+async def load_top_wallets(network: str) -> List[Dict[str, Any]]:
+	out: List[Dict[str, Any]] = []
+	while True:
+		rows = await supabase_client.client.select("whale_top_wallets", {
+			"select": "token,wallet_address,total_sent,total_received",
+			"network": f"eq.{network}",
+			"order": "id.asc",
+			"limit": settings.SUPABASE_MAX_ROWS,
+			"offset": len(out),
+		})
+		out.extend(rows)
+		if len(rows) < settings.SUPABASE_MAX_ROWS:
+			return out
+
+
 async def refresh_top_wallets() -> None:
 	while True:
 		try:
-			# Recompute using REST: clear and reinsert from aggregated query
-			# Note: PostgREST doesn't support multi-statement; rely on a view or do two steps.
-			# For simplicity, skip heavy recompute here; clients can compute from whale_transfers.
-			pass
-		except Exception:
-			pass
+			for network in list(topk.tracker.pending):
+				topk.tracker.load(network, await load_top_wallets(network))
+			upserts, deletes, ranks = topk.tracker.diff()
+			if upserts:
+				await supabase_client.client.upsert("whale_top_wallets", upserts, on_conflict="network,token,wallet_address")
+			# wallets that dropped out of the top-K, grouped per (network, token)
+			dropped: Dict[Tuple[str, str], List[str]] = {}
+			for network, token, wallet in deletes:
+				dropped.setdefault((network, token), []).append(wallet)
+			for (network, token), wallets in dropped.items():
+				await supabase_client.client.delete("whale_top_wallets", {
+					"network": f"eq.{network}",
+					"token": f"eq.{token}",
+					"wallet_address": f"in.({','.join(wallets)})",
+				})
+			topk.tracker.mark_written(ranks)
+		except Exception as exc:
+			metrics.loop_errors.inc(loop="top_wallets", error=type(exc).__name__)
 		await asyncio.sleep(settings.TOP_WALLETS_REFRESH_SEC)
 
 
-async def start_background_workers() -> None:
-	clients = build_web3_clients()
+def activate_views() -> None:
+	# this process now ingests every network: serve the hot store again, and the flow aggregates once
+	# refresh_flow_aggregates has refilled them from the stored rows
+	hotstore.store.activate()
+	aggregates.aggregator.reset()
+	aggregates.aggregator.active = True
+
+
+def retire_views() -> None:
+	# this process no longer sees every network's transfers, so the API serves these reads over REST
+	hotstore.store.active = False
+	aggregates.aggregator.active = False
+	aggregates.aggregator.ready = False
+
+
+async def start_background_workers(networks: Optional[Collection[str]] = None, serve_views: bool = True) -> List[asyncio.Task]:
+	# networks: the shard this process may ingest (default: every configured network); serve_views:
+	# also feed the in-process hot store and flow aggregates, which only the API process reads, and
+	# only while it holds the lease of every network
+	clients = build_rpc_clients(networks)
 	await ensure_schema()
-	asyncio.create_task(poll_transfers(clients))
-	asyncio.create_task(poll_balances(clients))
-	asyncio.create_task(refresh_top_wallets())
+	await sinks.init_sink()
+	sinks.buffer.on_flush.append(cache.response_cache.invalidate)
+	ledger.active = settings.BALANCE_MODE == "ledger" and bool(ledger.wallets)
+	enricher = Enricher(clients)
+	held: Set[str] = set()
+
+	def on_acquired(network: str) -> None:
+		held.add(network)
+		topk.tracker.claim(network)
+		if serve_views and held == set(clients):
+			activate_views()
+
+	def on_released(network: str) -> None:
+		held.discard(network)
+		ledger.forget(network)
+		topk.tracker.forget(network)
+		enricher.invalidate(network, 0)
+		if serve_views:
+			retire_views()
+
+	# bounds how many networks run an ingestion pass at the same time
+	limit = asyncio.Semaphore(settings.ETL_MAX_CONCURRENCY)
+	tasks = [
+		asyncio.create_task(supervise_network(network, rpc, enricher, limit, on_acquired, on_released))
+		for network, rpc in clients.items()
+	]
+	tasks.append(asyncio.create_task(hold_maintenance_lease()))
+	tasks.append(asyncio.create_task(compact_balance_history()))
+	tasks.append(asyncio.create_task(refresh_rollups()))
+	tasks.append(asyncio.create_task(refresh_top_wallets()))
+	if serve_views:
+		tasks.append(asyncio.create_task(refresh_flow_aggregates()))
+	if archive.init_archive():
+		tasks.append(asyncio.create_task(archive.writer.run()))
+	return tasks
@@ -0,0 +1,249 @@
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.models import NETWORKS
+
+
+# String <-> small int ids with reference counts, so ids of addresses that left the ring are reused
+# and the table stays bounded by what the ring holds.
+class Interner:
+	def __init__(self) -> None:
+		self.ids: Dict[str, int] = {}
+		self.values: List[Optional[str]] = []
+		self.refs = array("i")
+		self._free: List[int] = []
+
+	def acquire(self, value: str) -> int:
+		key = value.lower()
+		ident = self.ids.get(key)
+		if ident is None:
+			if self._free:
+				ident = self._free.pop()
+				self.values[ident] = value
+				self.refs[ident] = 0
+			else:
+				ident = len(self.values)
+				self.values.append(value)
+				self.refs.append(0)
+			self.ids[key] = ident
+		self.refs[ident] += 1
+		return ident
+
+	def release(self, ident: int) -> None:
+		self.refs[ident] -= 1
+		if self.refs[ident] <= 0:
+			del self.ids[self.values[ident].lower()]
+			self.values[ident] = None
+			self._free.append(ident)
+
+	def lookup(self, value: str) -> Optional[int]:
+		return self.ids.get(value.lower())
+
+
+# Fixed-capacity ring of the most recent transfers, one typed array per column. Rows are addressed by
+# a monotonically increasing sequence number (slot = seq % capacity); the (network, token) and
+# per-address indexes are deques of sequence numbers in arrival order, so evicting the oldest row is
+# a popleft on each of its indexes.
+class HotStore:
+	def __init__(self, capacity: int) -> None:
+		n = self.capacity = max(1, capacity)
+		self.block_number = array("q", [0]) * n
+		self.block_ts = array("d", [0.0]) * n
+		self.amount = array("d", [0.0]) * n
+		self.gas_used = array("d", [0.0]) * n
+		self.gas_price = array("d", [0.0]) * n
+		self.gas_fee = array("d", [0.0]) * n
+		self.log_index = array("i", [-1]) * n
+		self.status = array("b", [0]) * n
+		# 0 = empty or rolled back
+		self.live = array("b", [0]) * n
+		self.network = array("i", [0]) * n
+		self.token = array("i", [0]) * n
+		self.token_address = array("i", [0]) * n
+		self.from_address = array("i", [0]) * n
+		self.to_address = array("i", [0]) * n
+		self.tx_hash = bytearray(32 * n)
+		self.strings = Interner()
+		self.addresses = Interner()
+		self.by_pair: Dict[Tuple[int, int], Deque[int]] = {}
+		self.by_address: Dict[int, Deque[int]] = {}
+		# (tx_hash, log_index) -> seq; window re-scans and replays re-deliver rows
+		self._keys: Dict[Tuple[bytes, int], int] = {}
+		self._next = 0
+		# rows at or after this timestamp are all in the ring (set on activation, raised by eviction)
+		self.horizon = float("inf")
+		self.active = False
+
+	def activate(self) -> None:
+		self.horizon = time.time()
+		self.active = True
+
+	def covers(self, since_ts: float) -> bool:
+		return self.active and since_ts >= self.horizon
+
+	def _tx_bytes(self, slot: int) -> bytes:
+		return bytes(self.tx_hash[slot * 32:(slot + 1) * 32])
+
+	def _evict(self, seq: int) -> None:
+		slot = seq % self.capacity
+		for index, key in (
+			(self.by_pair, (self.network[slot], self.token[slot])),
+			(self.by_address, self.from_address[slot]),
+			(self.by_address, self.to_address[slot]),
+		):
+			seqs = index.get(key)
+			if seqs and seqs[0] == seq:
+				seqs.popleft()
+				if not seqs:
+					del index[key]
+		self.strings.release(self.network[slot])
+		self.strings.release(self.token[slot])
+		self.strings.release(self.token_address[slot])
+		self.addresses.release(self.from_address[slot])
+		self.addresses.release(self.to_address[slot])
+		if self.live[slot]:
+			key = (self._tx_bytes(slot), self.log_index[slot])
+			if self._keys.get(key) == seq:
+				del self._keys[key]
+			self.horizon = max(self.horizon, self.block_ts[slot])
+			self.live[slot] = 0
+
+	def ingest(self, rows: Iterable[Dict[str, Any]]) -> None:
+		for row in rows:
+			tx_hash = bytes.fromhex(str(row["tx_hash"])[2:])
+			log_index = row.get("log_index")
+			log_index = -1 if log_index is None else int(log_index)
+			key = (tx_hash, log_index)
+			if key in self._keys:
+				continue
+			seq = self._next
+			self._next += 1
+			if seq >= self.capacity:
+				self._evict(seq - self.capacity)
+			slot = seq % self.capacity
+			self._keys[key] = seq
+			self.tx_hash[slot * 32:(slot + 1) * 32] = tx_hash.rjust(32, b"\0")[:32]
+			self.log_index[slot] = log_index
+			self.block_number[slot] = int(row.get("block_number") or 0)
+			self.block_ts[slot] = datetime.fromisoformat(row["block_timestamp"]).timestamp()
+			self.amount[slot] = float(row.get("amount") or 0)
+			self.gas_used[slot] = float(row.get("gas_used") or 0)
+			self.gas_price[slot] = float(row.get("gas_price") or 0)
+			self.gas_fee[slot] = float(row.get("gas_fee") or 0)
+			self.status[slot] = 1 if row.get("status") == "success" else 0
+			self.network[slot] = network = self.strings.acquire(row["network"])
+			self.token[slot] = token = self.strings.acquire(row["token"])
+			self.token_address[slot] = self.strings.acquire(row.get("token_address") or "")
+			self.from_address[slot] = src = self.addresses.acquire(row.get("from_address") or "")
+			self.to_address[slot] = dst = self.addresses.acquire(row.get("to_address") or "")
+			self.live[slot] = 1
+			self.by_pair.setdefault((network, token), deque()).append(seq)
+			self.by_address.setdefault(src, deque()).append(seq)
+			if dst != src:
+				self.by_address.setdefault(dst, deque()).append(seq)
+
+	def rollback(self, network: str, from_block: int) -> None:
+		# hide rows orphaned by a reorg; they are re-ingested from the new branch
+		network_id = self.strings.lookup(network)
+		if network_id is None:
+			return
+		for (net, _), seqs in self.by_pair.items():
+			if net != network_id:
+				continue
+			for seq in reversed(seqs):
+				slot = seq % self.capacity
+				if self.block_number[slot] < from_block:
+					break
+				if self.live[slot]:
+					self.live[slot] = 0
+					self._keys.pop((self._tx_bytes(slot), self.log_index[slot]), None)
+
+	def row(self, seq: int) -> Dict[str, Any]:
+		slot = seq % self.capacity
+		network = self.strings.values[self.network[slot]]
+		log_index = self.log_index[slot]
+		return {
+			"network": network,
+			"chain_id": NETWORKS.get(network),
+			"token": self.strings.values[self.token[slot]],
+			"token_address": self.strings.values[self.token_address[slot]],
+			"from_address": self.addresses.values[self.from_address[slot]],
+			"to_address": self.addresses.values[self.to_address[slot]],
+			"amount": self.amount[slot],
+			"tx_hash": "0x" + self._tx_bytes(slot).hex(),
+			"log_index": None if log_index < 0 else log_index,
+			"block_number": self.block_number[slot],
+			"block_timestamp": datetime.fromtimestamp(self.block_ts[slot], tz=timezone.utc).isoformat(),
+			"gas_used": self.gas_used[slot],
+			"gas_price": self.gas_price[slot],
+			"gas_fee": self.gas_fee[slot],
+			"status": "success" if self.status[slot] else "failed",
+		}
+
+	def _newest(self, seqs: Deque[int], since_ts: float, limit: int, ordered: bool, network: Optional[int] = None, token: Optional[int] = None) -> List[Tuple[float, int]]:
+		found: List[Tuple[float, int]] = []
+		for seq in reversed(seqs):
+			slot = seq % self.capacity
+			ts = self.block_ts[slot]
+			if ts < since_ts:
+				# a (network, token) index is in block order; an address index mixes networks
+				if ordered:
+					break
+				continue
+			if not self.live[slot]:
+				continue
+			if network is not None and self.network[slot] != network:
+				continue
+			if token is not None and self.token[slot] != token:
+				continue
+			found.append((ts, seq))
+			if len(found) >= limit:
+				break
+		return found
+
+	def _resolve(self, network: Optional[str], token: Optional[str]) -> Tuple[bool, Optional[int], Optional[int]]:
+		network_id = self.strings.lookup(network) if network else None
+		token_id = self.strings.lookup(token) if token else None
+		known = (not network or network_id is not None) and (not token or token_id is not None)
+		return known, network_id, token_id
+
+	def recent(self, since_ts: float, network: Optional[str] = None, token: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+		known, network_id, token_id = self._resolve(network, token)
+		if not known:
+			return []
+		found: List[Tuple[float, int]] = []
+		for (net, tok), seqs in self.by_pair.items():
+			if network_id is not None and net != network_id:
+				continue
+			if token_id is not None and tok != token_id:
+				continue
+			found.extend(self._newest(seqs, since_ts, limit, True))
+		found.sort(reverse=True)
+		return [self.row(seq) for _, seq in found[:limit]]
+
+	def wallet(self, address: str, since_ts: float, network: Optional[str] = None, token: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+		known, network_id, token_id = self._resolve(network, token)
+		address_id = self.addresses.lookup(address)
+		if not known or address_id is None:
+			return []
+		seqs = self.by_address.get(address_id)
+		if not seqs:
+			return []
+		found = self._newest(seqs, since_ts, limit, False, network_id, token_id)
+		found.sort(reverse=True)
+		return [self.row(seq) for _, seq in found]
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"rows": min(self._next, self.capacity),
+			"capacity": self.capacity,
+			"addresses": len(self.addresses.ids),
+			"horizon": self.horizon if self.active else None,
+		}
+
+
+store = HotStore(settings.HOTSTORE_CAPACITY)
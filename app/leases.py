@@ -0,0 +1,59 @@
+import os
+import socket
+import time
+import uuid
+from typing import Dict, Optional
+
+from app import metrics, supabase_client
+from app.config import settings
+
+# lease taken by whichever worker runs the global housekeeping (balance compaction, rollup pruning)
+MAINTENANCE = "maintenance"
+
+
+# Time-limited leases in etl_leases, granted by the acquire_etl_lease SQL function against the
+# database clock (see SCHEMA_SQL). The holder renews every ETL_LEASE_RENEW_SEC; locally a lease is
+# only trusted until ETL_LEASE_TTL_SEC after the renewal was sent, so a holder that cannot reach the
+# database stops before another worker can be granted the lease.
+class Leases:
+	def __init__(self, owner: Optional[str] = None) -> None:
+		self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+		# lease name -> monotonic time the local claim runs out
+		self.expires: Dict[str, float] = {}
+
+	async def acquire(self, name: str) -> bool:
+		# grants a free or expired lease, or renews one this owner already holds
+		sent = time.monotonic()
+		granted = await supabase_client.client.rpc("acquire_etl_lease", {
+			"p_name": name,
+			"p_owner": self.owner,
+			"p_ttl_sec": settings.ETL_LEASE_TTL_SEC,
+		})
+		if granted:
+			self.expires[name] = sent + settings.ETL_LEASE_TTL_SEC
+		else:
+			self.expires.pop(name, None)
+		metrics.lease_held.set(1 if granted else 0, name=name)
+		return bool(granted)
+
+	def holds(self, name: str) -> bool:
+		return self.expires.get(name, 0.0) > time.monotonic()
+
+	def remaining(self, name: str) -> float:
+		return max(0.0, self.expires.get(name, 0.0) - time.monotonic())
+
+	async def release(self, name: str) -> None:
+		# lets a standby take over right away instead of after the TTL
+		self.expires.pop(name, None)
+		metrics.lease_held.set(0, name=name)
+		await supabase_client.client.rpc("release_etl_lease", {"p_name": name, "p_owner": self.owner})
+
+	async def release_all(self) -> None:
+		for name in list(self.expires):
+			await self.release(name)
+
+	def stats(self) -> Dict[str, float]:
+		return {name: round(self.remaining(name), 1) for name in self.expires if self.holds(name)}
+
+
+leases = Leases()
@@ -0,0 +1,222 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Set, Tuple
+
+from app import metrics
+from app.config import settings
+from app.decoder import decoder
+from app.multicall import aggregate3
+from app.rpc import RpcClient
+from app.utils import balance_of_calldata
+
+# (token, lowercased wallet)
+Key = Tuple[str, str]
+
+
+# Tracked-wallet balances kept in memory from the ingested Transfer stream. Each network is seeded
+# with one balanceOf snapshot at block S; after that, every Transfer log touching a tracked wallet
+# in a block above the ledger's floor is applied as a raw integer delta. Recent deltas are journaled
+# per block so a reorg can be undone and a reconciliation snapshot taken at an older block can be
+# compared with the ledger as of that block.
+class BalanceLedger:
+	def __init__(self, wallets: Iterable[str]) -> None:
+		# lowercased 40-hex -> wallet as configured (what wallet_balances rows carry)
+		self.wallets: Dict[str, str] = {w.strip().lower()[-40:]: w.strip() for w in wallets if w and w.strip()}
+		self.balances: Dict[str, Dict[Key, int]] = {}
+		# newest block whose Transfers are already reflected (or deliberately skipped) per network
+		self.floor: Dict[str, int] = {}
+		self.seeded: Dict[str, int] = {}
+		self.journal: Dict[str, Deque[Tuple[int, Key, int]]] = {}
+		# bumped by rollbacks, so a reconciliation that straddled one is discarded
+		self.epoch: Dict[str, int] = {}
+		self.dirty: Dict[str, Set[Key]] = {}
+		# last raw balance handed to wallet_balances, so a +x/-x within one flush writes nothing
+		self.written: Dict[str, Dict[Key, int]] = {}
+		self.reconciled_at: Dict[str, float] = {}
+		self._pinned: Dict[str, int] = {}
+		self.active = False
+
+	def targets(self, network: str) -> List[Tuple[str, str, str]]:
+		# (token, token address, lowercased wallet) for every tracked balance on the network
+		return [
+			(token, address, wallet)
+			for token, address, _ in decoder.tokens.get(network, {}).values()
+			for wallet in self.wallets
+		]
+
+	def apply(self, network: str, logs: Iterable[Dict[str, Any]], to_block: int) -> None:
+		if not self.active or not self.wallets:
+			return
+		floor = self.floor.get(network, -1)
+		if to_block <= floor:
+			return
+		index = decoder.tokens.get(network, {})
+		journal = self.journal.setdefault(network, deque())
+		balances = self.balances.get(network) if network in self.seeded else None
+		dirty = self.dirty.setdefault(network, set())
+		for log in logs:
+			topics = log["topics"]
+			if len(topics) < 3 or log.get("removed"):
+				continue
+			block = int(log["blockNumber"], 16)
+			if block <= floor:
+				continue
+			sender, receiver = topics[1][-40:].lower(), topics[2][-40:].lower()
+			if sender not in self.wallets and receiver not in self.wallets:
+				continue
+			token_info = index.get(log["address"].lower())
+			if token_info is None:
+				continue
+			data = log.get("data") or "0x"
+			amount = int(data, 16) if len(data) > 2 else 0
+			for wallet, delta in ((sender, -amount), (receiver, amount)):
+				if wallet not in self.wallets or not delta:
+					continue
+				key = (token_info[0], wallet)
+				journal.append((block, key, delta))
+				if balances is not None:
+					balances[key] = balances.get(key, 0) + delta
+					dirty.add(key)
+		self.floor[network] = to_block
+		self._prune(network)
+
+	def _prune(self, network: str) -> None:
+		journal = self.journal.get(network)
+		if not journal:
+			return
+		keep_after = self.floor.get(network, 0) - settings.ETL_REORG_MAX_DEPTH
+		if network in self._pinned:
+			keep_after = min(keep_after, self._pinned[network])
+		while journal and journal[0][0] <= keep_after:
+			journal.popleft()
+
+	def rollback(self, network: str, from_block: int) -> None:
+		# undo every journaled delta at or above from_block; a fork below the seed snapshot needs a reseed
+		if network not in self.floor:
+			return
+		self.epoch[network] = self.epoch.get(network, 0) + 1
+		journal = self.journal.get(network) or deque()
+		balances = self.balances.get(network)
+		while journal and journal[-1][0] >= from_block:
+			_, key, delta = journal.pop()
+			if balances is not None and network in self.seeded:
+				balances[key] = balances.get(key, 0) - delta
+				self.dirty.setdefault(network, set()).add(key)
+		self.floor[network] = min(self.floor[network], from_block - 1)
+		if self.seeded.get(network, -1) >= from_block:
+			del self.seeded[network]
+			self.balances.pop(network, None)
+
+	def forget(self, network: str) -> None:
+		# another worker ingested the network meanwhile: start over from a fresh seed when it comes back
+		self.epoch[network] = self.epoch.get(network, 0) + 1
+		for state in (self.balances, self.floor, self.seeded, self.journal, self.dirty, self.written, self.reconciled_at):
+			state.pop(network, None)
+
+	def _deltas_after(self, network: str, block: int) -> Dict[Key, int]:
+		out: Dict[Key, int] = {}
+		for journal_block, key, delta in self.journal.get(network) or ():
+			if journal_block > block:
+				out[key] = out.get(key, 0) + delta
+		return out
+
+	async def _snapshot(self, network: str, rpc: RpcClient, block: int) -> Dict[Key, int]:
+		targets = self.targets(network)
+		results = await aggregate3(rpc, [(address, balance_of_calldata(wallet)) for _, address, wallet in targets], block=block)
+		return {
+			(token, wallet): int.from_bytes(data[:32], "big")
+			for (token, _, wallet), data in zip(targets, results)
+			if data is not None and len(data) >= 32
+		}
+
+	async def seed(self, network: str, rpc: RpcClient) -> None:
+		block = max(await rpc.block_number(), self.floor.get(network, -1))
+		epoch = self.epoch.get(network, 0)
+		self._pinned[network] = min(block, self.floor.get(network, block))
+		try:
+			snapshot = await self._snapshot(network, rpc, block)
+		finally:
+			self._pinned.pop(network, None)
+		if epoch != self.epoch.get(network, 0):
+			return
+		# Transfers ingested above the snapshot block while it was being read are already journaled
+		for key, delta in self._deltas_after(network, block).items():
+			snapshot[key] = snapshot.get(key, 0) + delta
+		self.balances[network] = snapshot
+		self.seeded[network] = block
+		self.floor[network] = max(self.floor.get(network, -1), block)
+		self.dirty[network] = set(snapshot)
+		self.reconciled_at[network] = time.monotonic()
+
+	async def reconcile(self, network: str, rpc: RpcClient) -> int:
+		# re-read every balance at the block the ledger currently reflects and correct any drift
+		# (balance changes without a Transfer event such as USDT's destroyBlackFunds, missed logs)
+		block = self.floor[network]
+		epoch = self.epoch.get(network, 0)
+		self._pinned[network] = block
+		try:
+			snapshot = await self._snapshot(network, rpc, block)
+		finally:
+			self._pinned.pop(network, None)
+		self.reconciled_at[network] = time.monotonic()
+		balances = self.balances.get(network)
+		if epoch != self.epoch.get(network, 0) or balances is None:
+			return 0
+		later = self._deltas_after(network, block)
+		drifted = 0
+		for key, actual in snapshot.items():
+			current = balances.get(key, 0)
+			drift = actual - (current - later.get(key, 0))
+			if drift:
+				balances[key] = current + drift
+				self.dirty.setdefault(network, set()).add(key)
+				drifted += 1
+		if drifted:
+			metrics.ledger_drift.inc(drifted, network=network)
+		return drifted
+
+	def reconcile_due(self, network: str) -> bool:
+		return time.monotonic() - self.reconciled_at.get(network, 0.0) >= settings.BALANCE_RECONCILE_SEC
+
+	def take_changes(self, network: str) -> Tuple[List[Dict[str, Any]], Set[Key]]:
+		# rows for balances that moved since the last successful write; hand the keys back via
+		# restore() if the write fails
+		keys = self.dirty.get(network) or set()
+		self.dirty[network] = set()
+		balances = self.balances.get(network) or {}
+		written = self.written.setdefault(network, {})
+		meta = {token: (address, scale) for token, address, scale in decoder.tokens.get(network, {}).values()}
+		rows: List[Dict[str, Any]] = []
+		for token, wallet in keys:
+			raw = balances.get((token, wallet))
+			if raw is None or token not in meta or written.get((token, wallet)) == raw:
+				continue
+			written[(token, wallet)] = raw
+			address, scale = meta[token]
+			rows.append({
+				"wallet_address": self.wallets[wallet],
+				"network": network,
+				"token": token,
+				"token_address": address,
+				"balance": raw / scale,
+				"balance_raw": raw,
+			})
+		return rows, keys
+
+	def restore(self, network: str, keys: Set[Key]) -> None:
+		written = self.written.get(network) or {}
+		for key in keys:
+			written.pop(key, None)
+		self.dirty.setdefault(network, set()).update(keys)
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"active": self.active,
+			"wallets": len(self.wallets),
+			"seeded_at": dict(self.seeded),
+			"floor": dict(self.floor),
+			"journal": {network: len(journal) for network, journal in self.journal.items()},
+		}
+
+
+ledger = BalanceLedger(settings.TRACKED_WALLETS)
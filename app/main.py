@@ -1,12 +1,19 @@
 import asyncio
-from fastapi import FastAPI
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi import Depends, FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
+from app import archive, cache, hotstore, ledger, metrics, pubsub, sinks
+from app.leases import leases
 from app.config import settings
 from app.db import init_db_pool, close_db_pool
-from app.routers import router as api_router
+from app.auth import flush_usage, require_api_key, run_usage_flusher
+from app.routers import router as api_router, ws_router
 from app.etl import start_background_workers
-from app.supabase_client import init_supabase_client
+from app.supabase_client import close_supabase_client, init_supabase_client
 
 app = FastAPI(title="Stablecoin Analytics API", version="1.0.0")
 
@@ -18,25 +25,97 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
+# endpoint function -> route template, so metrics are labelled /v1/wallets/{wallet_address}/... and
+# not per wallet
+_route_templates: Dict[Callable[..., Any], str] = {}
+# the in-process ETL's tasks (and the task starting them), stopped on shutdown before the sink closes
+_etl_tasks: List[asyncio.Task] = []
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next: Callable[[Request], Any]) -> Response:
+	started = time.perf_counter()
+	status = 500
+	try:
+		response = await call_next(request)
+		status = response.status_code
+		return response
+	finally:
+		endpoint = request.scope.get("endpoint")
+		if endpoint is not None and not _route_templates:
+			_route_templates.update({route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")})
+		route = _route_templates.get(endpoint, "unmatched")
+		metrics.http_seconds.observe(time.perf_counter() - started, method=request.method, route=route, status=str(status))
+
+
+async def start_etl() -> None:
+	_etl_tasks.extend(await start_background_workers())
+
 
 @app.on_event("startup")
 async def on_startup() -> None:
 	# REST-only mode: initialize Supabase REST client
 	init_supabase_client()
-	# optional: skip direct DB pool when REST mode is used
-	# await init_db_pool()
-	asyncio.create_task(start_background_workers())
+	# the asyncpg pool is only opened by the ETL when ETL_WRITE_BACKEND=copy
+	asyncio.create_task(run_usage_flusher())
+	# with ETL_RUN_IN_API=false the ETL runs as `python -m app.worker` and reads fall back to REST
+	if settings.ETL_RUN_IN_API:
+		_etl_tasks.append(asyncio.create_task(start_etl()))
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-	# await close_db_pool()
-	pass
+	# stop ingesting first, so nothing is put into the sink after its final flush
+	for task in list(_etl_tasks):
+		task.cancel()
+	await asyncio.gather(*_etl_tasks, return_exceptions=True)
+	await flush_usage()
+	await sinks.close_sink()
+	await archive.close_archive()
+	if settings.ETL_RUN_IN_API:
+		await leases.release_all()
+	# no-op unless ETL_WRITE_BACKEND=copy opened the pool
+	await close_db_pool()
+	await close_supabase_client()
 
 
 @app.get("/")
 async def health():
-	return {"status": "ok", "env": settings.ENV}
+	return {
+		"status": "ok",
+		"env": settings.ENV,
+		"write_buffer": sinks.buffer.stats() if sinks.buffer else None,
+		"stream": pubsub.broker.stats(),
+		"hotstore": hotstore.store.stats(),
+		"archive": archive.writer.stats() if archive.writer else None,
+		"balance_ledger": ledger.ledger.stats(),
+		"etl_leases": leases.stats(),
+	}
+
+
+@app.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+	return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def collect_gauges() -> None:
+	if sinks.buffer:
+		metrics.buffer_depth.set(sinks.buffer.depth)
+	metrics.stream_subscribers.set(len(pubsub.broker.subscribers))
+	for result in ("hits", "misses", "coalesced"):
+		metrics.cache_lookups.set(getattr(cache.response_cache, result), result=result)
+
+
+metrics.registry.collectors.append(collect_gauges)
+
+if settings.PROFILER_ENABLED:
+	from app.profiler import profiler
+
+	@app.get("/debug/profile", dependencies=[Depends(require_api_key)])
+	async def profile(seconds: float = Query(default=10, gt=0), all_threads: bool = Query(default=False)) -> PlainTextResponse:
+		# collapsed stacks ("frame;frame;frame count"), ready for flamegraph.pl or speedscope
+		return PlainTextResponse(await profiler.capture(seconds, event_loop_only=not all_threads))
 
 
 app.include_router(api_router)
+app.include_router(ws_router)
@@ -0,0 +1,163 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+# Minimal Prometheus text-format (0.0.4) registry: labelled counters, gauges and histograms, rendered
+# on scrape. Label values are keyed by position, so every call site passes the same label names.
+
+M = TypeVar("M", bound="Metric")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+	parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+	if extra:
+		parts.append(extra)
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+	if value == float("inf"):
+		return "+Inf"
+	return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+	kind = "untyped"
+
+	def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+		self.name = name
+		self.help = help
+		self.label_names = tuple(labels)
+
+	def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+		return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+	def samples(self) -> List[str]:
+		raise NotImplementedError
+
+	def render(self) -> List[str]:
+		return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+	kind = "counter"
+
+	def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+		super().__init__(name, help, labels)
+		self.values: Dict[Tuple[str, ...], float] = {}
+
+	def inc(self, amount: float = 1, **labels: str) -> None:
+		key = self._key(labels)
+		self.values[key] = self.values.get(key, 0) + amount
+
+	def samples(self) -> List[str]:
+		return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+	kind = "gauge"
+
+	def set(self, value: float, **labels: str) -> None:
+		self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+		super().__init__(name, help, labels)
+		self.buckets = tuple(sorted(buckets))
+		# per label set: (per-bucket counts, sum, count)
+		self.values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+	def observe(self, value: float, **labels: str) -> None:
+		key = self._key(labels)
+		entry = self.values.get(key)
+		counts, total, count = entry if entry else ([0] * len(self.buckets), 0.0, 0)
+		for i, bound in enumerate(self.buckets):
+			if value <= bound:
+				counts[i] += 1
+				break
+		self.values[key] = (counts, total + value, count + 1)
+
+	@contextmanager
+	def time(self, **labels: str) -> Iterator[None]:
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - started, **labels)
+
+	def samples(self) -> List[str]:
+		out: List[str] = []
+		for key, (counts, total, count) in self.values.items():
+			cumulative = 0
+			for bound, n in zip(self.buckets, counts):
+				cumulative += n
+				le = 'le="%s"' % _number(bound)
+				out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+			le = 'le="+Inf"'
+			out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+			out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+			out.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+		return out
+
+
+class Registry:
+	def __init__(self) -> None:
+		self.metrics: List[Metric] = []
+		# called before each render, for gauges read from live objects (buffers, caches)
+		self.collectors: List[Callable[[], None]] = []
+
+	def register(self, metric: M) -> M:
+		self.metrics.append(metric)
+		return metric
+
+	def render(self) -> str:
+		for collect in self.collectors:
+			try:
+				collect()
+			except Exception:
+				errors.inc(source="collector")
+		return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+# ETL
+head_lag = registry.register(Gauge("etl_head_lag_blocks", "Blocks between the chain head and the ingestion cursor", ("network",)))
+stage_seconds = registry.register(Histogram("etl_stage_seconds", "ETL stage latency (get_logs, blocks, receipts, decode)", ("network", "stage")))
+sink_write_seconds = registry.register(Histogram("etl_sink_write_seconds", "Write-behind buffer flush latency per table (upserts / COPY)", ("table",)))
+rows_ingested = registry.register(Counter("etl_rows_total", "Rows produced by the ETL", ("network", "token", "table")))
+ledger_drift = registry.register(Counter("ledger_drift_total", "Tracked balances corrected by a ledger reconciliation", ("network",)))
+balance_points_compacted = registry.register(Counter("balance_points_compacted_total", "wallet_balances points folded into coarser buckets", ("resolution",)))
+lease_held = registry.register(Gauge("etl_lease_held", "1 while this process holds the named ETL lease (a network or maintenance)", ("name",)))
+range_splits = registry.register(Counter("etl_range_splits_total", "Live block ranges halved after the provider rejected them as too wide", ("network",)))
+loop_errors = registry.register(Counter("etl_loop_errors_total", "Exceptions swallowed by background loops", ("loop", "network", "table", "error")))
+
+# RPC / Supabase transport
+rpc_requests = registry.register(Counter("rpc_requests_total", "JSON-RPC HTTP requests (a batch counts once, as method=batch)", ("network", "method")))
+rpc_seconds = registry.register(Histogram("rpc_request_seconds", "JSON-RPC HTTP request latency", ("network", "method")))
+rpc_errors = registry.register(Counter("rpc_errors_total", "Failed JSON-RPC calls by kind (http, transport, rpc)", ("network", "method", "kind")))
+rpc_hedges = registry.register(Counter("rpc_hedged_total", "Slow idempotent reads raced against a second endpoint", ("network", "method")))
+rpc_throttled = registry.register(Counter("rpc_throttled_total", "Rate-limit answers (HTTP 429 or JSON-RPC limit errors) per endpoint", ("network", "endpoint")))
+rpc_endpoint_latency = registry.register(Gauge("rpc_endpoint_latency_seconds", "EWMA request latency per endpoint and method", ("network", "endpoint", "method")))
+rpc_endpoint_error_rate = registry.register(Gauge("rpc_endpoint_error_rate", "EWMA failure rate per endpoint", ("network", "endpoint")))
+rpc_endpoint_concurrency = registry.register(Gauge("rpc_endpoint_concurrency_limit", "Adaptive in-flight request limit per endpoint", ("network", "endpoint")))
+supabase_retries = registry.register(Counter("supabase_retries_total", "PostgREST requests retried", ("method", "table", "reason")))
+supabase_errors = registry.register(Counter("supabase_errors_total", "PostgREST requests that failed after retries", ("method", "table")))
+
+# API (gauges are refreshed by a collector registered in app.main)
+http_seconds = registry.register(Histogram("http_request_seconds", "API request latency by route template", ("method", "route", "status")))
+buffer_depth = registry.register(Gauge("etl_write_buffer_depth", "Rows queued or in flight in the write-behind buffer"))
+stream_subscribers = registry.register(Gauge("stream_subscribers", "Connected live feed subscribers"))
+cache_lookups = registry.register(Gauge("live_cache_lookups", "Live endpoint cache lookups by result", ("result",)))
+
+# internal
+errors = registry.register(Counter("metrics_errors_total", "Errors raised while collecting metrics", ("source",)))
@@ -37,6 +37,36 @@ SCHEMA_SQL = {
 		fetched_at TIMESTAMP NOT NULL DEFAULT now()
 	);
 	CREATE INDEX IF NOT EXISTS idx_balances_wallet_time ON wallet_balances(wallet_address, fetched_at DESC);
+	CREATE INDEX IF NOT EXISTS idx_balances_time ON wallet_balances(fetched_at);
+	""",
+	"wallet_balances_latest": """
+	CREATE TABLE IF NOT EXISTS wallet_balances_latest (
+		wallet_address TEXT NOT NULL,
+		network TEXT NOT NULL,
+		token TEXT NOT NULL,
+		token_address TEXT NOT NULL,
+		balance NUMERIC NOT NULL,
+		balance_raw TEXT,
+		fetched_at TIMESTAMP NOT NULL DEFAULT now(),
+		PRIMARY KEY (wallet_address, network, token)
+	);
+	""",
+	"wallet_balance_history": """
+	CREATE TABLE IF NOT EXISTS wallet_balance_history (
+		id BIGSERIAL PRIMARY KEY,
+		wallet_address TEXT NOT NULL,
+		network TEXT NOT NULL,
+		token TEXT NOT NULL,
+		token_address TEXT NOT NULL,
+		resolution TEXT NOT NULL,
+		bucket TIMESTAMP NOT NULL,
+		balance NUMERIC NOT NULL,
+		balance_min NUMERIC NOT NULL,
+		balance_max NUMERIC NOT NULL,
+		last_at TIMESTAMP NOT NULL,
+		UNIQUE (wallet_address, network, token, resolution, bucket)
+	);
+	CREATE INDEX IF NOT EXISTS idx_balance_history_bucket ON wallet_balance_history(resolution, bucket);
 	""",
 	"whale_transfers": """
 	CREATE TABLE IF NOT EXISTS whale_transfers (
@@ -68,9 +98,128 @@ SCHEMA_SQL = {
 		token TEXT,
 		total_sent NUMERIC,
 		total_received NUMERIC,
+		total_volume NUMERIC,
 		last_updated TIMESTAMP DEFAULT now()
 	);
+	-- tables created before the ETL upserted into this one: add the ranking column, drop duplicate
+	-- wallets (keeping the newest row) and add the key the upserts resolve conflicts on
+	ALTER TABLE whale_top_wallets ADD COLUMN IF NOT EXISTS total_volume NUMERIC;
+	DELETE FROM whale_top_wallets a USING whale_top_wallets b
+	WHERE a.network IS NOT DISTINCT FROM b.network AND a.token IS NOT DISTINCT FROM b.token
+		AND a.wallet_address IS NOT DISTINCT FROM b.wallet_address AND a.id < b.id;
+	CREATE UNIQUE INDEX IF NOT EXISTS uq_whale_top_wallet ON whale_top_wallets(network, token, wallet_address);
 	CREATE INDEX IF NOT EXISTS idx_whale_top_token ON whale_top_wallets(token);
+	CREATE INDEX IF NOT EXISTS idx_whale_top_volume ON whale_top_wallets(total_volume DESC);
+	""",
+	"transfer_rollups": """
+	CREATE TABLE IF NOT EXISTS transfer_rollups (
+		resolution TEXT NOT NULL,
+		bucket TIMESTAMP NOT NULL,
+		network TEXT NOT NULL,
+		token TEXT NOT NULL,
+		transfer_count BIGINT NOT NULL,
+		volume NUMERIC NOT NULL,
+		whale_count BIGINT NOT NULL,
+		gas_used_sum NUMERIC NOT NULL,
+		gas_fee_sum NUMERIC NOT NULL,
+		updated_at TIMESTAMP NOT NULL DEFAULT now(),
+		PRIMARY KEY (resolution, network, token, bucket)
+	);
+	CREATE INDEX IF NOT EXISTS idx_rollups_bucket ON transfer_rollups(resolution, bucket);
+	-- recomputes the minute buckets overlapping [p_from, p_to] from the rows underneath them, then the
+	-- hours and days containing them from the stored minutes and hours, so calling it again for the same
+	-- range (or after a reorg delete) is always safe. An hour is only rebuilt from complete minutes: the
+	-- caller widens ranges older than the minute retention to whole hours.
+	CREATE OR REPLACE FUNCTION refresh_transfer_rollups(p_network TEXT, p_from TIMESTAMP, p_to TIMESTAMP)
+	RETURNS void LANGUAGE plpgsql AS $$
+	DECLARE
+		minute_lo TIMESTAMP := date_trunc('minute', p_from);
+		minute_hi TIMESTAMP := date_trunc('minute', p_to) + interval '1 minute';
+		hour_lo TIMESTAMP := date_trunc('hour', p_from);
+		hour_hi TIMESTAMP := date_trunc('hour', p_to) + interval '1 hour';
+		day_lo TIMESTAMP := date_trunc('day', p_from);
+		day_hi TIMESTAMP := date_trunc('day', p_to) + interval '1 day';
+	BEGIN
+		DELETE FROM transfer_rollups
+		WHERE resolution = 'minute' AND network = p_network AND bucket >= minute_lo AND bucket < minute_hi;
+		INSERT INTO transfer_rollups (resolution, bucket, network, token, transfer_count, volume, whale_count, gas_used_sum, gas_fee_sum)
+		SELECT 'minute', t.bucket, p_network, t.token, t.transfer_count, t.volume, coalesce(w.whale_count, 0), t.gas_used_sum, t.gas_fee_sum
+		FROM (
+			SELECT date_trunc('minute', block_timestamp) AS bucket, token, count(*) AS transfer_count,
+				coalesce(sum(amount), 0) AS volume, coalesce(sum(gas_used), 0) AS gas_used_sum, coalesce(sum(gas_fee), 0) AS gas_fee_sum
+			FROM stablecoin_transfers
+			WHERE network = p_network AND block_timestamp >= minute_lo AND block_timestamp < minute_hi
+			GROUP BY 1, 2
+		) t
+		LEFT JOIN (
+			SELECT date_trunc('minute', block_timestamp) AS bucket, token, count(*) AS whale_count
+			FROM whale_transfers
+			WHERE network = p_network AND block_timestamp >= minute_lo AND block_timestamp < minute_hi
+			GROUP BY 1, 2
+		) w ON w.bucket = t.bucket AND w.token = t.token;
+
+		DELETE FROM transfer_rollups
+		WHERE resolution = 'hour' AND network = p_network AND bucket >= hour_lo AND bucket < hour_hi;
+		INSERT INTO transfer_rollups (resolution, bucket, network, token, transfer_count, volume, whale_count, gas_used_sum, gas_fee_sum)
+		SELECT 'hour', date_trunc('hour', bucket), p_network, token, sum(transfer_count), sum(volume), sum(whale_count), sum(gas_used_sum), sum(gas_fee_sum)
+		FROM transfer_rollups
+		WHERE resolution = 'minute' AND network = p_network AND bucket >= hour_lo AND bucket < hour_hi
+		GROUP BY 2, 4;
+
+		DELETE FROM transfer_rollups
+		WHERE resolution = 'day' AND network = p_network AND bucket >= day_lo AND bucket < day_hi;
+		INSERT INTO transfer_rollups (resolution, bucket, network, token, transfer_count, volume, whale_count, gas_used_sum, gas_fee_sum)
+		SELECT 'day', date_trunc('day', bucket), p_network, token, sum(transfer_count), sum(volume), sum(whale_count), sum(gas_used_sum), sum(gas_fee_sum)
+		FROM transfer_rollups
+		WHERE resolution = 'hour' AND network = p_network AND bucket >= day_lo AND bucket < day_hi
+		GROUP BY 2, 4;
+	END;
+	$$;
+	""",
+	"etl_cursors": """
+	CREATE TABLE IF NOT EXISTS etl_cursors (
+		network TEXT PRIMARY KEY,
+		block_number BIGINT NOT NULL,
+		block_hash TEXT,
+		updated_at TIMESTAMP DEFAULT now()
+	);
+	""",
+	"etl_leases": """
+	CREATE TABLE IF NOT EXISTS etl_leases (
+		name TEXT PRIMARY KEY,
+		owner TEXT NOT NULL,
+		expires_at TIMESTAMP NOT NULL,
+		updated_at TIMESTAMP DEFAULT now()
+	);
+	-- grants the lease if it is free, expired or already held by p_owner; expiry uses the database clock
+	CREATE OR REPLACE FUNCTION acquire_etl_lease(p_name TEXT, p_owner TEXT, p_ttl_sec DOUBLE PRECISION)
+	RETURNS boolean LANGUAGE plpgsql AS $$
+	DECLARE
+		granted TEXT;
+	BEGIN
+		INSERT INTO etl_leases (name, owner, expires_at, updated_at)
+		VALUES (p_name, p_owner, (now() AT TIME ZONE 'utc') + make_interval(secs => p_ttl_sec), now())
+		ON CONFLICT (name) DO UPDATE
+			SET owner = excluded.owner, expires_at = excluded.expires_at, updated_at = now()
+			WHERE etl_leases.owner = excluded.owner OR etl_leases.expires_at < (now() AT TIME ZONE 'utc')
+		RETURNING owner INTO granted;
+		RETURN granted IS NOT NULL;
+	END;
+	$$;
+	CREATE OR REPLACE FUNCTION release_etl_lease(p_name TEXT, p_owner TEXT)
+	RETURNS void LANGUAGE sql AS $$
+		DELETE FROM etl_leases WHERE name = p_name AND owner = p_owner;
+	$$;
+	""",
+	"etl_backfill_shards": """
+	CREATE TABLE IF NOT EXISTS etl_backfill_shards (
+		job_id TEXT NOT NULL,
+		shard_start BIGINT NOT NULL,
+		shard_end BIGINT NOT NULL,
+		next_block BIGINT NOT NULL,
+		updated_at TIMESTAMP DEFAULT now(),
+		PRIMARY KEY (job_id, shard_start)
+	);
 	""",
 	"api_keys": """
 	CREATE TABLE IF NOT EXISTS api_keys (
@@ -80,6 +229,14 @@ SCHEMA_SQL = {
 		created_at TIMESTAMP,
 		usage_count INT
 	);
+	-- adds {"<api_keys.id>": requests, ...} to usage_count in one statement, so concurrent API
+	-- processes never overwrite each other's counts
+	CREATE OR REPLACE FUNCTION increment_api_key_usage(p_counts JSONB)
+	RETURNS void LANGUAGE sql AS $$
+		UPDATE api_keys SET usage_count = COALESCE(api_keys.usage_count, 0) + c.value::INT
+		FROM jsonb_each_text(p_counts) AS c
+		WHERE api_keys.id = c.key::INT;
+	$$;
 	""",
 }
 
@@ -140,3 +297,9 @@ STABLECOINS: Dict[str, Dict[str, Tuple[str, int]]] = {
 		"Ethereum": ("0x6c3ea9036406852006290770BEdFcAbA0e23A0e8", 6),
 	},
 }
+
+# network -> lowercased token address -> (token, address, decimals), so logs can be routed by emitter
+TOKENS_BY_ADDRESS: Dict[str, Dict[str, Tuple[str, str, int]]] = {}
+for _token, _per_network in STABLECOINS.items():
+	for _network, (_address, _decimals) in _per_network.items():
+		TOKENS_BY_ADDRESS.setdefault(_network, {})[_address.lower()] = (_token, _address, _decimals)
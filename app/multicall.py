@@ -0,0 +1,41 @@
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+from app.config import settings
+from app.rpc import RpcClient
+
+AGGREGATE3_SELECTOR = Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+
+
+def encode_aggregate3(calls: Sequence[Tuple[str, str]]) -> str:
+	# calls are (target, calldata hex); every call may fail without reverting the batch
+	payload = [(target.lower(), True, bytes.fromhex(data[2:] if data.startswith("0x") else data)) for target, data in calls]
+	return "0x" + (AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [payload])).hex()
+
+
+def decode_aggregate3(result: str) -> List[Tuple[bool, bytes]]:
+	(decoded,) = decode(["(bool,bytes)[]"], bytes.fromhex(result[2:]))
+	return [(bool(success), bytes(data)) for success, data in decoded]
+
+
+async def aggregate3(
+	rpc: RpcClient,
+	calls: Sequence[Tuple[str, str]],
+	chunk_size: Optional[int] = None,
+	block: Optional[int] = None,
+) -> List[Optional[bytes]]:
+	# one eth_call per chunk through Multicall3; failed sub-calls come back as None. Every chunk reads
+	# the same block when one is given, so a multi-chunk snapshot is consistent.
+	block_tag = hex(block) if block is not None else "latest"
+	chunk_size = max(1, chunk_size or settings.MULTICALL_CHUNK_SIZE)
+	chunks = [calls[i:i + chunk_size] for i in range(0, len(calls), chunk_size)]
+
+	async def run(chunk: Sequence[Tuple[str, str]]) -> List[Optional[bytes]]:
+		result = await rpc.call("eth_call", [{"to": settings.MULTICALL3_ADDRESS, "data": encode_aggregate3(chunk)}, block_tag])
+		return [data if success else None for success, data in decode_aggregate3(result)]
+
+	results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+	return [item for chunk in results for item in chunk]
@@ -0,0 +1,49 @@
+import asyncio
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config import settings
+
+
+def _collapse(frame) -> str:
+	# root-first "file:function;file:function" as consumed by flamegraph.pl / speedscope
+	names = []
+	while frame is not None:
+		code = frame.f_code
+		names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+		frame = frame.f_back
+	return ";".join(reversed(names))
+
+
+# Wall-clock sampling profiler: a helper thread snapshots every other thread's stack at a fixed
+# interval and counts identical stacks. Nothing is installed while no capture is running.
+class SamplingProfiler:
+	def __init__(self, interval_sec: float) -> None:
+		self.interval_sec = max(0.001, interval_sec)
+		self._lock = asyncio.Lock()
+
+	def _sample(self, seconds: float, thread_id: Optional[int]) -> Dict[str, int]:
+		me = threading.get_ident()
+		counts: Dict[str, int] = {}
+		deadline = time.monotonic() + seconds
+		while time.monotonic() < deadline:
+			for ident, frame in sys._current_frames().items():
+				if ident == me or (thread_id is not None and ident != thread_id):
+					continue
+				stack = _collapse(frame)
+				counts[stack] = counts.get(stack, 0) + 1
+			time.sleep(self.interval_sec)
+		return counts
+
+	async def capture(self, seconds: float, event_loop_only: bool = True) -> str:
+		seconds = min(seconds, settings.PROFILER_MAX_SEC)
+		# one capture at a time; overlapping samplers would only skew each other
+		async with self._lock:
+			thread_id = threading.get_ident() if event_loop_only else None
+			counts = await asyncio.to_thread(self._sample, seconds, thread_id)
+		return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+profiler = SamplingProfiler(settings.PROFILER_INTERVAL_SEC)
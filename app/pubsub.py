@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from app.config import settings
+from app.enrich import LRUCache
+from app.utils import network_name
+
+
+# One live feed consumer. The bounded queue is the only buffer: a client that can't keep up is
+# dropped instead of growing memory or slowing the ETL.
+class Subscription:
+	def __init__(
+		self,
+		kinds: Set[str],
+		network: Optional[str],
+		token: Optional[str],
+		address: Optional[str],
+		maxsize: int,
+	) -> None:
+		self.kinds = kinds
+		# rows carry the NETWORKS key and upper-case token symbols; accept any casing of either
+		self.network = network_name(network) if network else None
+		self.token = token.upper() if token else None
+		self.address = address.lower() if address else None
+		self.queue: "asyncio.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = asyncio.Queue(maxsize=max(1, maxsize))
+		self.dropped = False
+
+	def matches(self, kind: str, row: Dict[str, Any]) -> bool:
+		if kind not in self.kinds:
+			return False
+		if self.network and row.get("network") != self.network:
+			return False
+		if self.token and row.get("token") != self.token:
+			return False
+		if self.address and self.address not in (
+			str(row.get("from_address") or "").lower(),
+			str(row.get("to_address") or "").lower(),
+		):
+			return False
+		return True
+
+	async def get(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+		# None means the subscription was dropped
+		return await self.queue.get()
+
+
+class Broker:
+	def __init__(self, queue_size: int) -> None:
+		self.queue_size = queue_size
+		self.subscribers: Set[Subscription] = set()
+		self.published = 0
+		self.dropped = 0
+		# window re-scans and reorg replays re-deliver rows; subscribers see each one once
+		self._seen = LRUCache(settings.STREAM_SEEN_CACHE_SIZE)
+
+	def subscribe(
+		self,
+		kinds: Iterable[str],
+		network: Optional[str] = None,
+		token: Optional[str] = None,
+		address: Optional[str] = None,
+	) -> Subscription:
+		sub = Subscription(set(kinds), network, token, address, self.queue_size)
+		self.subscribers.add(sub)
+		return sub
+
+	def unsubscribe(self, sub: Subscription) -> None:
+		self.subscribers.discard(sub)
+
+	def _drop(self, sub: Subscription) -> None:
+		self.subscribers.discard(sub)
+		sub.dropped = True
+		self.dropped += 1
+		while not sub.queue.empty():
+			sub.queue.get_nowait()
+		sub.queue.put_nowait(None)
+
+	def stats(self) -> Dict[str, int]:
+		return {"subscribers": len(self.subscribers), "published": self.published, "dropped": self.dropped}
+
+	def publish(self, kind: str, rows: Iterable[Dict[str, Any]]) -> None:
+		if not self.subscribers:
+			return
+		for row in rows:
+			seen_key = (kind, row.get("tx_hash"), row.get("log_index"))
+			if seen_key in self._seen:
+				continue
+			self._seen.put(seen_key, True)
+			self.published += 1
+			for sub in list(self.subscribers):
+				if not sub.matches(kind, row):
+					continue
+				try:
+					sub.queue.put_nowait((kind, row))
+				except asyncio.QueueFull:
+					self._drop(sub)
+
+
+broker = Broker(settings.STREAM_QUEUE_SIZE)
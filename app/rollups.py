@@ -0,0 +1,212 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app import cache, metrics, sinks, supabase_client
+from app.config import settings
+
+# transfer_rollups holds per (network, token) counts, volume, whale counts and gas sums in minute, hour
+# and day buckets. Buckets are never incremented: refresh_transfer_rollups (see SCHEMA_SQL) recomputes
+# the minutes of a dirty time range from the rows underneath them and folds them up into their hours
+# and days, so replayed batches, window re-scans and reorg deletes all converge to the same totals.
+RESOLUTIONS = ("minute", "hour", "day")
+STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+SUM_COLUMNS = ("transfer_count", "volume", "whale_count", "gas_used_sum", "gas_fee_sum")
+PAGE_SIZE = 1000
+# dirty ranges closer than this are refreshed as one
+MERGE_GAP = timedelta(minutes=1)
+
+
+def floor_to(ts: datetime, resolution: str) -> datetime:
+	if resolution == "day":
+		return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+	if resolution == "hour":
+		return ts.replace(minute=0, second=0, microsecond=0)
+	return ts.replace(second=0, microsecond=0)
+
+
+def ceil_to(ts: datetime, resolution: str) -> datetime:
+	floored = floor_to(ts, resolution)
+	return floored if floored == ts else floored + STEPS[resolution]
+
+
+def _naive_utc(value: str) -> datetime:
+	ts = datetime.fromisoformat(value)
+	return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def minute_cutoff(now: Optional[datetime] = None) -> datetime:
+	# minute buckets before this may have been pruned; their hours and days are kept
+	now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+	return now - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS)
+
+
+# Time ranges per network whose rollups are stale. Ranges are recorded after the rows were handed to
+# the write-behind buffer, so a barrier taken after take() covers every row behind them. Recent block
+# timestamps are remembered so a reorg can mark the orphaned blocks' minutes dirty.
+class RollupTracker:
+	def __init__(self) -> None:
+		self.dirty: Dict[str, List[Tuple[datetime, datetime]]] = {}
+		self.blocks: Dict[str, Deque[Tuple[int, datetime]]] = {}
+
+	def _mark(self, network: str, lo: datetime, hi: datetime) -> None:
+		ranges = sorted(self.dirty.get(network, []) + [(lo, hi)])
+		merged: List[Tuple[datetime, datetime]] = []
+		for start, end in ranges:
+			if merged and start <= merged[-1][1] + MERGE_GAP:
+				merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+			else:
+				merged.append((start, end))
+		self.dirty[network] = merged
+
+	def touch(self, network: str, rows: Iterable[Dict[str, Any]]) -> None:
+		# one timestamp per block; ISO strings with the same offset order like the times they encode
+		per_block: Dict[int, str] = {}
+		for row in rows:
+			per_block[row["block_number"]] = row["block_timestamp"]
+		if not per_block:
+			return
+		self._mark(network, _naive_utc(min(per_block.values())), _naive_utc(max(per_block.values())))
+		recent = self.blocks.setdefault(network, deque())
+		for block in sorted(per_block):
+			if not recent or block > recent[-1][0]:
+				recent.append((block, _naive_utc(per_block[block])))
+		while recent and recent[0][0] <= recent[-1][0] - settings.ETL_REORG_MAX_DEPTH:
+			recent.popleft()
+
+	def rollback(self, network: str, from_block: int) -> None:
+		recent = self.blocks.get(network)
+		orphaned: List[datetime] = []
+		while recent and recent[-1][0] >= from_block:
+			orphaned.append(recent.pop()[1])
+		if orphaned:
+			self._mark(network, min(orphaned), max(orphaned))
+
+	def take(self) -> Dict[str, List[Tuple[datetime, datetime]]]:
+		pending, self.dirty = self.dirty, {}
+		return pending
+
+	def restore(self, pending: Dict[str, List[Tuple[datetime, datetime]]]) -> None:
+		for network, ranges in pending.items():
+			for lo, hi in ranges:
+				self._mark(network, lo, hi)
+
+
+tracker = RollupTracker()
+
+
+async def flush() -> None:
+	# recompute every dirty range once the rows behind it are durable
+	pending = tracker.take()
+	if not pending:
+		return
+	try:
+		await sinks.buffer.barrier()
+		cutoff = minute_cutoff()
+		for network, ranges in pending.items():
+			with metrics.stage_seconds.time(network=network, stage="rollups"):
+				for lo, hi in ranges:
+					if floor_to(lo, "hour") < cutoff:
+						# old hours may have lost minutes to prune(): recompute them whole
+						lo, hi = floor_to(lo, "hour"), floor_to(hi, "hour") + STEPS["hour"] - STEPS["minute"]
+					# a day per call keeps each recompute well inside the statement timeout during backfills
+					while lo <= hi:
+						chunk_hi = min(hi, floor_to(lo, "day") + STEPS["day"] - STEPS["minute"])
+						await supabase_client.client.rpc("refresh_transfer_rollups", {
+							"p_network": network,
+							"p_from": lo.isoformat(),
+							"p_to": chunk_hi.isoformat(),
+						})
+						lo = floor_to(lo, "day") + STEPS["day"]
+		cache.response_cache.invalidate("transfer_rollups")
+	except BaseException:
+		# cancellation included: nothing is lost, the ranges are simply refreshed next time
+		tracker.restore(pending)
+		raise
+
+
+async def prune(now: Optional[datetime] = None) -> None:
+	# minute buckets are only kept for ROLLUP_MINUTE_RETENTION_DAYS; a bucket refreshed within the last
+	# day (a backfill of old blocks) is left alone rather than deleted right after it was written
+	now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+	await supabase_client.client.delete("transfer_rollups", {
+		"resolution": "eq.minute",
+		"bucket": f"lt.{minute_cutoff(now).isoformat()}",
+		"updated_at": f"lt.{(now - timedelta(days=1)).isoformat()}",
+	})
+
+
+def pick_interval(start: datetime, end: datetime, max_points: int) -> str:
+	# finest resolution that keeps the series within max_points
+	for resolution in RESOLUTIONS:
+		if (end - start) / STEPS[resolution] <= max_points:
+			return resolution
+	return "day"
+
+
+def plan(start: datetime, end: datetime, interval: str, cutoff: Optional[datetime] = None) -> List[Tuple[str, datetime, datetime]]:
+	# covers [start, end) with the coarsest aligned buckets that fit, no coarser than the interval:
+	# whole days in the middle, hours and then minutes towards the edges (bounds round down to minutes).
+	# Before the minute cutoff only hours and days are read, and the bounds there round down to hours.
+	levels = RESOLUTIONS[:RESOLUTIONS.index(interval) + 1]
+
+	def cover(lo: datetime, hi: datetime, levels: Tuple[str, ...], level: int) -> List[Tuple[str, datetime, datetime]]:
+		if lo >= hi:
+			return []
+		resolution = levels[level]
+		if level == 0:
+			return [(resolution, lo, hi)]
+		inner_lo, inner_hi = ceil_to(lo, resolution), floor_to(hi, resolution)
+		if inner_lo >= inner_hi:
+			return cover(lo, hi, levels, level - 1)
+		return cover(lo, inner_lo, levels, level - 1) + [(resolution, inner_lo, inner_hi)] + cover(inner_hi, hi, levels, level - 1)
+
+	start, end = floor_to(start, "minute"), floor_to(end, "minute")
+	if cutoff is None or start >= cutoff:
+		return cover(start, end, levels, len(levels) - 1)
+	split = min(end, ceil_to(cutoff, "hour"))
+	coarse = levels[1:] or ("hour",)
+	return cover(floor_to(start, "hour"), floor_to(split, "hour"), coarse, len(coarse) - 1) + cover(split, end, levels, len(levels) - 1)
+
+
+async def _select_all(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+	rows: List[Dict[str, Any]] = []
+	offset = 0
+	while True:
+		page = await supabase_client.client.select("transfer_rollups", {**params, "limit": PAGE_SIZE, "offset": offset})
+		rows.extend(page)
+		if len(page) < PAGE_SIZE:
+			return rows
+		offset += PAGE_SIZE
+
+
+async def timeseries(start: datetime, end: datetime, interval: str, network: Optional[str], token: Optional[str]) -> List[Dict[str, Any]]:
+	filters: Dict[str, Any] = {"select": "bucket," + ",".join(SUM_COLUMNS), "order": "bucket.asc"}
+	if network:
+		filters["network"] = f"eq.{network}"
+	if token:
+		filters["token"] = f"eq.{token}"
+	points: Dict[datetime, Dict[str, float]] = {}
+	for resolution, lo, hi in plan(start, end, interval, minute_cutoff()):
+		rows = await _select_all({**filters, "resolution": f"eq.{resolution}", "bucket": [f"gte.{lo.isoformat()}", f"lt.{hi.isoformat()}"]})
+		for row in rows:
+			# partial buckets at the edges land in the interval bucket they belong to
+			key = floor_to(_naive_utc(row["bucket"]), interval)
+			point = points.setdefault(key, {column: 0.0 for column in SUM_COLUMNS})
+			for column in SUM_COLUMNS:
+				point[column] += float(row.get(column) or 0)
+	out: List[Dict[str, Any]] = []
+	for bucket in sorted(points):
+		point = points[bucket]
+		count = point["transfer_count"]
+		out.append({
+			"bucket": bucket.isoformat(),
+			"transfer_count": int(count),
+			"volume": point["volume"],
+			"whale_count": int(point["whale_count"]),
+			"gas_used_sum": point["gas_used_sum"],
+			"gas_used_avg": point["gas_used_sum"] / count if count else None,
+			"gas_fee_sum": point["gas_fee_sum"],
+			"gas_fee_avg": point["gas_fee_sum"] / count if count else None,
+		})
+	return out
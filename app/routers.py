@@ -1,16 +1,65 @@
+import asyncio
+import base64
+import csv
+import io
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, Query
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 
-from app.auth import require_api_key
-from app.supabase_client import client
+from app.auth import check_api_key, require_api_key
+from app import aggregates, balances, cache, hotstore, pubsub, rollups, supabase_client
+from app.config import settings
+from app.utils import KEYSET_ORDER_ASC, KEYSET_ORDER_DESC, keyset_after
 
 router = APIRouter(prefix="/v1", dependencies=[Depends(require_api_key)])
+# WebSocket routes can't use the HTTPBearer dependency; they authenticate in the handler
+ws_router = APIRouter(prefix="/v1")
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+	raw = orjson.dumps([row.get("block_timestamp"), row.get("tx_hash"), row.get("log_index")])
+	return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+	try:
+		ts, tx_hash, log_index = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+		return str(ts), str(tx_hash), int(log_index)
+	except Exception:
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(cursor: str, desc: bool) -> str:
+	# rows strictly after the cursor in (block_timestamp, tx_hash, log_index) order
+	return keyset_after(*decode_cursor(cursor), desc=desc)
+
+
+def transfer_filters(token: Optional[str], network: Optional[str], from_: Optional[str], to: Optional[str]) -> Dict[str, Any]:
+	params: Dict[str, Any] = {}
+	if token:
+		params["token"] = f"eq.{token}"
+	if network:
+		params["network"] = f"eq.{network}"
+	bounds: List[str] = []
+	try:
+		if from_:
+			bounds.append(f"gte.{datetime.fromisoformat(from_).isoformat()}")
+		if to:
+			bounds.append(f"lte.{datetime.fromisoformat(to).isoformat()}")
+	except ValueError:
+		raise HTTPException(status_code=400, detail="from/to must be ISO-8601 timestamps")
+	if bounds:
+		# repeated column filters are ANDed by PostgREST, so both bounds apply
+		params["block_timestamp"] = bounds
+	return params
 
 
 @router.get("/transfers")
 async def get_transfers(
+	response: Response,
 	token: Optional[str] = Query(default=None),
 	network: Optional[str] = Query(default=None),
 	from_: Optional[str] = Query(default=None, alias="from"),
@@ -18,31 +67,100 @@ async def get_transfers(
 	live: bool = Query(default=True),
 	window_sec: int = Query(default=5, ge=1, le=600),
 	limit: int = Query(default=500, ge=1, le=2000),
+	cursor: Optional[str] = Query(default=None),
 ) -> List[Dict[str, Any]]:
 	params: Dict[str, Any] = {
-		"order": "block_timestamp.desc",
+		"order": KEYSET_ORDER_DESC,
 		"limit": limit,
 	}
-	if token:
-		params["token"] = f"eq.{token}"
-	if network:
-		params["network"] = f"eq.{network}"
-	if live and not from_ and not to:
-		from_dt = (datetime.now(timezone.utc) - timedelta(seconds=window_sec)).isoformat()
-		params["block_timestamp"] = f"gte.{from_dt}"
-	else:
-		if from_:
-			params["block_timestamp"] = f"gte.{datetime.fromisoformat(from_).isoformat()}"
-		if to:
-			params["block_timestamp"] = f"lte.{datetime.fromisoformat(to).isoformat()}"
-	rows = client.select("stablecoin_transfers", params)
+	if live and not from_ and not to and not cursor:
+		if token:
+			params["token"] = f"eq.{token}"
+		if network:
+			params["network"] = f"eq.{network}"
+
+		since = datetime.now(timezone.utc) - timedelta(seconds=window_sec)
+		if hotstore.store.covers(since.timestamp()):
+			return hotstore.store.recent(since.timestamp(), network, token, limit)
+
+		async def fetch() -> List[Dict[str, Any]]:
+			return await supabase_client.client.select("stablecoin_transfers", {**params, "block_timestamp": f"gte.{since.isoformat()}"})
+		# dashboards poll this from many clients at once; identical queries share one fetch
+		key = ("transfers", token, network, window_sec, limit)
+		return await cache.response_cache.get_or_fetch(key, ("stablecoin_transfers",), fetch)
+
+	params.update(transfer_filters(token, network, from_, to))
+	if cursor:
+		params["or"] = keyset_filter(cursor, desc=True)
+	rows = await supabase_client.client.select("stablecoin_transfers", params)
+	# a page PostgREST cut short at max-rows is full too
+	if rows and len(rows) >= min(limit, settings.SUPABASE_MAX_ROWS):
+		# opaque keyset cursor for the next page; pass it back as ?cursor=
+		response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
 	return rows
 
 
+@router.get("/transfers/export")
+async def export_transfers(
+	token: Optional[str] = Query(default=None),
+	network: Optional[str] = Query(default=None),
+	from_: Optional[str] = Query(default=None, alias="from"),
+	to: Optional[str] = Query(default=None),
+	format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+	chunk_size: int = Query(default=5000, ge=100, le=10000),
+) -> StreamingResponse:
+	base = transfer_filters(token, network, from_, to)
+
+	async def pages() -> AsyncIterator[List[Dict[str, Any]]]:
+		# keyset walk in ascending order: one page in memory at a time, no offset rescans. Only an
+		# empty page ends it, since PostgREST returns at most max-rows per page whatever chunk_size asks
+		cursor: Optional[str] = None
+		while True:
+			params: Dict[str, Any] = {**base, "order": KEYSET_ORDER_ASC, "limit": chunk_size}
+			if cursor:
+				params["or"] = keyset_filter(cursor, desc=False)
+			rows = await supabase_client.client.select("stablecoin_transfers", params)
+			if not rows:
+				return
+			yield rows
+			cursor = encode_cursor(rows[-1])
+
+	async def ndjson() -> AsyncIterator[bytes]:
+		async for rows in pages():
+			yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+	async def csv_rows() -> AsyncIterator[str]:
+		columns: Optional[List[str]] = None
+		async for rows in pages():
+			out = io.StringIO()
+			if columns is None:
+				columns = list(rows[0].keys())
+				writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")
+				writer.writeheader()
+			else:
+				writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")
+			writer.writerows(rows)
+			yield out.getvalue()
+
+	if format == "csv":
+		return StreamingResponse(csv_rows(), media_type="text/csv")
+	return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @router.get("/analytics/global-flows")
-async def global_flows() -> Dict[str, Any]:
-	# Basic aggregates via RPC or views would be ideal; as a simple fallback, fetch limited rows and compute here
-	rows = client.select("stablecoin_transfers", {"order": "block_timestamp.desc", "limit": 5000})
+async def global_flows(window: str = Query(default="1h")) -> Dict[str, Any]:
+	# precomputed by the in-process ETL over the full window
+	if aggregates.aggregator.ready:
+		snapshot = aggregates.aggregator.snapshot(window)
+		if snapshot is None:
+			raise HTTPException(status_code=400, detail=f"Unknown window; configured: {', '.join(aggregates.aggregator.windows)}")
+		return snapshot
+	return await global_flows_sample()
+
+
+async def global_flows_sample() -> Dict[str, Any]:
+	# no ETL in this process: fall back to aggregating the newest rows over REST
+	rows = await supabase_client.client.select("stablecoin_transfers", {"order": "block_timestamp.desc", "limit": 5000})
 	tot_by_network: Dict[str, float] = {}
 	tot_by_token: Dict[str, float] = {}
 	sent: Dict[str, float] = {}
@@ -78,19 +196,98 @@ async def global_flows() -> Dict[str, Any]:
 	}
 
 
+@router.get("/analytics/timeseries")
+async def analytics_timeseries(
+	network: Optional[str] = Query(default=None),
+	token: Optional[str] = Query(default=None),
+	from_: Optional[str] = Query(default=None, alias="from"),
+	to: Optional[str] = Query(default=None),
+	interval: str = Query(default="auto", pattern="^(auto|minute|hour|day)$"),
+	max_points: int = Query(default=1000, ge=1, le=10000),
+) -> Dict[str, Any]:
+	# served from transfer_rollups: whole days/hours from the coarse buckets, minutes only at the edges
+	try:
+		end = datetime.fromisoformat(to) if to else datetime.now(timezone.utc)
+		start = datetime.fromisoformat(from_) if from_ else end - timedelta(hours=24)
+	except ValueError:
+		raise HTTPException(status_code=400, detail="from/to must be ISO-8601 timestamps")
+	# buckets are at least a minute wide, so both bounds round down to whole minutes
+	start, end = (rollups.floor_to(ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts, "minute") for ts in (start, end))
+	if start >= end:
+		raise HTTPException(status_code=400, detail="from must be before to")
+	if interval == "auto":
+		interval = rollups.pick_interval(start, end, max_points)
+	elif (end - start) / rollups.STEPS[interval] > max_points:
+		raise HTTPException(status_code=400, detail=f"More than {max_points} {interval} buckets; use a coarser interval")
+
+	async def fetch() -> Dict[str, Any]:
+		return {
+			"interval": interval,
+			"from": start.isoformat(),
+			"to": end.isoformat(),
+			"points": await rollups.timeseries(start, end, interval, network, token),
+		}
+
+	key = ("timeseries", network, token, start, end, interval)
+	return await cache.response_cache.get_or_fetch(key, ("transfer_rollups",), fetch)
+
+
 @router.get("/wallets/{wallet_address}/balances")
 async def wallet_balances(wallet_address: str, network: Optional[str] = None, token: Optional[str] = None) -> List[Dict[str, Any]]:
+	# current balance per (network, token): primary-key lookups on the latest table, no history scan
 	params: Dict[str, Any] = {
+		"select": "wallet_address,network,token,token_address,balance,fetched_at",
 		"wallet_address": f"eq.{wallet_address}",
-		"order": "fetched_at.desc",
-		"limit": 200,
+		"order": "network.asc,token.asc",
 	}
 	if network:
 		params["network"] = f"eq.{network}"
 	if token:
 		params["token"] = f"eq.{token}"
-	rows = client.select("wallet_balances", params)
-	return rows
+	return await supabase_client.client.select("wallet_balances_latest", params)
+
+
+@router.get("/wallets/{wallet_address}/balances/history")
+async def wallet_balance_history(
+	wallet_address: str,
+	network: Optional[str] = Query(default=None),
+	token: Optional[str] = Query(default=None),
+	from_: Optional[str] = Query(default=None, alias="from"),
+	limit: int = Query(default=500, ge=1, le=5000),
+) -> List[Dict[str, Any]]:
+	# change points where they are still raw, hourly/daily closes (with min/max) where compacted
+	try:
+		since = datetime.fromisoformat(from_) if from_ else datetime.now(timezone.utc) - timedelta(days=30)
+	except ValueError:
+		raise HTTPException(status_code=400, detail="from must be an ISO-8601 timestamp")
+	if since.tzinfo is not None:
+		since = since.astimezone(timezone.utc)
+	return await balances.history(wallet_address, since.replace(tzinfo=None), network, token, limit)
+
+
+@router.get("/wallets/{wallet_address}/transfers")
+async def wallet_transfers(
+	wallet_address: str,
+	network: Optional[str] = Query(default=None),
+	token: Optional[str] = Query(default=None),
+	window_sec: int = Query(default=3600, ge=1, le=86400),
+	limit: int = Query(default=500, ge=1, le=2000),
+) -> List[Dict[str, Any]]:
+	since = datetime.now(timezone.utc) - timedelta(seconds=window_sec)
+	if hotstore.store.covers(since.timestamp()):
+		return hotstore.store.wallet(wallet_address, since.timestamp(), network, token, limit)
+	params: Dict[str, Any] = {
+		# ilike without wildcards: case-insensitive match against the checksummed addresses
+		"or": f"(from_address.ilike.{wallet_address},to_address.ilike.{wallet_address})",
+		"block_timestamp": f"gte.{since.isoformat()}",
+		"order": KEYSET_ORDER_DESC,
+		"limit": limit,
+	}
+	if network:
+		params["network"] = f"eq.{network}"
+	if token:
+		params["token"] = f"eq.{token}"
+	return await supabase_client.client.select("stablecoin_transfers", params)
 
 
 @router.get("/whales/live")
@@ -100,12 +297,93 @@ async def whales_live(network: Optional[str] = None, token: Optional[str] = None
 		params["network"] = f"eq.{network}"
 	if token:
 		params["token"] = f"eq.{token}"
-	rows = client.select("whale_transfers", params)
-	return rows
+
+	async def fetch() -> List[Dict[str, Any]]:
+		return await supabase_client.client.select("whale_transfers", params)
+	return await cache.response_cache.get_or_fetch(("whales_live", network, token), ("whale_transfers",), fetch)
 
 
 @router.get("/whales/top-wallets")
 async def whales_top_wallets() -> List[Dict[str, Any]]:
-	# If you create a materialized view in Supabase called whale_top_wallets, this will read it
-	rows = client.select("whale_top_wallets", {"order": "last_updated.desc", "limit": 500})
+	# kept current by the ETL's streaming top-K (see topk.py), largest sent + received first
+	rows = await supabase_client.client.select("whale_top_wallets", {"order": "total_volume.desc.nullslast", "limit": 500})
 	return rows
+
+
+STREAM_KINDS = ("transfer", "whale")
+
+
+def parse_kinds(kinds: str) -> List[str]:
+	parsed = [k.strip() for k in kinds.split(",") if k.strip()]
+	if not parsed or any(k not in STREAM_KINDS for k in parsed):
+		raise HTTPException(status_code=400, detail=f"kinds must be a comma-separated subset of: {', '.join(STREAM_KINDS)}")
+	return parsed
+
+
+@router.get("/stream/sse")
+async def stream_sse(
+	request: Request,
+	kinds: str = Query(default="whale"),
+	network: Optional[str] = Query(default=None),
+	token: Optional[str] = Query(default=None),
+	address: Optional[str] = Query(default=None),
+) -> StreamingResponse:
+	sub = pubsub.broker.subscribe(parse_kinds(kinds), network, token, address)
+
+	async def events() -> AsyncIterator[bytes]:
+		try:
+			while True:
+				try:
+					item = await asyncio.wait_for(sub.get(), timeout=settings.STREAM_HEARTBEAT_SEC)
+				except asyncio.TimeoutError:
+					if await request.is_disconnected():
+						return
+					yield b": keepalive\n\n"
+					continue
+				if item is None:
+					yield b"event: dropped\ndata: {}\n\n"
+					return
+				kind, row = item
+				yield b"event: " + kind.encode() + b"\ndata: " + orjson.dumps(row) + b"\n\n"
+		finally:
+			pubsub.broker.unsubscribe(sub)
+
+	return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@ws_router.websocket("/stream/ws")
+async def stream_ws(
+	websocket: WebSocket,
+	kinds: str = Query(default="whale"),
+	network: Optional[str] = Query(default=None),
+	token: Optional[str] = Query(default=None),
+	address: Optional[str] = Query(default=None),
+	api_key: Optional[str] = Query(default=None),
+) -> None:
+	# browsers can't set headers on a WebSocket handshake, so ?api_key= is accepted too
+	header = websocket.headers.get("authorization", "")
+	if not api_key and header.lower().startswith("bearer "):
+		api_key = header[7:]
+	try:
+		if not api_key:
+			raise HTTPException(status_code=401, detail="Unauthorized")
+		await check_api_key(api_key.strip())
+		kind_list = parse_kinds(kinds)
+	except HTTPException as exc:
+		await websocket.close(code=1008, reason=str(exc.detail))
+		return
+	await websocket.accept()
+	sub = pubsub.broker.subscribe(kind_list, network, token, address)
+	try:
+		while True:
+			item = await sub.get()
+			if item is None:
+				# too slow to keep up with the feed
+				await websocket.close(code=1013, reason="Subscriber queue overflow")
+				return
+			kind, row = item
+			await websocket.send_text(orjson.dumps({"type": kind, "data": row}).decode())
+	except WebSocketDisconnect:
+		pass
+	finally:
+		pubsub.broker.unsubscribe(sub)
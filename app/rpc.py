@@ -0,0 +1,368 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from app import metrics
+from app.config import settings
+
+# JSON-RPC error codes providers use for rate limiting inside an HTTP 200 answer
+RATE_LIMIT_CODES = {-32005, -32090, 429}
+# never hedged or retried on another endpoint: a second copy would not be a no-op
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+# reads pinned to a block number; a provider that hasn't seen that block yet answers with null or,
+# for eth_getLogs, with a silently truncated range
+BLOCK_READS = {"eth_getBlockByNumber", "eth_getBlockReceipts"}
+
+
+class RpcError(RuntimeError):
+	def __init__(self, method: str, error: Dict[str, Any]) -> None:
+		self.method = method
+		self.code = error.get("code")
+		self.message = error.get("message") or ""
+		super().__init__(f"{method}: {self.code} {self.message}")
+
+
+# substrings providers use when a getLogs range is too wide for them
+RANGE_ERROR_HINTS = ("too many", "more than", "limit", "range", "exceed", "timeout", "response size")
+
+
+def is_range_error(exc: Exception) -> bool:
+	# the provider refused a block range as too wide (result cap, timeout); a narrower one may pass
+	if isinstance(exc, httpx.TimeoutException):
+		return True
+	if isinstance(exc, httpx.HTTPStatusError):
+		return exc.response.status_code in (413, 502, 503, 504)
+	if isinstance(exc, RpcError):
+		message = exc.message.lower()
+		if "rate" in message:
+			return False
+		return exc.code == -32005 or any(hint in message for hint in RANGE_ERROR_HINTS)
+	return False
+
+
+def _requests(payload: Any) -> List[Dict[str, Any]]:
+	return payload if isinstance(payload, list) else [payload]
+
+
+def _hex_block(value: Any) -> Optional[int]:
+	if isinstance(value, str) and value.startswith("0x"):
+		return int(value, 16)
+	return None
+
+
+def _required_block(payload: Any) -> Optional[int]:
+	# newest block the payload reads; only endpoints known to have it are used for hedges
+	required: Optional[int] = None
+	for req in _requests(payload):
+		params = req.get("params") or []
+		if req["method"] == "eth_getLogs" and params:
+			block = _hex_block(params[0].get("toBlock"))
+		elif req["method"] in BLOCK_READS and params:
+			block = _hex_block(params[0])
+		else:
+			continue
+		if block is not None and (required is None or block > required):
+			required = block
+	return required
+
+
+def _seen_block(req: Dict[str, Any], result: Any) -> Optional[int]:
+	if result is None:
+		return None
+	if req["method"] == "eth_blockNumber":
+		return _hex_block(result)
+	if req["method"] in BLOCK_READS and req.get("params"):
+		return _hex_block(req["params"][0])
+	return None
+
+
+def _consume(task: "asyncio.Task[Any]") -> None:
+	# losing hedges are cancelled or finish unobserved; retrieve their outcome so asyncio doesn't log it
+	if not task.cancelled():
+		task.exception()
+
+
+# One provider URL: its own keep-alive connection pool, health stats and an AIMD in-flight limit
+# (halved on every rate-limit answer, grown by one per limit's worth of successes).
+class Endpoint:
+	def __init__(self, url: str, network: str, timeout: float, max_connections: int) -> None:
+		self.url = url
+		self.network = network
+		# metrics label; the host only, so API keys embedded in provider paths don't end up in /metrics
+		self.label = httpx.URL(url).host or url
+		self.client = httpx.AsyncClient(
+			timeout=timeout,
+			limits=httpx.Limits(
+				max_connections=max_connections,
+				max_keepalive_connections=max_connections,
+				keepalive_expiry=settings.ETL_RPC_KEEPALIVE_SEC,
+			),
+		)
+		self.max_limit = max_connections
+		self.limit = max_connections
+		self.in_flight = 0
+		self._gained = 0
+		self._waiters: Deque["asyncio.Future[None]"] = deque()
+		# EWMA seconds per JSON-RPC method ("batch" for batches)
+		self.latency: Dict[str, float] = {}
+		self.error_rate = 0.0
+		self.failures = 0
+		self.cooldown_until = 0.0
+		self.head: Optional[int] = None
+
+	def healthy(self, now: float) -> bool:
+		return now >= self.cooldown_until
+
+	def covers(self, block: Optional[int]) -> bool:
+		return block is None or (self.head is not None and self.head >= block)
+
+	def expected(self, method: str) -> float:
+		# an unmeasured method borrows the endpoint's fastest known one, and an endpoint that was never
+		# measured scores 0 so it gets sampled once; errors inflate the estimate
+		latency = self.latency.get(method)
+		if latency is None:
+			latency = min(self.latency.values(), default=0.0)
+		return latency * (1 + 10 * self.error_rate)
+
+	def hedge_delay(self, method: str) -> float:
+		return max(settings.ETL_RPC_HEDGE_MIN_SEC, self.latency.get(method, 0.0) * settings.ETL_RPC_HEDGE_FACTOR)
+
+	async def acquire(self) -> None:
+		if self.in_flight < self.limit and not self._waiters:
+			self.in_flight += 1
+			return
+		waiter = asyncio.get_running_loop().create_future()
+		self._waiters.append(waiter)
+		try:
+			await waiter
+		except asyncio.CancelledError:
+			if waiter.done() and not waiter.cancelled():
+				# the slot was handed over just before the cancellation landed
+				self.release()
+			raise
+
+	def release(self) -> None:
+		self.in_flight -= 1
+		self._wake()
+
+	def _wake(self) -> None:
+		while self._waiters and self.in_flight < self.limit:
+			waiter = self._waiters.popleft()
+			if not waiter.done():
+				self.in_flight += 1
+				waiter.set_result(None)
+
+	def _observe_latency(self, method: str, seconds: float) -> None:
+		alpha = settings.ETL_RPC_EWMA_ALPHA
+		previous = self.latency.get(method)
+		self.latency[method] = seconds if previous is None else previous + alpha * (seconds - previous)
+		metrics.rpc_endpoint_latency.set(self.latency[method], network=self.network, endpoint=self.label, method=method)
+
+	def succeeded(self, method: str, seconds: float) -> None:
+		self._observe_latency(method, seconds)
+		self.error_rate *= 1 - settings.ETL_RPC_EWMA_ALPHA
+		self.failures = 0
+		self._gained += 1
+		if self.limit < self.max_limit and self._gained >= self.limit:
+			self.limit += 1
+			self._gained = 0
+			self._wake()
+		metrics.rpc_endpoint_error_rate.set(self.error_rate, network=self.network, endpoint=self.label)
+		metrics.rpc_endpoint_concurrency.set(self.limit, network=self.network, endpoint=self.label)
+
+	def cancelled(self, method: str, seconds: float) -> None:
+		# a hedge loser: the elapsed time is a lower bound, so it can only push the estimate up
+		if seconds > self.latency.get(method, 0.0):
+			self._observe_latency(method, seconds)
+
+	def failed(self, throttled: bool = False, retry_after: Optional[float] = None) -> None:
+		alpha = settings.ETL_RPC_EWMA_ALPHA
+		self.error_rate += alpha * (1 - self.error_rate)
+		self.failures += 1
+		if throttled:
+			self.limit = max(1, self.limit // 2)
+			self._gained = 0
+			cooldown = retry_after or settings.ETL_RPC_COOLDOWN_SEC
+			metrics.rpc_throttled.inc(network=self.network, endpoint=self.label)
+		else:
+			# back off harder while an endpoint keeps failing
+			cooldown = settings.ETL_RPC_COOLDOWN_SEC * 2 ** min(self.failures - 1, 4)
+		self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+		metrics.rpc_endpoint_error_rate.set(self.error_rate, network=self.network, endpoint=self.label)
+		metrics.rpc_endpoint_concurrency.set(self.limit, network=self.network, endpoint=self.label)
+
+	def saw_block(self, block: Optional[int]) -> None:
+		if block is not None and (self.head is None or block > self.head):
+			self.head = block
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+	try:
+		return float(response.headers.get("retry-after", ""))
+	except ValueError:
+		return None
+
+
+# Async JSON-RPC client over a pool of providers for one network; all ETL chain reads go through it
+# so ingestion never blocks the API's event loop. Each call goes to the fastest healthy endpoint,
+# fails over to the next one on transport errors, 5xx and rate limits, and idempotent reads that
+# outlive a few times the endpoint's usual latency are raced against a second endpoint.
+class RpcClient:
+	def __init__(
+		self,
+		urls: Union[str, Sequence[str]],
+		timeout: Optional[float] = None,
+		max_connections: Optional[int] = None,
+		network: Optional[str] = None,
+	) -> None:
+		if isinstance(urls, str):
+			urls = urls.split(",")
+		self.urls = [url.strip() for url in urls if url.strip()]
+		if not self.urls:
+			raise ValueError("RpcClient needs at least one endpoint URL")
+		# metrics label
+		self.network = network or ""
+		self.endpoints = [
+			Endpoint(
+				url,
+				self.network,
+				timeout or settings.ETL_RPC_TIMEOUT_SEC,
+				max_connections or settings.ETL_RPC_MAX_CONNECTIONS,
+			)
+			for url in self.urls
+		]
+		self.hedge = settings.ETL_RPC_HEDGE_ENABLED and len(self.endpoints) > 1
+		self._ids = itertools.count(1)
+
+	def _payload(self, method: str, params: Optional[List[Any]]) -> Dict[str, Any]:
+		return {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params or []}
+
+	def _pick(self, method: str, required: Optional[int], exclude: List[Endpoint], covering_only: bool = False) -> Optional[Endpoint]:
+		now = time.monotonic()
+		candidates = [e for e in self.endpoints if e not in exclude and (not covering_only or e.covers(required))]
+		if not candidates:
+			return None
+		# healthy before cooling down, then endpoints known to have the block, then spare capacity, then speed
+		return min(candidates, key=lambda e: (not e.healthy(now), not e.covers(required), e.in_flight >= e.limit, e.expected(method)))
+
+	async def _send(self, endpoint: Endpoint, method: str, payload: Any) -> Any:
+		await endpoint.acquire()
+		metrics.rpc_requests.inc(network=self.network, method=method)
+		started = time.perf_counter()
+		try:
+			r = await endpoint.client.post(endpoint.url, json=payload)
+			r.raise_for_status()
+			body = r.json()
+		except httpx.HTTPStatusError as exc:
+			metrics.rpc_errors.inc(network=self.network, method=method, kind="http")
+			throttled = exc.response.status_code == 429
+			endpoint.failed(throttled=throttled, retry_after=_retry_after(exc.response) if throttled else None)
+			raise
+		except httpx.TransportError:
+			metrics.rpc_errors.inc(network=self.network, method=method, kind="transport")
+			endpoint.failed()
+			raise
+		except ValueError:
+			metrics.rpc_errors.inc(network=self.network, method=method, kind="http")
+			endpoint.failed()
+			raise
+		except asyncio.CancelledError:
+			endpoint.cancelled(method, time.perf_counter() - started)
+			raise
+		finally:
+			endpoint.release()
+			metrics.rpc_seconds.observe(time.perf_counter() - started, network=self.network, method=method)
+		if isinstance(body, dict) and (body.get("error") or {}).get("code") in RATE_LIMIT_CODES:
+			endpoint.failed(throttled=True)
+			raise RpcError(method, body["error"])
+		endpoint.succeeded(method, time.perf_counter() - started)
+		if isinstance(body, list):
+			by_id = {item.get("id"): item for item in body if isinstance(item, dict)}
+			for req in payload:
+				endpoint.saw_block(_seen_block(req, (by_id.get(req["id"]) or {}).get("result")))
+		elif isinstance(body, dict) and isinstance(payload, dict):
+			endpoint.saw_block(_seen_block(payload, body.get("result")))
+		return body
+
+	async def _post(self, method: str, payload: Any) -> Any:
+		idempotent = all(req["method"] not in WRITE_METHODS for req in _requests(payload))
+		required = _required_block(payload)
+		tried: List[Endpoint] = []
+		tasks: Dict["asyncio.Task[Any]", Endpoint] = {}
+		error: Optional[BaseException] = None
+
+		def launch(endpoint: Endpoint) -> None:
+			tried.append(endpoint)
+			task = asyncio.ensure_future(self._send(endpoint, method, payload))
+			task.add_done_callback(_consume)
+			tasks[task] = endpoint
+
+		try:
+			while True:
+				if not tasks:
+					endpoint = self._pick(method, required, tried)
+					if endpoint is None or (tried and not idempotent):
+						break
+					launch(endpoint)
+				backup: Optional[Endpoint] = None
+				delay: Optional[float] = None
+				if self.hedge and idempotent and len(tasks) == 1:
+					backup = self._pick(method, required, tried, covering_only=True)
+					if backup is not None and backup.healthy(time.monotonic()):
+						delay = next(iter(tasks.values())).hedge_delay(method)
+				done, _ = await asyncio.wait(list(tasks), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+				if not done:
+					metrics.rpc_hedges.inc(network=self.network, method=method)
+					launch(backup)
+					continue
+				for task in done:
+					del tasks[task]
+					try:
+						return task.result()
+					except (httpx.HTTPError, ValueError, RpcError) as exc:
+						error = exc
+		finally:
+			for task in tasks:
+				task.cancel()
+		raise error
+
+	async def call(self, method: str, params: Optional[List[Any]] = None) -> Any:
+		body = await self._post(method, self._payload(method, params))
+		if body.get("error"):
+			metrics.rpc_errors.inc(network=self.network, method=method, kind="rpc")
+			raise RpcError(method, body["error"])
+		return body.get("result")
+
+	async def batch(self, calls: Sequence[Tuple[str, List[Any]]]) -> List[Any]:
+		# results are returned in request order; a failed call yields an RpcError in its slot
+		if not calls:
+			return []
+		payload = [self._payload(method, params) for method, params in calls]
+		body = await self._post("batch", payload)
+		if isinstance(body, dict):
+			# some providers answer a rejected batch with a single error object
+			metrics.rpc_errors.inc(network=self.network, method="batch", kind="rpc")
+			raise RpcError("batch", body.get("error") or {})
+		by_id = {item.get("id"): item for item in body}
+		out: List[Any] = []
+		for req in payload:
+			item = by_id.get(req["id"])
+			if item is None:
+				out.append(RpcError(req["method"], {"message": "missing response"}))
+			elif item.get("error"):
+				metrics.rpc_errors.inc(network=self.network, method=req["method"], kind="rpc")
+				out.append(RpcError(req["method"], item["error"]))
+			else:
+				out.append(item.get("result"))
+		return out
+
+	async def block_number(self) -> int:
+		return int(await self.call("eth_blockNumber"), 16)
+
+	async def aclose(self) -> None:
+		for endpoint in self.endpoints:
+			await endpoint.client.aclose()
@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app import metrics, supabase_client
+from app.config import settings
+from app.db import get_pool, init_db_pool
+
+TRANSFER_COLUMNS: Tuple[str, ...] = (
+	"network",
+	"chain_id",
+	"token",
+	"token_address",
+	"from_address",
+	"to_address",
+	"amount",
+	"tx_hash",
+	"log_index",
+	"block_number",
+	"block_timestamp",
+	"gas_used",
+	"gas_price",
+	"gas_fee",
+	"status",
+)
+
+# tables written by the transfer ETL and the columns each one carries
+SINK_TABLES: Dict[str, Tuple[str, ...]] = {
+	"stablecoin_transfers": TRANSFER_COLUMNS,
+	"whale_transfers": tuple(c for c in TRANSFER_COLUMNS if c != "chain_id"),
+}
+NUMERIC_COLUMNS = {"amount", "gas_used", "gas_price", "gas_fee"}
+
+
+class RestSink:
+	async def write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+		await supabase_client.client.upsert(table, rows, on_conflict="tx_hash,log_index")
+
+
+# Streams rows into a per-transaction staging table with binary COPY, then merges them into the
+# target with one INSERT ... ON CONFLICT (tx_hash, log_index) statement per batch.
+class CopySink:
+	def _record(self, row: Dict[str, Any], columns: Sequence[str]) -> Tuple[Any, ...]:
+		values: List[Any] = []
+		for column in columns:
+			value = row.get(column)
+			if value is not None and column in NUMERIC_COLUMNS and isinstance(value, float):
+				value = Decimal(repr(value))
+			elif value is not None and column == "block_timestamp" and isinstance(value, str):
+				# columns are TIMESTAMP without time zone, stored as UTC
+				value = datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+			values.append(value)
+		return tuple(values)
+
+	async def write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+		columns = SINK_TABLES[table]
+		staging = f"_stage_{table}"
+		column_list = ", ".join(columns)
+		updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in ("tx_hash", "log_index"))
+		records = [self._record(row, columns) for row in rows]
+		async with get_pool().acquire() as conn:
+			async with conn.transaction():
+				# column types only: no serial defaults or constraints on the staging copy
+				await conn.execute(
+					f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA"
+				)
+				await conn.copy_records_to_table(staging, records=records, columns=list(columns))
+				await conn.execute(
+					f"INSERT INTO {table} ({column_list}) "
+					f"SELECT DISTINCT ON (tx_hash, log_index) {column_list} FROM {staging} "
+					f"ORDER BY tx_hash, log_index "
+					f"ON CONFLICT (tx_hash, log_index) DO UPDATE SET {updates}"
+				)
+
+
+# Write-behind buffer shared by every ETL producer. Rows are merged per table and deduplicated on
+# (tx_hash, log_index); a table is flushed once it holds max_rows rows or its oldest row is max_age_sec
+# old. Producers block in put() while max_pending rows are queued or in flight, so a slow sink slows
+# ingestion instead of growing memory. barrier() waits until everything put so far is durable.
+class WriteBuffer:
+	def __init__(
+		self,
+		sink: Any,
+		max_rows: Optional[int] = None,
+		max_age_sec: Optional[float] = None,
+		max_pending: Optional[int] = None,
+	) -> None:
+		self.sink = sink
+		self.max_rows = max(1, max_rows or settings.ETL_FLUSH_MAX_ROWS)
+		self.max_age_sec = max_age_sec or settings.ETL_FLUSH_MAX_AGE_SEC
+		self.max_pending = max(self.max_rows, max_pending or settings.ETL_BUFFER_MAX_PENDING)
+		# table -> (tx_hash, log_index) -> (lowest put sequence, row)
+		self._pending: Dict[str, Dict[Tuple[Any, Any], Tuple[int, Dict[str, Any]]]] = {}
+		self._min_seq: Dict[str, int] = {}
+		self._oldest: Dict[str, float] = {}
+		self._inflight_seqs: List[int] = []
+		self._inflight_rows = 0
+		self._seq = 0
+		self._cond = asyncio.Condition()
+		self._wake = asyncio.Event()
+		self._task: Optional[asyncio.Task] = None
+		self.flushes = 0
+		self.flush_errors = 0
+		self.rows_flushed = 0
+		self.last_flush_latency = 0.0
+		self.max_flush_latency = 0.0
+		# called with the table name after each successful flush (e.g. cache invalidation)
+		self.on_flush: List[Callable[[str], None]] = []
+
+	@property
+	def depth(self) -> int:
+		return sum(len(p) for p in self._pending.values()) + self._inflight_rows
+
+	def _low_watermark(self) -> int:
+		seqs = list(self._min_seq.values()) + self._inflight_seqs
+		return min(seqs) if seqs else self._seq + 1
+
+	async def put(self, table: str, rows: List[Dict[str, Any]]) -> int:
+		async with self._cond:
+			await self._cond.wait_for(lambda: self.depth < self.max_pending)
+			self._seq += 1
+			seq = self._seq
+			if not rows:
+				return seq
+			pending = self._pending.setdefault(table, {})
+			for row in rows:
+				key = (row.get("tx_hash"), row.get("log_index"))
+				prev = pending.get(key)
+				pending[key] = (prev[0] if prev else seq, row)
+			self._min_seq.setdefault(table, seq)
+			self._oldest.setdefault(table, time.monotonic())
+			if len(pending) >= self.max_rows:
+				self._wake.set()
+			return seq
+
+	async def barrier(self, seq: Optional[int] = None) -> None:
+		seq = self._seq if seq is None else seq
+		async with self._cond:
+			await self._cond.wait_for(lambda: self._low_watermark() > seq)
+
+	async def flush_table(self, table: str) -> bool:
+		async with self._cond:
+			pending = self._pending.pop(table, None)
+			min_seq = self._min_seq.pop(table, None)
+			self._oldest.pop(table, None)
+			if not pending or min_seq is None:
+				return True
+			self._inflight_seqs.append(min_seq)
+			self._inflight_rows += len(pending)
+		rows = [row for _, row in pending.values()]
+		started = time.monotonic()
+		ok = False
+		try:
+			with metrics.sink_write_seconds.time(table=table):
+				for i in range(0, len(rows), self.max_rows):
+					await self.sink.write(table, rows[i:i + self.max_rows])
+			ok = True
+		except Exception as exc:
+			self.flush_errors += 1
+			metrics.loop_errors.inc(loop="sink_flush", table=table, error=type(exc).__name__)
+		finally:
+			async with self._cond:
+				self._inflight_seqs.remove(min_seq)
+				self._inflight_rows -= len(pending)
+				if ok:
+					latency = time.monotonic() - started
+					self.flushes += 1
+					self.rows_flushed += len(rows)
+					self.last_flush_latency = latency
+					self.max_flush_latency = max(self.max_flush_latency, latency)
+					for listener in self.on_flush:
+						listener(table)
+				else:
+					# requeue without clobbering newer versions of the same rows
+					merged = self._pending.setdefault(table, {})
+					for key, (seq, row) in pending.items():
+						current = merged.get(key)
+						merged[key] = (min(seq, current[0]), current[1]) if current else (seq, row)
+					self._min_seq[table] = min(self._min_seq.get(table, min_seq), min_seq)
+					self._oldest.setdefault(table, started)
+				self._cond.notify_all()
+		return ok
+
+	async def flush(self) -> None:
+		for table in list(self._pending):
+			await self.flush_table(table)
+
+	async def run(self) -> None:
+		while True:
+			try:
+				await asyncio.wait_for(self._wake.wait(), timeout=self.max_age_sec)
+			except asyncio.TimeoutError:
+				pass
+			self._wake.clear()
+			now = time.monotonic()
+			due = [
+				table for table, pending in self._pending.items()
+				if pending and (len(pending) >= self.max_rows or now - self._oldest.get(table, now) >= self.max_age_sec)
+			]
+			failed = False
+			for table in due:
+				failed |= not await self.flush_table(table)
+			if failed:
+				# sink is struggling; back off while backpressure holds producers
+				await asyncio.sleep(self.max_age_sec)
+
+	def start(self) -> None:
+		if self._task is None:
+			self._task = asyncio.create_task(self.run())
+
+	async def close(self) -> None:
+		if self._task is not None:
+			# let the cancelled run put back the batch it had taken before the final flush
+			self._task.cancel()
+			with contextlib.suppress(asyncio.CancelledError):
+				await self._task
+			self._task = None
+		await self.flush()
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"queue_depth": self.depth,
+			"pending_by_table": {table: len(pending) for table, pending in self._pending.items()},
+			"flushes": self.flushes,
+			"flush_errors": self.flush_errors,
+			"rows_flushed": self.rows_flushed,
+			"last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+			"max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+		}
+
+
+sink: Optional[Any] = None
+buffer: Optional[WriteBuffer] = None
+
+
+async def init_sink() -> None:
+	global sink, buffer
+	if sink is not None:
+		return
+	backend = settings.ETL_WRITE_BACKEND.lower()
+	if backend == "copy":
+		await init_db_pool()
+		sink = CopySink()
+	elif backend == "rest":
+		sink = RestSink()
+	else:
+		raise RuntimeError(f"Unknown ETL_WRITE_BACKEND: {settings.ETL_WRITE_BACKEND}")
+	buffer = WriteBuffer(sink)
+	buffer.start()
+
+
+async def close_sink() -> None:
+	global sink, buffer
+	if buffer is not None:
+		await buffer.close()
+	sink = None
+	buffer = None
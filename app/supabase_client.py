@@ -1,16 +1,38 @@
-import os
+import asyncio
 from typing import Any, Dict, List, Optional
-import requests
 
+import httpx
+
+from app import metrics
 from app.config import settings
 
+# statuses worth retrying: rate limiting and transient gateway / upstream failures
+RETRY_STATUSES = {429, 502, 503, 504}
+# a 429 is refused before the request is processed; a gateway error may come after the write went through
+UNPROCESSED_STATUSES = {429}
+
 
 class SupabaseClient:
-	def __init__(self, url: str, anon_key: Optional[str], service_key: Optional[str]) -> None:
+	def __init__(
+		self,
+		url: str,
+		anon_key: Optional[str],
+		service_key: Optional[str],
+		pool_size: Optional[int] = None,
+		timeout: Optional[float] = None,
+		max_retries: Optional[int] = None,
+	) -> None:
 		self.base_url = url.rstrip("/") + "/rest/v1"
 		self.anon_key = anon_key
 		self.service_key = service_key or anon_key
-		self.session = requests.Session()
+		self.timeout = timeout or settings.SUPABASE_TIMEOUT_SEC
+		self.max_retries = settings.SUPABASE_MAX_RETRIES if max_retries is None else max_retries
+		pool_size = pool_size or settings.SUPABASE_POOL_SIZE
+		self.http = httpx.AsyncClient(
+			http2=settings.SUPABASE_HTTP2,
+			timeout=self.timeout,
+			limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+		)
 
 	def _headers(self, write: bool = False) -> Dict[str, str]:
 		key = self.service_key if write else (self.anon_key or self.service_key)
@@ -21,35 +43,93 @@ class SupabaseClient:
 		}
 		return headers
 
-	def select(self, table: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+	async def _request(
+		self,
+		method: str,
+		table: str,
+		idempotent: bool,
+		timeout: Optional[float] = None,
+		**kwargs: Any,
+	) -> httpx.Response:
 		url = f"{self.base_url}/{table}"
-		r = self.session.get(url, headers=self._headers(False), params=params, timeout=30)
-		r.raise_for_status()
+		attempt = 0
+		while True:
+			try:
+				r = await self.http.request(method, url, timeout=timeout or self.timeout, **kwargs)
+				retryable = r.status_code in (RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES)
+				if not retryable or attempt >= self.max_retries:
+					if r.is_error:
+						metrics.supabase_errors.inc(method=method, table=table)
+					r.raise_for_status()
+					return r
+				reason = str(r.status_code)
+			except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+				# the request never reached the server, so even non-idempotent writes are safe to resend
+				if attempt >= self.max_retries:
+					metrics.supabase_errors.inc(method=method, table=table)
+					raise
+				reason = type(exc).__name__
+			except httpx.TransportError as exc:
+				if not idempotent or attempt >= self.max_retries:
+					metrics.supabase_errors.inc(method=method, table=table)
+					raise
+				reason = type(exc).__name__
+			metrics.supabase_retries.inc(method=method, table=table, reason=reason)
+			await asyncio.sleep(settings.SUPABASE_RETRY_BACKOFF_SEC * (2 ** attempt))
+			attempt += 1
+
+	async def select(self, table: str, params: Dict[str, Any], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+		r = await self._request("GET", table, True, timeout, headers=self._headers(False), params=params)
 		return r.json()
 
-	def insert(self, table: str, rows: List[Dict[str, Any]]) -> None:
-		url = f"{self.base_url}/{table}"
-		r = self.session.post(
-			url,
+	async def insert(self, table: str, rows: List[Dict[str, Any]], timeout: Optional[float] = None) -> None:
+		await self._request(
+			"POST",
+			table,
+			False,
+			timeout,
 			headers={**self._headers(True), "Prefer": "return=minimal"},
 			json=rows,
-			timeout=30,
 		)
-		r.raise_for_status()
 
-	def upsert(self, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str] = None) -> None:
-		url = f"{self.base_url}/{table}"
+	async def upsert(
+		self,
+		table: str,
+		rows: List[Dict[str, Any]],
+		on_conflict: Optional[str] = None,
+		timeout: Optional[float] = None,
+	) -> None:
 		params = {}
 		if on_conflict:
 			params["on_conflict"] = on_conflict
-		r = self.session.post(
-			url,
+		await self._request(
+			"POST",
+			table,
+			True,
+			timeout,
 			params=params,
 			headers={**self._headers(True), "Prefer": "resolution=merge-duplicates,return=minimal"},
 			json=rows,
-			timeout=30,
 		)
-		r.raise_for_status()
+
+	async def delete(self, table: str, params: Dict[str, Any], timeout: Optional[float] = None) -> None:
+		await self._request(
+			"DELETE",
+			table,
+			True,
+			timeout,
+			params=params,
+			headers={**self._headers(True), "Prefer": "return=minimal"},
+		)
+
+	async def rpc(self, function: str, args: Dict[str, Any], timeout: Optional[float] = None, idempotent: bool = True) -> Any:
+		# pass idempotent=False for functions that must not run twice (counters), so only requests that
+		# never reached the server are resent
+		r = await self._request("POST", f"rpc/{function}", idempotent, timeout, headers=self._headers(True), json=args)
+		return r.json() if r.content else None
+
+	async def aclose(self) -> None:
+		await self.http.aclose()
 
 
 client: Optional[SupabaseClient] = None
@@ -60,3 +140,10 @@ def init_supabase_client() -> None:
 	client = SupabaseClient(settings.SUPABASE_URL or "", settings.SUPABASE_ANON_KEY, settings.SUPABASE_SERVICE_ROLE_KEY)
 	if not settings.SUPABASE_URL:
 		raise RuntimeError("SUPABASE_URL must be set for REST mode")
+
+
+async def close_supabase_client() -> None:
+	global client
+	if client is not None:
+		await client.aclose()
+		client = None
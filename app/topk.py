@@ -0,0 +1,185 @@
+import heapq
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.enrich import LRUCache
+
+
+# Weighted Space-Saving heavy-hitter sketch: at most `capacity` counters; an unseen item evicts the
+# smallest counter and inherits its count (tracked as that item's overestimation error).
+class SpaceSaving:
+	def __init__(self, capacity: int) -> None:
+		self.capacity = max(1, capacity)
+		self.counts: Dict[str, float] = {}
+		self.errors: Dict[str, float] = {}
+		# lazy min-heap of (count, item); stale entries are skipped when popped
+		self._heap: List[Tuple[float, str]] = []
+
+	def add(self, item: str, weight: float) -> None:
+		if item in self.counts:
+			self.counts[item] += weight
+		elif len(self.counts) < self.capacity:
+			self.counts[item] = weight
+			self.errors[item] = 0.0
+		else:
+			floor, victim = self._pop_min()
+			del self.counts[victim]
+			del self.errors[victim]
+			self.counts[item] = floor + weight
+			self.errors[item] = floor
+		heapq.heappush(self._heap, (self.counts[item], item))
+		if len(self._heap) > 4 * self.capacity:
+			self._heap = [(count, key) for key, count in self.counts.items()]
+			heapq.heapify(self._heap)
+
+	def remove(self, item: str, weight: float) -> None:
+		# take back a weight added earlier; an item evicted since keeps its absorbed count
+		if item not in self.counts:
+			return
+		self.counts[item] -= weight
+		if self.counts[item] <= 1e-9:
+			# gone entirely; its heap entries go stale and are skipped
+			del self.counts[item]
+			del self.errors[item]
+		else:
+			heapq.heappush(self._heap, (self.counts[item], item))
+
+	def _pop_min(self) -> Tuple[float, str]:
+		while True:
+			count, item = heapq.heappop(self._heap)
+			if self.counts.get(item) == count:
+				return count, item
+
+	def top(self, k: int) -> List[Tuple[str, float]]:
+		return heapq.nlargest(k, self.counts.items(), key=lambda kv: kv[1])
+
+
+# Streaming top-K senders and receivers per (network, token), plus the last values written to
+# whale_top_wallets so each refresh only writes ranks that changed. A network this process takes over
+# is first loaded from the table, so stored totals carry on and stale rows get deleted. Rows of the
+# last ETL_REORG_MAX_DEPTH blocks are kept per network so a reorg can take them back out.
+class TopWallets:
+	def __init__(self, k: Optional[int] = None, capacity: Optional[int] = None) -> None:
+		self.k = k or settings.TOP_WALLETS_K
+		self.capacity = max(self.k, capacity or settings.TOP_WALLETS_CAPACITY)
+		self.sent: Dict[Tuple[str, str], SpaceSaving] = {}
+		self.recv: Dict[Tuple[str, str], SpaceSaving] = {}
+		# rows re-delivered after reorgs or window re-scans must not be counted twice
+		self._seen = LRUCache(settings.TOP_WALLETS_SEEN_CACHE_SIZE)
+		self._written: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+		# networks taken over whose stored rows haven't been loaded yet
+		self.pending: Set[str] = set()
+		# network -> block -> (seen key, token, from, to, amount) per row
+		self.recent: Dict[str, Dict[int, List[Tuple[Any, ...]]]] = {}
+
+	def _sketch(self, sketches: Dict[Tuple[str, str], SpaceSaving], key: Tuple[str, str]) -> SpaceSaving:
+		sketch = sketches.get(key)
+		if sketch is None:
+			sketch = sketches[key] = SpaceSaving(self.capacity)
+		return sketch
+
+	def ingest(self, rows: Iterable[Dict[str, Any]]) -> None:
+		for row in rows:
+			seen_key = (row.get("tx_hash"), row.get("log_index"))
+			if seen_key in self._seen:
+				continue
+			self._seen.put(seen_key, True)
+			key = (row.get("network"), row.get("token"))
+			amount = float(row.get("amount") or 0)
+			if row.get("from_address"):
+				self._sketch(self.sent, key).add(row["from_address"], amount)
+			if row.get("to_address"):
+				self._sketch(self.recv, key).add(row["to_address"], amount)
+			if key[0] and row.get("block_number") is not None:
+				entry = (seen_key, key[1], row.get("from_address"), row.get("to_address"), amount)
+				self.recent.setdefault(key[0], {}).setdefault(int(row["block_number"]), []).append(entry)
+		for blocks in self.recent.values():
+			floor = max(blocks, default=0) - settings.ETL_REORG_MAX_DEPTH
+			for block in [block for block in blocks if block <= floor]:
+				del blocks[block]
+
+	def rollback(self, network: str, from_block: int) -> None:
+		# take the orphaned rows back out, and let their replacements count even under the same tx hash
+		blocks = self.recent.get(network) or {}
+		for block in [block for block in blocks if block >= from_block]:
+			for seen_key, token, src, dst, amount in blocks.pop(block):
+				self._seen.discard(seen_key)
+				if src and (network, token) in self.sent:
+					self.sent[(network, token)].remove(src, amount)
+				if dst and (network, token) in self.recv:
+					self.recv[(network, token)].remove(dst, amount)
+
+	def claim(self, network: str) -> None:
+		self.pending.add(network)
+
+	def forget(self, network: str) -> None:
+		# another process owns the network now: drop its counts without touching its rows
+		self.pending.discard(network)
+		for sketches in (self.sent, self.recv):
+			for key in [key for key in sketches if key[0] == network]:
+				del sketches[key]
+		self.recent.pop(network, None)
+		self._written = {key: value for key, value in self._written.items() if key[0] != network}
+
+	def load(self, network: str, rows: Iterable[Dict[str, Any]]) -> None:
+		# add the stored totals to whatever was ingested since the claim, and remember them as
+		# written so rows falling out of the top-K are deleted
+		if network not in self.pending:
+			return
+		self.pending.discard(network)
+		for row in rows:
+			key = (network, row["token"])
+			wallet = row["wallet_address"]
+			sent, received = float(row.get("total_sent") or 0), float(row.get("total_received") or 0)
+			if sent:
+				self._sketch(self.sent, key).add(wallet, sent)
+			if received:
+				self._sketch(self.recv, key).add(wallet, received)
+			self._written[(network, row["token"], wallet)] = (sent, received)
+
+	def current(self) -> Dict[Tuple[str, str, str], Tuple[float, float]]:
+		ranks: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+		for key in set(self.sent) | set(self.recv):
+			sent = self.sent.get(key)
+			recv = self.recv.get(key)
+			wallets: Set[str] = set()
+			if sent:
+				wallets.update(w for w, _ in sent.top(self.k))
+			if recv:
+				wallets.update(w for w, _ in recv.top(self.k))
+			for wallet in wallets:
+				ranks[(key[0], key[1], wallet)] = (
+					sent.counts.get(wallet, 0.0) if sent else 0.0,
+					recv.counts.get(wallet, 0.0) if recv else 0.0,
+				)
+		return ranks
+
+	def diff(self) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str, str]], Dict[Tuple[str, str, str], Tuple[float, float]]]:
+		# (rows to upsert, (network, token, wallet) to delete, new state to pass to mark_written);
+		# a network is left alone until its stored rows are loaded, so they aren't overwritten
+		ranks = {key: value for key, value in self.current().items() if key[0] not in self.pending}
+		now = datetime.now(timezone.utc).isoformat()
+		upserts = [
+			{
+				"network": network,
+				"token": token,
+				"wallet_address": wallet,
+				"total_sent": sent,
+				"total_received": received,
+				"total_volume": sent + received,
+				"last_updated": now,
+			}
+			for (network, token, wallet), (sent, received) in ranks.items()
+			if self._written.get((network, token, wallet)) != (sent, received)
+		]
+		deletes = [key for key in self._written if key not in ranks]
+		return upserts, deletes, ranks
+
+	def mark_written(self, ranks: Dict[Tuple[str, str, str], Tuple[float, float]]) -> None:
+		# keep networks claimed or forgotten while the write was in flight out of the new state
+		owned = {key[0] for key in self.sent} | {key[0] for key in self.recv}
+		self._written = {key: value for key, value in ranks.items() if key[0] in owned and key[0] not in self.pending}
+
+
+tracker = TopWallets()
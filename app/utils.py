@@ -2,6 +2,8 @@ from typing import Any, Dict, Optional
 from web3 import Web3
 from fastapi.responses import ORJSONResponse
 
+from app.models import NETWORKS
+
 # Minimal ERC20 ABI for balanceOf and Transfer event
 ERC20_ABI = [
 	{
@@ -25,7 +27,31 @@ ERC20_ABI = [
 	},
 ]
 
+# stable total order over transfer rows, for keyset pagination
+KEYSET_ORDER_DESC = "block_timestamp.desc,tx_hash.desc,log_index.desc"
+KEYSET_ORDER_ASC = "block_timestamp.asc,tx_hash.asc,log_index.asc"
+
 TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4].hex()
+
+
+def balance_of_calldata(wallet: str) -> str:
+	return BALANCE_OF_SELECTOR + wallet.lower().replace("0x", "").rjust(64, "0")
+
+
+def keyset_after(ts: str, tx_hash: str, log_index: int, desc: bool) -> str:
+	# PostgREST or=(...) filter for rows strictly after (ts, tx_hash, log_index) in keyset order
+	op = "lt" if desc else "gt"
+	return (
+		f'(block_timestamp.{op}."{ts}",'
+		f'and(block_timestamp.eq."{ts}",tx_hash.{op}.{tx_hash}),'
+		f'and(block_timestamp.eq."{ts}",tx_hash.eq.{tx_hash},log_index.{op}.{log_index}))'
+	)
+
+
+def network_name(network: str) -> str:
+	# the NETWORKS key for any casing of it ("ethereum" -> "Ethereum"); unknown names pass through
+	return next((name for name in NETWORKS if name.lower() == network.lower()), network)
 
 
 def to_checksum(address: Optional[str]) -> Optional[str]:
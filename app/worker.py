@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import multiprocessing
+import signal
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from app import archive, metrics, sinks
+from app.config import settings
+from app.db import close_db_pool
+from app.etl import start_background_workers
+from app.leases import leases
+from app.models import NETWORKS
+from app.supabase_client import close_supabase_client, init_supabase_client
+
+
+def assigned_networks(shard: int, shards: int) -> List[str]:
+	# round-robin over NETWORKS in declaration order, so every process computes the same split
+	return [network for index, network in enumerate(NETWORKS) if index % shards == shard]
+
+
+def metrics_app() -> FastAPI:
+	app = FastAPI()
+
+	@app.get("/metrics")
+	async def prometheus_metrics() -> PlainTextResponse:
+		return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+	return app
+
+
+async def run_worker(networks: List[str], metrics_port: Optional[int] = None) -> None:
+	stop = asyncio.Event()
+	loop = asyncio.get_running_loop()
+	for sig in (signal.SIGINT, signal.SIGTERM):
+		loop.add_signal_handler(sig, stop.set)
+	init_supabase_client()
+	tasks: List[asyncio.Task] = []
+	server: Optional[uvicorn.Server] = None
+	try:
+		print(f"[worker {leases.owner}] networks: {', '.join(networks) or 'none'}")
+		tasks = await start_background_workers(networks, serve_views=False)
+		if metrics_port:
+			server = uvicorn.Server(uvicorn.Config(metrics_app(), host="0.0.0.0", port=metrics_port, log_level="warning", lifespan="off"))
+			asyncio.create_task(server.serve())
+		await stop.wait()
+	finally:
+		if server is not None:
+			server.should_exit = True
+		# stop ingesting, make the buffered rows durable, then hand the leases straight to a standby
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		await sinks.close_sink()
+		await archive.close_archive()
+		try:
+			await leases.release_all()
+		finally:
+			await close_supabase_client()
+			await close_db_pool()
+
+
+def run_process(shard: int, shards: int, metrics_port: Optional[int]) -> None:
+	asyncio.run(run_worker(assigned_networks(shard, shards), metrics_port))
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Run the ETL outside the API, for one shard of NETWORKS")
+	parser.add_argument("--shard", type=int, default=settings.ETL_WORKER_SHARD, help="this host's shard index")
+	parser.add_argument("--shards", type=int, default=settings.ETL_WORKER_SHARDS, help="number of host shards")
+	parser.add_argument("--processes", type=int, default=settings.ETL_WORKER_PROCESSES, help="worker processes splitting this host's shard")
+	parser.add_argument("--metrics-port", type=int, default=settings.ETL_WORKER_METRICS_PORT, help="serve /metrics here (process i uses port + i)")
+	args = parser.parse_args()
+	if not 0 <= args.shard < args.shards or args.processes < 1:
+		parser.error("need 0 <= --shard < --shards and --processes >= 1")
+
+	# process p of host shard s owns sub-shard s + S * p of S * P; its networks are still all in host
+	# shard s, whatever --processes another host runs with
+	shards = args.shards * args.processes
+	if args.processes == 1:
+		run_process(args.shard, shards, args.metrics_port)
+		return
+	# spawned, not forked: each child builds its own clients and lease owner id
+	context = multiprocessing.get_context("spawn")
+	processes = [
+		context.Process(
+			target=run_process,
+			args=(args.shard + args.shards * index, shards, args.metrics_port + index if args.metrics_port else None),
+			name=f"etl-worker-{args.shard + args.shards * index}",
+		)
+		for index in range(args.processes)
+	]
+	for process in processes:
+		process.start()
+	# the children shut down gracefully on SIGTERM; forward it (SIGINT reaches the whole process group)
+	signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	for process in processes:
+		process.join()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web3 import Web3  # noqa: E402
+
+from app.decoder import TransferDecoder  # noqa: E402
+from app.models import STABLECOINS, TOKENS_BY_ADDRESS  # noqa: E402
+from app.utils import TRANSFER_TOPIC  # noqa: E402
+
+NETWORK = "Ethereum"
+
+
+def synthetic_logs(count: int, wallets: int, seed: int) -> Tuple[List[Dict[str, Any]], Dict[int, int], Dict[str, Tuple[int, int, str]]]:
+	# Transfer logs spread over the network's stablecoins, with senders/receivers drawn from a fixed
+	# wallet pool so the address cache sees realistic reuse
+	rng = random.Random(seed)
+	emitters = [address for address, _ in (per_network[NETWORK] for per_network in STABLECOINS.values() if NETWORK in per_network)]
+	pool = ["0x" + "%040x" % rng.getrandbits(160) for _ in range(wallets)]
+	logs: List[Dict[str, Any]] = []
+	timestamps: Dict[int, int] = {}
+	receipts: Dict[str, Tuple[int, int, str]] = {}
+	for i in range(count):
+		block = 19_000_000 + i // 50
+		tx_hash = "0x%064x" % i
+		timestamps[block] = 1_700_000_000 + 12 * (block - 19_000_000)
+		receipts[tx_hash] = (65_000, 30_000_000_000, "success")
+		logs.append({
+			"address": rng.choice(emitters).lower(),
+			"topics": [TRANSFER_TOPIC, "0x" + "0" * 24 + rng.choice(pool)[2:], "0x" + "0" * 24 + rng.choice(pool)[2:]],
+			"data": "0x%064x" % rng.randrange(10 ** 4, 10 ** 13),
+			"blockNumber": hex(block),
+			"transactionHash": tx_hash,
+			"logIndex": hex(i % 50),
+			"removed": False,
+		})
+	return logs, timestamps, receipts
+
+
+def decode_inline(logs: List[Dict[str, Any]]) -> int:
+	# per-log work the ETL did before app.decoder: two uncached checksums and a fresh 10 ** decimals
+	index = TOKENS_BY_ADDRESS[NETWORK]
+	decoded = 0
+	for log in logs:
+		token, address, decimals = index[log["address"].lower()]
+		Web3.to_checksum_address("0x" + log["topics"][1][-40:])
+		Web3.to_checksum_address("0x" + log["topics"][2][-40:])
+		int(log["data"], 16) / (10 ** decimals)
+		decoded += 1
+	return decoded
+
+
+def run(label: str, fn, logs: int, repeat: int) -> None:
+	best = float("inf")
+	for _ in range(repeat):
+		started = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - started)
+	print(f"{label:<28} {logs / best:>12,.0f} logs/sec  ({best * 1000:.1f} ms for {logs} logs)")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Microbenchmark for the Transfer log decoder")
+	parser.add_argument("--logs", type=int, default=50_000)
+	parser.add_argument("--wallets", type=int, default=5_000, help="distinct wallet addresses in the synthetic stream")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	logs, timestamps, receipts = synthetic_logs(args.logs, args.wallets, args.seed)
+	decoder = TransferDecoder()
+	# first pass fills the checksum cache, as a long-running ETL would have
+	decoder.decode(NETWORK, logs)
+
+	run("inline (before)", lambda: decode_inline(logs), args.logs, args.repeat)
+	run("decode", lambda: decoder.decode(NETWORK, logs), args.logs, args.repeat)
+	decoded = decoder.decode(NETWORK, logs)
+	run("build_rows", lambda: decoder.build_rows(NETWORK, decoded, timestamps, receipts), args.logs, args.repeat)
+	run("decode + build_rows", lambda: decoder.build_rows(NETWORK, decoder.decode(NETWORK, logs), timestamps, receipts), args.logs, args.repeat)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fakes import block_hash, block_timestamp  # noqa: E402
+
+API_KEY = "bench"
+NETWORK_ENV = {
+	"Ethereum": "RPC_ETHEREUM",
+	"Polygon": "RPC_POLYGON",
+	"BSC": "RPC_BSC",
+	"Arbitrum": "RPC_ARBITRUM",
+	"Avalanche": "RPC_AVALANCHE",
+}
+
+
+def free_port() -> int:
+	with socket.socket() as s:
+		s.bind(("127.0.0.1", 0))
+		return s.getsockname()[1]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+	if not samples:
+		return 0.0
+	ordered = sorted(samples)
+	return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def wait_ready(url: str, timeout: float = 20.0) -> None:
+	deadline = time.monotonic() + timeout
+	async with httpx.AsyncClient() as http:
+		while True:
+			try:
+				(await http.get(url + "/_stats")).raise_for_status()
+				return
+			except httpx.HTTPError:
+				if time.monotonic() > deadline:
+					raise RuntimeError(f"fake server at {url} did not start")
+				await asyncio.sleep(0.1)
+
+
+async def stats(url: str) -> Dict[str, Any]:
+	async with httpx.AsyncClient() as http:
+		return (await http.get(url + "/_stats")).json()
+
+
+async def node_stats(urls: List[str]) -> Dict[str, Any]:
+	# summed over every fake provider in the pool
+	total: Dict[str, Any] = {"requests": 0, "calls": {}}
+	for url in urls:
+		one = await stats(url)
+		total["requests"] += one["requests"]
+		for method, count in one["calls"].items():
+			total["calls"][method] = total["calls"].get(method, 0) + count
+	return total
+
+
+def rpc_calls(node_stats: Dict[str, Any]) -> int:
+	return sum(node_stats["calls"].values())
+
+
+async def bench_transfers(args: argparse.Namespace, node_urls: List[str], rest_url: str, networks: List[str]) -> None:
+	from app import etl, rollups, supabase_client
+
+	# resume every network from a known cursor, so the run is a fixed catch-up of args.blocks blocks
+	start = args.head - args.blocks
+	await supabase_client.client.upsert("etl_cursors", [
+		{"network": network, "block_number": start, "block_hash": block_hash(args.seed, start)} for network in networks
+	], on_conflict="network")
+
+	before_node, before_rest = await node_stats(node_urls), await stats(rest_url)
+	clients = etl.build_rpc_clients()
+	limit = asyncio.Semaphore(len(networks))
+	started = time.perf_counter()
+	task = asyncio.create_task(etl.poll_transfers(clients, limit))
+	try:
+		while True:
+			cursors = await supabase_client.client.select("etl_cursors", {"select": "network,block_number"})
+			if all(int(c["block_number"]) >= args.head for c in cursors if c["network"] in networks):
+				break
+			if time.perf_counter() - started > args.timeout:
+				raise RuntimeError(f"ingestion did not catch up within {args.timeout}s: {cursors}")
+			await asyncio.sleep(0.05)
+	finally:
+		elapsed = time.perf_counter() - started
+		task.cancel()
+		for rpc in clients.values():
+			await rpc.aclose()
+	after_node, after_rest = await node_stats(node_urls), await stats(rest_url)
+
+	blocks = args.blocks * len(networks)
+	calls = rpc_calls(after_node) - rpc_calls(before_node)
+	requests = after_node["requests"] - before_node["requests"]
+	rows = after_rest["rows_written"] - before_rest["rows_written"]
+	print(f"ingestion: {blocks} blocks across {len(networks)} network(s) in {elapsed:.2f}s")
+	print(f"  blocks/sec            {blocks / elapsed:>12,.1f}")
+	print(f"  rows/sec written      {rows / elapsed:>12,.1f}   ({rows} rows incl. whales and cursors)")
+	print(f"  RPC calls per block   {calls / blocks:>12.3f}   ({calls} JSON-RPC calls)")
+	print(f"  HTTP requests/block   {requests / blocks:>12.3f}   ({requests} requests to {len(node_urls)} node(s))")
+	for method, count in sorted(after_node["calls"].items()):
+		delta = count - before_node["calls"].get(method, 0)
+		if delta:
+			print(f"    {method:<26} {delta}")
+
+	# the minute/hour/day rollups behind /v1/analytics/timeseries for everything just ingested
+	started = time.perf_counter()
+	await rollups.flush()
+	print(f"  rollup refresh        {(time.perf_counter() - started) * 1000:>12.1f} ms")
+
+
+async def bench_balances(args: argparse.Namespace, node_urls: List[str], rest_url: str, networks: List[str], wallets: List[str]) -> None:
+	from app import etl
+	from app.config import settings
+	from app.ledger import ledger
+
+	before_node, before_rest = await node_stats(node_urls), await stats(rest_url)
+	clients = etl.build_rpc_clients()
+	started = time.perf_counter()
+	if settings.BALANCE_MODE == "ledger":
+		ledger.active = True
+		tasks = [asyncio.create_task(etl.maintain_network_ledger(network, rpc, asyncio.Semaphore(1))) for network, rpc in clients.items()]
+	else:
+		tasks = [
+			asyncio.create_task(etl.poll_network_balances(network, rpc, wallets, asyncio.Semaphore(1)))
+			for network, rpc in clients.items()
+		]
+	try:
+		# one polling pass (or the ledger's seed snapshot) writes a row per (token, wallet)
+		while True:
+			current = await stats(rest_url)
+			if current["rows_written"] - before_rest["rows_written"] >= args.expected_balance_rows:
+				break
+			if time.perf_counter() - started > args.timeout:
+				break
+			await asyncio.sleep(0.02)
+	finally:
+		elapsed = time.perf_counter() - started
+		for task in tasks:
+			task.cancel()
+		for rpc in clients.values():
+			await rpc.aclose()
+	after_node, after_rest = await node_stats(node_urls), await stats(rest_url)
+	rows = after_rest["rows_written"] - before_rest["rows_written"]
+	print(f"balances ({settings.BALANCE_MODE}): {len(wallets)} wallet(s) x {len(networks)} network(s), first pass in {elapsed:.3f}s")
+	print(f"  eth_call              {after_node['calls'].get('eth_call', 0) - before_node['calls'].get('eth_call', 0):>12}")
+	print(f"  rows written          {rows:>12}")
+
+
+async def bench_api(args: argparse.Namespace, wallets: List[str]) -> None:
+	from app.main import app
+
+	# the ingested blocks' time range, so the timeseries route reads populated rollups
+	span = [
+		datetime.fromtimestamp(block_timestamp(number), tz=timezone.utc).replace(tzinfo=None).isoformat()
+		for number in (args.head - args.blocks, args.head)
+	]
+
+	routes: List[Tuple[str, str]] = [
+		("/v1/transfers?live=false&limit=100", "transfers (history)"),
+		("/v1/transfers?window_sec=600&limit=100", "transfers (live)"),
+		("/v1/whales/live", "whales/live"),
+		("/v1/analytics/global-flows", "analytics/global-flows"),
+		("/v1/whales/top-wallets", "whales/top-wallets"),
+		(f"/v1/wallets/{wallets[0]}/balances", "wallets/balances"),
+		(f"/v1/analytics/timeseries?from={span[0]}&to={span[1]}&interval=minute", "analytics/timeseries"),
+	]
+	latencies: Dict[str, List[float]] = {label: [] for _, label in routes}
+	errors: Dict[str, int] = {label: 0 for _, label in routes}
+	deadline = time.perf_counter() + args.api_seconds
+	transport = httpx.ASGITransport(app=app)
+
+	async def worker(offset: int) -> None:
+		async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"Authorization": f"Bearer {API_KEY}"}) as http:
+			i = offset
+			while time.perf_counter() < deadline:
+				path, label = routes[i % len(routes)]
+				i += 1
+				started = time.perf_counter()
+				r = await http.get(path)
+				latencies[label].append(time.perf_counter() - started)
+				if r.status_code != 200:
+					errors[label] += 1
+
+	started = time.perf_counter()
+	await asyncio.gather(*(worker(i) for i in range(args.api_clients)))
+	elapsed = time.perf_counter() - started
+	total = sum(len(v) for v in latencies.values())
+	print(f"api: {args.api_clients} concurrent clients for {elapsed:.1f}s, {total / elapsed:,.0f} req/s")
+	print(f"  {'route':<26} {'reqs':>7} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+	for _, label in routes:
+		samples = latencies[label]
+		print(f"  {label:<26} {len(samples):>7} {percentile(samples, 50) * 1000:>9.2f} {percentile(samples, 99) * 1000:>9.2f} {errors[label]:>7}")
+
+
+async def run(args: argparse.Namespace, node_urls: List[str], rest_url: str, networks: List[str]) -> None:
+	for node_url in node_urls:
+		await wait_ready(node_url)
+	await wait_ready(rest_url)
+
+	from app import sinks, supabase_client
+	from app.config import settings
+
+	supabase_client.init_supabase_client()
+	await sinks.init_sink()
+	try:
+		if "transfers" in args.phases:
+			await bench_transfers(args, node_urls, rest_url, networks)
+		wallets = settings.TRACKED_WALLETS
+		if "balances" in args.phases:
+			await bench_balances(args, node_urls, rest_url, networks, wallets)
+		if "api" in args.phases:
+			await bench_api(args, wallets)
+	finally:
+		await sinks.close_sink()
+		await supabase_client.close_supabase_client()
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Offline ETL + API benchmark against a fake JSON-RPC node and PostgREST")
+	parser.add_argument("--networks", default="Ethereum", help="comma-separated; all are served by the same fake node(s)")
+	parser.add_argument("--rpc-endpoints", type=int, default=1, help="identical fake providers behind each network's RPC pool")
+	parser.add_argument("--slow-endpoint-ms", type=float, default=0, help="added latency on the first provider")
+	parser.add_argument("--blocks", type=int, default=2_000, help="blocks each network has to catch up on")
+	parser.add_argument("--blocks-per-tick", type=int, default=100)
+	parser.add_argument("--transfers-per-block", type=int, default=50)
+	parser.add_argument("--logs-per-tx", type=int, default=2)
+	parser.add_argument("--wallets", type=int, default=5_000, help="distinct addresses in the synthetic transfer stream")
+	parser.add_argument("--tracked-wallets", type=int, default=200, help="wallets polled by the balance phase")
+	parser.add_argument("--api-clients", type=int, default=32)
+	parser.add_argument("--api-seconds", type=float, default=10.0)
+	parser.add_argument("--write-backend", default="rest", choices=("rest",), help="the fake only speaks PostgREST")
+	parser.add_argument("--balance-mode", default="ledger", choices=("ledger", "poll"))
+	parser.add_argument("--phases", default="transfers,balances,api")
+	parser.add_argument("--timeout", type=float, default=300.0)
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--head", type=int, default=20_000_000)
+	args = parser.parse_args()
+
+	networks = [n.strip() for n in args.networks.split(",") if n.strip()]
+	unknown = [n for n in networks if n not in NETWORK_ENV]
+	if unknown:
+		parser.error(f"unknown network(s): {', '.join(unknown)}")
+	node_ports, rest_port = [free_port() for _ in range(max(1, args.rpc_endpoints))], free_port()
+	node_urls, rest_url = [f"http://127.0.0.1:{port}" for port in node_ports], f"http://127.0.0.1:{rest_port}"
+
+	fakes = os.path.join(ROOT, "bench", "fakes.py")
+	procs = [
+		subprocess.Popen([
+			sys.executable, fakes, "node", "--port", str(port), "--seed", str(args.seed), "--head", str(args.head),
+			"--transfers-per-block", str(args.transfers_per_block), "--logs-per-tx", str(args.logs_per_tx), "--wallets", str(args.wallets),
+			"--delay-ms", str(args.slow_endpoint_ms if i == 0 else 0),
+		])
+		for i, port in enumerate(node_ports)
+	]
+	procs.append(subprocess.Popen([sys.executable, fakes, "rest", "--port", str(rest_port)]))
+
+	# settings are read at import time, so the environment has to be in place before app is imported
+	tracked = ["0x" + "%040x" % (0xB0B0 + i) for i in range(args.tracked_wallets)]
+	env = {
+		"SUPABASE_URL": rest_url,
+		"SUPABASE_SERVICE_ROLE_KEY": "bench",
+		"SUPABASE_HTTP2": "false",
+		"ETL_POLL_SEC": "0",
+		"ETL_CURSOR_ENABLED": "true",
+		"ETL_MAX_BLOCKS_PER_TICK": str(args.blocks_per_tick),
+		"ETL_WRITE_BACKEND": args.write_backend,
+		"TRACKED_WALLETS": "[" + ",".join(f'"{w}"' for w in tracked) + "]",
+		"ARCHIVE_ENABLED": "false",
+		"BALANCE_MODE": args.balance_mode,
+	}
+	for name in NETWORK_ENV.values():
+		os.environ.pop(name, None)
+	for network in networks:
+		env[NETWORK_ENV[network]] = ",".join(node_urls)
+	os.environ.update(env)
+	tokens_per_network = {}
+	from app.models import STABLECOINS
+	for network in networks:
+		tokens_per_network[network] = sum(1 for per_network in STABLECOINS.values() if network in per_network)
+	# each balance lands twice: once in wallet_balances_latest, once as a wallet_balances change point
+	args.expected_balance_rows = 2 * sum(tokens_per_network.values()) * len(tracked)
+
+	try:
+		asyncio.run(run(args, node_urls, rest_url, networks))
+	finally:
+		for proc in procs:
+			proc.terminate()
+		for proc in procs:
+			proc.wait()
+
+
+if __name__ == "__main__":
+	main()
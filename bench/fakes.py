@@ -0,0 +1,440 @@
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import uvicorn
+from eth_abi import decode, encode
+from fastapi import FastAPI, Request, Response
+
+# Deterministic stand-ins for a JSON-RPC node and Supabase's PostgREST, for offline benchmarks.
+# Each runs as its own process (python bench/fakes.py node|rest --port N) so the benchmarked
+# process doesn't share an event loop with them.
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+AGGREGATE3_SELECTOR = "82ad56cb"
+
+
+def block_hash(seed: int, number: int) -> str:
+	return "0x" + hashlib.sha256(f"{seed}:{number}".encode()).hexdigest()
+
+
+def block_timestamp(number: int, block_time: int = 12) -> int:
+	return 1_700_000_000 + number * block_time
+
+
+def tx_hash(number: int, index: int) -> str:
+	# block and tx position are recoverable from the hash, so receipts need no lookup table
+	return "0x" + f"{number:016x}{index:016x}".rjust(64, "0")
+
+
+class FakeChain:
+	def __init__(self, seed: int, head: int, transfers_per_block: int, logs_per_tx: int, wallets: int, block_time: int) -> None:
+		self.seed = seed
+		self.head = head
+		self.transfers_per_block = transfers_per_block
+		self.logs_per_tx = max(1, logs_per_tx)
+		self.block_time = block_time
+		rng = random.Random(seed)
+		self.wallets = ["%040x" % rng.getrandbits(160) for _ in range(wallets)]
+		self.calls: Dict[str, int] = {}
+		self.requests = 0
+
+	def timestamp(self, number: int) -> int:
+		return block_timestamp(number, self.block_time)
+
+	def header(self, number: int) -> Optional[Dict[str, Any]]:
+		if number > self.head:
+			return None
+		return {
+			"number": hex(number),
+			"hash": block_hash(self.seed, number),
+			"parentHash": block_hash(self.seed, number - 1),
+			"timestamp": hex(self.timestamp(number)),
+		}
+
+	def logs(self, from_block: int, to_block: int, addresses: List[str]) -> List[Dict[str, Any]]:
+		out: List[Dict[str, Any]] = []
+		if not addresses:
+			return out
+		for number in range(from_block, min(to_block, self.head) + 1):
+			rng = random.Random(self.seed * 1_000_003 + number)
+			for i in range(self.transfers_per_block):
+				out.append({
+					"address": addresses[rng.randrange(len(addresses))],
+					"topics": [
+						TRANSFER_TOPIC,
+						"0x" + "0" * 24 + self.wallets[rng.randrange(len(self.wallets))],
+						"0x" + "0" * 24 + self.wallets[rng.randrange(len(self.wallets))],
+					],
+					"data": "0x%064x" % rng.randrange(10 ** 6, 10 ** 24),
+					"blockNumber": hex(number),
+					"blockHash": block_hash(self.seed, number),
+					"transactionHash": tx_hash(number, i // self.logs_per_tx),
+					"logIndex": hex(i),
+					"removed": False,
+				})
+		return out
+
+	def receipt(self, number: int, index: int) -> Dict[str, Any]:
+		return {
+			"transactionHash": tx_hash(number, index),
+			"blockNumber": hex(number),
+			"gasUsed": hex(50_000 + index),
+			"effectiveGasPrice": hex(20_000_000_000 + number % 1000),
+			"status": "0x1",
+		}
+
+	def block_receipts(self, number: int) -> Optional[List[Dict[str, Any]]]:
+		if number > self.head:
+			return None
+		txs = (self.transfers_per_block + self.logs_per_tx - 1) // self.logs_per_tx
+		return [self.receipt(number, i) for i in range(txs)]
+
+	def multicall(self, data: str) -> str:
+		(calls,) = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))
+		# balances drift every 10s so change-only writes see some churn
+		epoch = int(time.time() // 10)
+		results = []
+		for target, _, calldata in calls:
+			seed = int.from_bytes(hashlib.sha256(bytes.fromhex(target[2:]) + bytes(calldata) + epoch.to_bytes(8, "big")).digest()[:8], "big")
+			results.append((True, (seed % 10 ** 24).to_bytes(32, "big")))
+		return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+
+	def dispatch(self, method: str, params: List[Any]) -> Tuple[Any, Optional[Dict[str, Any]]]:
+		self.calls[method] = self.calls.get(method, 0) + 1
+		if method == "eth_blockNumber":
+			return hex(self.head), None
+		if method == "eth_getBlockByNumber":
+			return self.header(int(params[0], 16)), None
+		if method == "eth_getLogs":
+			f = params[0]
+			addresses = f.get("address") or []
+			if isinstance(addresses, str):
+				addresses = [addresses]
+			return self.logs(int(f["fromBlock"], 16), int(f["toBlock"], 16), addresses), None
+		if method == "eth_getBlockReceipts":
+			return self.block_receipts(int(params[0], 16)), None
+		if method == "eth_getTransactionReceipt":
+			raw = params[0][2:].rjust(64, "0")
+			return self.receipt(int(raw[32:48], 16), int(raw[48:], 16)), None
+		if method == "eth_call" and params[0].get("data", "")[2:10] == AGGREGATE3_SELECTOR:
+			return self.multicall(params[0]["data"]), None
+		return None, {"code": -32601, "message": f"method {method} not supported"}
+
+
+def node_app(chain: FakeChain, delay_sec: float = 0.0) -> FastAPI:
+	app = FastAPI()
+
+	def answer(item: Dict[str, Any]) -> Dict[str, Any]:
+		result, error = chain.dispatch(item.get("method"), item.get("params") or [])
+		if error:
+			return {"jsonrpc": "2.0", "id": item.get("id"), "error": error}
+		return {"jsonrpc": "2.0", "id": item.get("id"), "result": result}
+
+	@app.post("/")
+	async def rpc(request: Request) -> Response:
+		chain.requests += 1
+		if delay_sec:
+			# a slow or distant provider, for exercising the RPC pool's routing and hedging
+			await asyncio.sleep(delay_sec)
+		body = orjson.loads(await request.body())
+		out = [answer(item) for item in body] if isinstance(body, list) else answer(body)
+		return Response(orjson.dumps(out), media_type="application/json")
+
+	@app.get("/_stats")
+	async def stats() -> Dict[str, Any]:
+		return {"requests": chain.requests, "calls": chain.calls, "head": chain.head}
+
+	@app.post("/_head/{number}")
+	async def set_head(number: int) -> Dict[str, Any]:
+		chain.head = number
+		return {"head": number}
+
+	return app
+
+
+def _value(raw: str) -> Any:
+	try:
+		return float(raw)
+	except ValueError:
+		return raw
+
+
+def _compare(value: Any, op: str, raw: str) -> bool:
+	if op == "in":
+		return str(value) in {v.strip('"') for v in raw.strip("()").split(",")}
+	if op == "ilike":
+		return str(value).lower() == raw.lower()
+	if op == "is":
+		return value is None if raw == "null" else str(value).lower() == raw
+	target: Any = raw.strip('"')
+	if isinstance(value, (int, float)) and not isinstance(value, bool):
+		target = _value(target)
+	elif value is None:
+		return False
+	else:
+		value = str(value)
+	if op == "eq":
+		return value == target
+	if op == "neq":
+		return value != target
+	if op == "gt":
+		return value > target
+	if op == "gte":
+		return value >= target
+	if op == "lt":
+		return value < target
+	if op == "lte":
+		return value <= target
+	return True
+
+
+def _split_top(raw: str) -> List[str]:
+	# split a logic-tree argument on the commas outside nested groups and quoted values
+	parts, depth, quoted, start = [], 0, False, 0
+	for index, char in enumerate(raw):
+		if char == '"':
+			quoted = not quoted
+		elif quoted:
+			continue
+		elif char == "(":
+			depth += 1
+		elif char == ")":
+			depth -= 1
+		elif char == "," and depth == 0:
+			parts.append(raw[start:index])
+			start = index + 1
+	parts.append(raw[start:])
+	return [part for part in parts if part]
+
+
+def _condition(row: Dict[str, Any], part: str) -> bool:
+	if part.startswith("and("):
+		return all(_condition(row, p) for p in _split_top(part[4:-1]))
+	if part.startswith("or("):
+		return any(_condition(row, p) for p in _split_top(part[3:-1]))
+	column, op, arg = part.split(".", 2)
+	return _compare(row.get(column), op, arg)
+
+
+class FakePostgrest:
+	# enough of PostgREST for this API: eq/neq/gt/gte/lt/lte/in/ilike/is filters, repeated filters,
+	# or=(...) with nested and(...) groups, order, limit (capped at max_rows like db-max-rows),
+	# select projection, merge-duplicates upserts, deletes and the RPC functions from SCHEMA_SQL
+	def __init__(self, max_rows: int = 1000) -> None:
+		self.max_rows = max_rows
+		self.tables: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+		self.ids = 0
+		self.requests: Dict[str, int] = {}
+		self.rows_written = 0
+
+	def _filters(self, params: List[Tuple[str, str]]) -> List[Tuple[str, str, str]]:
+		out = []
+		for key, value in params:
+			if key in ("select", "order", "limit", "offset", "on_conflict"):
+				continue
+			if key == "or":
+				out.append(("or", "", value))
+				continue
+			op, _, arg = value.partition(".")
+			out.append((key, op, arg))
+		return out
+
+	def _matches(self, row: Dict[str, Any], filters: List[Tuple[str, str, str]]) -> bool:
+		for column, op, arg in filters:
+			if column == "or":
+				if not _condition(row, "or" + arg.strip()):
+					return False
+			elif not _compare(row.get(column), op, arg):
+				return False
+		return True
+
+	def select(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+		query = dict(params)
+		filters = self._filters(params)
+		rows = [row for row in self.tables.get(table, {}).values() if self._matches(row, filters)]
+		for part in reversed((query.get("order") or "").split(",")):
+			if not part:
+				continue
+			column, _, direction = part.partition(".")
+			rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+		offset = int(query.get("offset") or 0)
+		limit = min(int(query["limit"]), self.max_rows) if "limit" in query else self.max_rows
+		rows = rows[offset:offset + limit]
+		columns = query.get("select")
+		if columns and columns != "*":
+			names = columns.split(",")
+			rows = [{c: r.get(c) for c in names} for r in rows]
+		return rows
+
+	def write(self, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str]) -> None:
+		store = self.tables.setdefault(table, {})
+		keys = on_conflict.split(",") if on_conflict else None
+		for row in rows:
+			if keys:
+				key = tuple(row.get(k) for k in keys)
+				if key not in store:
+					# serial ids are assigned on insert and kept by later merges
+					self.ids += 1
+					store[key] = {"id": self.ids}
+				store[key] = {**store[key], **row}
+			else:
+				self.ids += 1
+				store[self.ids] = {"id": self.ids, **row}
+		self.rows_written += len(rows)
+
+	def delete(self, table: str, params: List[Tuple[str, str]]) -> None:
+		filters = self._filters(params)
+		store = self.tables.get(table, {})
+		for key in [k for k, row in store.items() if self._matches(row, filters)]:
+			del store[key]
+
+	def acquire_etl_lease(self, p_name: str, p_owner: str, p_ttl_sec: float) -> bool:
+		leases = self.tables.setdefault("etl_leases", {})
+		now = time.time()
+		current = leases.get(p_name)
+		if current is not None and current["owner"] != p_owner and current["expires"] >= now:
+			return False
+		leases[p_name] = {"name": p_name, "owner": p_owner, "expires": now + p_ttl_sec}
+		return True
+
+	def release_etl_lease(self, p_name: str, p_owner: str) -> None:
+		leases = self.tables.setdefault("etl_leases", {})
+		if leases.get(p_name, {}).get("owner") == p_owner:
+			del leases[p_name]
+
+	def increment_api_key_usage(self, p_counts: Dict[str, int]) -> None:
+		for row in self.tables.get("api_keys", {}).values():
+			if str(row.get("id")) in p_counts:
+				row["usage_count"] = (row.get("usage_count") or 0) + p_counts[str(row["id"])]
+
+	def refresh_transfer_rollups(self, p_network: str, p_from: str, p_to: str) -> None:
+		# Python twin of the SQL function in SCHEMA_SQL: the range's minute buckets from the raw rows,
+		# the covering hours from minutes, the covering days from hours
+		def utc(value: str) -> datetime:
+			ts = datetime.fromisoformat(value)
+			return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+		minute_lo = utc(p_from).replace(second=0, microsecond=0)
+		minute_hi = utc(p_to).replace(second=0, microsecond=0) + timedelta(minutes=1)
+		hour_lo = utc(p_from).replace(minute=0, second=0, microsecond=0)
+		hour_hi = utc(p_to).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+		day_lo = hour_lo.replace(hour=0)
+		day_hi = utc(p_to).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+		store = self.tables.setdefault("transfer_rollups", {})
+		sums = ("transfer_count", "volume", "whale_count", "gas_used_sum", "gas_fee_sum")
+
+		def rebuild(resolution: str, lo: datetime, hi: datetime, sources: List[Tuple[datetime, str, Dict[str, float]]], width: str) -> None:
+			for key in [k for k, row in store.items() if row["resolution"] == resolution and row["network"] == p_network and lo <= utc(row["bucket"]) < hi]:
+				del store[key]
+			for at, token, values in sources:
+				bucket = at.replace(second=0, microsecond=0)
+				if width in ("hour", "day"):
+					bucket = bucket.replace(minute=0)
+				if width == "day":
+					bucket = bucket.replace(hour=0)
+				key = (resolution, p_network, token, bucket.isoformat())
+				row = store.setdefault(key, {"resolution": resolution, "bucket": bucket.isoformat(), "network": p_network, "token": token, **{c: 0 for c in sums}})
+				for column in sums:
+					row[column] += values.get(column, 0)
+				row["updated_at"] = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+		def raw(table: str) -> List[Tuple[datetime, Dict[str, Any]]]:
+			rows = [(utc(row["block_timestamp"]), row) for row in self.tables.get(table, {}).values() if row.get("network") == p_network]
+			return [(at, row) for at, row in rows if minute_lo <= at < minute_hi]
+
+		minutes = [(at, row["token"], {
+			"transfer_count": 1,
+			"volume": float(row.get("amount") or 0),
+			"gas_used_sum": float(row.get("gas_used") or 0),
+			"gas_fee_sum": float(row.get("gas_fee") or 0),
+		}) for at, row in raw("stablecoin_transfers")]
+		minutes += [(at, row["token"], {"whale_count": 1}) for at, row in raw("whale_transfers")]
+		rebuild("minute", minute_lo, minute_hi, minutes, "minute")
+
+		def tier(resolution: str, lo: datetime, hi: datetime) -> List[Tuple[datetime, str, Dict[str, float]]]:
+			return [
+				(utc(row["bucket"]), row["token"], row)
+				for row in store.values()
+				if row["resolution"] == resolution and row["network"] == p_network and lo <= utc(row["bucket"]) < hi
+			]
+
+		rebuild("hour", hour_lo, hour_hi, tier("minute", hour_lo, hour_hi), "hour")
+		rebuild("day", day_lo, day_hi, tier("hour", day_lo, day_hi), "day")
+
+
+def rest_app(db: FakePostgrest) -> FastAPI:
+	app = FastAPI()
+
+	def count(method: str, table: str) -> None:
+		db.requests[f"{method} {table}"] = db.requests.get(f"{method} {table}", 0) + 1
+
+	@app.get("/rest/v1/{table}")
+	async def get(table: str, request: Request) -> Response:
+		count("GET", table)
+		return Response(orjson.dumps(db.select(table, list(request.query_params.multi_items()))), media_type="application/json")
+
+	@app.post("/rest/v1/rpc/{function}")
+	async def rpc(function: str, request: Request) -> Response:
+		count("POST", f"rpc/{function}")
+		if function not in ("acquire_etl_lease", "release_etl_lease", "increment_api_key_usage", "refresh_transfer_rollups"):
+			return Response(status_code=404)
+		result = getattr(db, function)(**orjson.loads(await request.body()))
+		if result is None:
+			return Response(status_code=204)
+		return Response(orjson.dumps(result), media_type="application/json")
+
+	@app.post("/rest/v1/{table}")
+	async def post(table: str, request: Request) -> Response:
+		count("POST", table)
+		rows = orjson.loads(await request.body())
+		db.write(table, rows if isinstance(rows, list) else [rows], request.query_params.get("on_conflict"))
+		return Response(status_code=201)
+
+	@app.delete("/rest/v1/{table}")
+	async def delete(table: str, request: Request) -> Response:
+		count("DELETE", table)
+		db.delete(table, list(request.query_params.multi_items()))
+		return Response(status_code=204)
+
+	@app.get("/_stats")
+	async def stats() -> Dict[str, Any]:
+		return {
+			"requests": db.requests,
+			"rows_written": db.rows_written,
+			"rows": {table: len(rows) for table, rows in db.tables.items()},
+		}
+
+	return app
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Fake JSON-RPC node / PostgREST server for benchmarks")
+	parser.add_argument("role", choices=("node", "rest"))
+	parser.add_argument("--port", type=int, required=True)
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--head", type=int, default=20_000_000)
+	parser.add_argument("--transfers-per-block", type=int, default=50)
+	parser.add_argument("--logs-per-tx", type=int, default=2)
+	parser.add_argument("--wallets", type=int, default=5_000)
+	parser.add_argument("--block-time", type=int, default=12)
+	parser.add_argument("--delay-ms", type=float, default=0, help="added latency per JSON-RPC request (node only)")
+	args = parser.parse_args()
+
+	if args.role == "node":
+		app = node_app(FakeChain(args.seed, args.head, args.transfers_per_block, args.logs_per_tx, args.wallets, args.block_time), args.delay_ms / 1000)
+	else:
+		db = FakePostgrest()
+		# the benchmark authenticates with the key "bench"
+		db.write("api_keys", [{"api_key": "bench", "usage_count": 0}], None)
+		app = rest_app(db)
+	uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+	main()